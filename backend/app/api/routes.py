@@ -2,27 +2,34 @@
 
 from __future__ import annotations
 
+import asyncio
 import base64
 import io
+import json
 import os
 import uuid
+from contextlib import aclosing
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Optional
+from typing import Any, AsyncIterator, Awaitable, Optional, TypeVar
 
-from fastapi import APIRouter, Depends, File, Header, HTTPException, UploadFile
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, File, Header, HTTPException, Query, Request, UploadFile
+from fastapi.responses import FileResponse, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from PIL import Image
 
 from ..config import settings
 from ..db.dependencies import get_db_session
 from ..db.models import OcrTask, TaskStatus, TaskType
+from ..db.session import get_session_factory
 from ..models.schemas import (
     BoundingBox,
     HealthResponse,
     ImageDimensions,
     ImageOCRResponse,
+    InternalInferBatchItem,
+    InternalInferBatchRequest,
+    InternalInferBatchResponse,
     InternalInferRequest,
     InternalInferResponse,
     PdfPageResult,
@@ -32,16 +39,27 @@ from ..models.schemas import (
     TaskStatusResponse,
     TaskTiming,
 )
+from ..services.admission import AdmissionController, AdmissionRejected, Priority
 from ..services.grounding_parser import GroundingParser
+from ..services.metrics import metrics
+from ..services.preprocess_pool import EventLoopLagMonitor
 from ..services.prompt_builder import PromptBuilder
+from ..services.repetition_detector import RepetitionDetectorConfig
+from ..services.result_cache import OcrResultCache
 from ..services.storage import StorageManager
-from ..services.vllm_direct_engine import VLLMDirectEngine
+from ..services.vllm_direct_engine import InferenceItem, InferenceResult, VLLMDirectEngine
 from ..tasks.pdf import process_pdf_task
 from ..utils.image_utils import ImageUtils
+from ..vllm_models.config import OCR_MODES, OcrMode
 
 
+T = TypeVar("T")
+
+_NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
 router = APIRouter()
 _inference_service: Optional[VLLMDirectEngine] = None
+_loop_lag_monitor: Optional[EventLoopLagMonitor] = None
 _storage = StorageManager()
 
 
@@ -72,9 +90,20 @@ async def health() -> HealthResponse:
     )
 
 
+@router.get("/metrics")
+async def get_metrics() -> dict[str, Any]:
+    snapshot = metrics.snapshot()
+    snapshot["inflight_requests"] = (
+        _inference_service.inflight_count if _inference_service is not None else 0
+    )
+    return snapshot
+
+
 @router.post("/api/ocr/image", response_model=ImageOCRResponse)
 async def ocr_image(
+    request: Request,
     image: UploadFile = File(..., description="待识别图像"),
+    bypass_cache: bool = Query(default=False, description="跳过结果缓存"),
     session: AsyncSession = Depends(get_db_session),
     inference_service: VLLMDirectEngine = Depends(get_inference_service),
 ) -> ImageOCRResponse:
@@ -99,46 +128,48 @@ async def ocr_image(
         await session.commit()
         await session.refresh(task)
 
-        raw_text = await inference_service.infer(
-            prompt=prompt,
-            image_path=tmp_img,
-            base_size=settings.base_size,
-            image_size=settings.image_size,
-            crop_mode=settings.crop_mode,
-        )
-
-        orig_w, orig_h = ImageUtils.get_image_dimensions(tmp_img)
-
-        boxes: list[dict[str, Any]] = []
-        if GroundingParser.has_grounding_tags(raw_text) and orig_w and orig_h:
-            boxes = GroundingParser.parse_detections(raw_text, orig_w, orig_h)
-
-        cleaned_text = GroundingParser.clean_grounding_text(raw_text) or raw_text
+        try:
+            result = await _run_until_disconnected(
+                request,
+                inference_service.infer_result(
+                    prompt=prompt,
+                    image_path=tmp_img,
+                    base_size=settings.base_size,
+                    image_size=settings.image_size,
+                    crop_mode=settings.crop_mode,
+                    timeout=_inference_timeout(),
+                    use_cache=not bypass_cache,
+                ),
+            )
+        except asyncio.TimeoutError as exc:
+            raise HTTPException(status_code=504, detail="Inference timed out") from exc
 
-        payload: dict[str, Any] = {
-            "text": cleaned_text,
-            "raw_text": raw_text,
-            "boxes": boxes,
-        }
-        if orig_w and orig_h:
-            payload["image_dims"] = {"w": orig_w, "h": orig_h}
+        payload = _build_image_payload(result.text, tmp_img)
+        if result.truncated_reason:
+            payload["truncated_reason"] = result.truncated_reason
 
         task.mark_succeeded(payload, output_dir=None)
         await session.commit()
         await session.refresh(task)
 
-        timing = _build_task_timing(task)
-
-        return ImageOCRResponse(
-            success=True,
-            text=cleaned_text,
-            raw_text=raw_text,
-            boxes=[BoundingBox(**box) for box in boxes],
-            image_dims=ImageDimensions(w=orig_w, h=orig_h) if orig_w and orig_h else None,
-            task_id=task.id,
-            timing=timing,
-            duration_ms=task.duration_ms,
-        )
+        return _build_image_response(task, payload)
+
+    except AdmissionRejected as exc:
+        if task is not None:
+            await session.rollback()
+            task.mark_failed(f"{type(exc).__name__}: {exc}")
+            session.add(task)
+            await session.commit()
+        raise _admission_http_error(exc) from exc
+
+    except HTTPException as exc:
+        # 超时（504）与客户端断开（499）保持原状态码，任务记录真实原因
+        if task is not None:
+            await session.rollback()
+            task.mark_failed(str(exc.detail))
+            session.add(task)
+            await session.commit()
+        raise
 
     except Exception as exc:
         if task is not None:
@@ -150,42 +181,128 @@ async def ocr_image(
         raise HTTPException(status_code=500, detail=error_detail) from exc
 
     finally:
-        if tmp_img and os.path.exists(tmp_img):
-            try:
-                os.remove(tmp_img)
-            except OSError:
-                pass
+        _remove_file(tmp_img)
+
+
+@router.post("/api/ocr/image/stream")
+async def ocr_image_stream(
+    image: UploadFile = File(..., description="待识别图像"),
+    bypass_cache: bool = Query(default=False, description="跳过结果缓存"),
+    inference_service: VLLMDirectEngine = Depends(get_inference_service),
+) -> StreamingResponse:
+    """流式识别单张图片，以 NDJSON 逐行返回 delta 事件，最后返回 result 或 error 事件"""
+    tmp_img = await ImageUtils.save_upload_file(image)
+    infer_kwargs: dict[str, Any] = dict(
+        prompt=PromptBuilder.image_prompt(),
+        image_path=tmp_img,
+        base_size=settings.base_size,
+        image_size=settings.image_size,
+        crop_mode=settings.crop_mode,
+        use_cache=not bypass_cache,
+    )
+    session_factory = get_session_factory()
+
+    task_id = uuid.uuid4()
+    try:
+        # 响应开始后无法再改状态码，先做准入预检
+        await inference_service.check_admission(**infer_kwargs)
+        async with session_factory() as session:
+            task = OcrTask(
+                id=task_id,
+                task_type=TaskType.IMAGE,
+                input_path=tmp_img,
+                queued_at=datetime.now(timezone.utc),
+            )
+            session.add(task)
+            task.mark_running()
+            await session.commit()
+    except AdmissionRejected as exc:
+        _remove_file(tmp_img)
+        raise _admission_http_error(exc) from exc
+    except Exception:
+        _remove_file(tmp_img)
+        raise
+
+    async def _events() -> AsyncIterator[str]:
+        outcome = InferenceResult()
+        try:
+            stream = inference_service.infer_stream(**infer_kwargs, timeout=_inference_timeout(), result=outcome)
+            async with aclosing(stream):
+                async for delta in stream:
+                    yield _ndjson_event("delta", text=delta)
+
+            payload = _build_image_payload(outcome.text, tmp_img)
+            if outcome.truncated_reason:
+                payload["truncated_reason"] = outcome.truncated_reason
+            async with session_factory() as session:
+                task = await session.get(OcrTask, task_id)
+                if task is None:
+                    raise RuntimeError("任务不存在")
+                task.mark_succeeded(payload, output_dir=None)
+                await session.commit()
+                response = _build_image_response(task, payload)
+            yield _ndjson_event("result", **response.model_dump(mode="json"))
+
+        except asyncio.CancelledError:
+            await asyncio.shield(_mark_task_failed(task_id, "Client disconnected"))
+            raise
+        except asyncio.TimeoutError:
+            await _mark_task_failed(task_id, "Inference timed out")
+            yield _ndjson_event("error", error="Inference timed out")
+        except Exception as exc:
+            error_detail = f"{type(exc).__name__}: {exc}"
+            await _mark_task_failed(task_id, error_detail)
+            yield _ndjson_event("error", error=error_detail)
+        finally:
+            _remove_file(tmp_img)
+
+    return StreamingResponse(
+        _events(),
+        media_type=_NDJSON_MEDIA_TYPE,
+        headers={"X-Task-Id": str(task_id)},
+    )
 
 
 @router.post("/internal/infer", response_model=InternalInferResponse)
 async def internal_infer(
+    request: Request,
     payload: InternalInferRequest,
     token: str | None = Header(default=None, alias="X-Internal-Token"),
     inference_service: VLLMDirectEngine = Depends(get_inference_service),
 ) -> InternalInferResponse:
-    expected_token = settings.internal_api_token
-    if expected_token and token != expected_token:
-        raise HTTPException(status_code=403, detail="Forbidden")
+    _check_internal_token(token)
 
     image_data: Image.Image | None = None
+    image_digest: str | None = None
 
     try:
         if payload.image_base64:
             try:
-                image_bytes = base64.b64decode(payload.image_base64)
-                image_data = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+                image_data, image_digest = await _decode_image_off_loop(
+                    inference_service, payload.image_base64, _resolve_ocr_mode(payload)
+                )
             except Exception as exc:
                 raise HTTPException(status_code=400, detail=f"Invalid image payload: {exc}") from exc
 
-        raw_text = await inference_service.infer(
-            prompt=payload.prompt,
-            image_data=image_data,
-            base_size=payload.base_size or settings.base_size,
-            image_size=payload.image_size or settings.image_size,
-            crop_mode=settings.crop_mode if payload.crop_mode is None else payload.crop_mode,
-        )
+        try:
+            result = await _run_until_disconnected(
+                request,
+                inference_service.infer_result(
+                    prompt=payload.prompt,
+                    image_data=image_data,
+                    **_resolve_ocr_mode(payload)._asdict(),
+                    timeout=_inference_timeout(),
+                    image_digest=image_digest,
+                    use_cache=not payload.bypass_cache,
+                    priority=Priority[payload.priority.upper()],
+                ),
+            )
+        except asyncio.TimeoutError as exc:
+            raise HTTPException(status_code=504, detail="Inference timed out") from exc
+        except AdmissionRejected as exc:
+            raise _admission_http_error(exc) from exc
 
-        return InternalInferResponse(text=raw_text)
+        return InternalInferResponse(text=result.text, truncated_reason=result.truncated_reason)
 
     finally:
         if image_data is not None:
@@ -195,6 +312,148 @@ async def internal_infer(
                 pass
 
 
+@router.post("/internal/infer/stream")
+async def internal_infer_stream(
+    payload: InternalInferRequest,
+    token: str | None = Header(default=None, alias="X-Internal-Token"),
+    inference_service: VLLMDirectEngine = Depends(get_inference_service),
+) -> StreamingResponse:
+    """流式推理，以 NDJSON 逐行返回 delta 事件，最后返回 result 或 error 事件"""
+    _check_internal_token(token)
+
+    image_data: Image.Image | None = None
+    image_digest: str | None = None
+    if payload.image_base64:
+        try:
+            image_data, image_digest = await _decode_image_off_loop(
+                inference_service, payload.image_base64, _resolve_ocr_mode(payload)
+            )
+        except Exception as exc:
+            raise HTTPException(status_code=400, detail=f"Invalid image payload: {exc}") from exc
+
+    infer_kwargs: dict[str, Any] = dict(
+        prompt=payload.prompt,
+        image_data=image_data,
+        **_resolve_ocr_mode(payload)._asdict(),
+        image_digest=image_digest,
+        use_cache=not payload.bypass_cache,
+        priority=Priority[payload.priority.upper()],
+    )
+    try:
+        # 响应开始后无法再改状态码，先做准入预检
+        await inference_service.check_admission(**infer_kwargs)
+    except AdmissionRejected as exc:
+        if image_data is not None:
+            image_data.close()
+        raise _admission_http_error(exc) from exc
+
+    async def _events() -> AsyncIterator[str]:
+        outcome = InferenceResult()
+        try:
+            stream = inference_service.infer_stream(**infer_kwargs, timeout=_inference_timeout(), result=outcome)
+            async with aclosing(stream):
+                async for delta in stream:
+                    yield _ndjson_event("delta", text=delta)
+            yield _ndjson_event("result", text=outcome.text, truncated_reason=outcome.truncated_reason)
+        except asyncio.TimeoutError:
+            yield _ndjson_event("error", error="Inference timed out")
+        except Exception as exc:
+            yield _ndjson_event("error", error=f"{type(exc).__name__}: {exc}")
+        finally:
+            if image_data is not None:
+                try:
+                    image_data.close()
+                except Exception:
+                    pass
+
+    return StreamingResponse(_events(), media_type=_NDJSON_MEDIA_TYPE)
+
+
+@router.post("/internal/infer/batch", response_model=InternalInferBatchResponse)
+async def internal_infer_batch(
+    request: Request,
+    payload: InternalInferBatchRequest,
+    token: str | None = Header(default=None, alias="X-Internal-Token"),
+    inference_service: VLLMDirectEngine = Depends(get_inference_service),
+) -> InternalInferBatchResponse:
+    _check_internal_token(token)
+    # 解码前先按条目数预检准入：过载时直接返回 429/503/413，不为注定被拒绝的批次解码图像
+    try:
+        inference_service.check_batch_admission(len(payload.items))
+    except AdmissionRejected as exc:
+        raise _admission_http_error(exc) from exc
+
+    modes = [_resolve_ocr_mode(item) for item in payload.items]
+    decode_indexes = [index for index, item in enumerate(payload.items) if item.image_base64]
+    decoded: dict[int, Any] = {}
+    try:
+        # 各条目在预处理池中并发解码（在途像素字节由池限制），单条解码失败只影响该条目
+        decoded = dict(zip(decode_indexes, await asyncio.gather(
+            *(
+                _decode_image_off_loop(inference_service, payload.items[index].image_base64, modes[index])
+                for index in decode_indexes
+            ),
+            return_exceptions=True,
+        )))
+        items: list[InferenceItem | None] = []
+        decode_errors: dict[int, str] = {}
+        for index, item in enumerate(payload.items):
+            image_data: Image.Image | None = None
+            image_digest: str | None = None
+            outcome = decoded.get(index)
+            if isinstance(outcome, BaseException):
+                decode_errors[index] = f"Invalid image payload: {outcome}"
+                items.append(None)
+                continue
+            if outcome is not None:
+                image_data, image_digest = outcome
+            items.append(
+                InferenceItem(
+                    prompt=item.prompt,
+                    image_data=image_data,
+                    **modes[index]._asdict(),
+                    image_digest=image_digest,
+                    use_cache=not item.bypass_cache,
+                    priority=Priority[item.priority.upper()],
+                )
+            )
+
+        valid_items = [item for item in items if item is not None]
+        try:
+            outcomes = iter(
+                await _run_until_disconnected(
+                    request,
+                    inference_service.infer_many(valid_items, timeout=_inference_timeout()),
+                )
+            )
+        except AdmissionRejected as exc:
+            raise _admission_http_error(exc) from exc
+
+        results: list[InternalInferBatchItem] = []
+        for index, item in enumerate(items):
+            if item is None:
+                results.append(InternalInferBatchItem(error=decode_errors[index]))
+                continue
+            outcome = next(outcomes)
+            results.append(
+                InternalInferBatchItem(
+                    text=outcome.text,
+                    error=outcome.error,
+                    truncated_reason=outcome.truncated_reason,
+                )
+            )
+
+        return InternalInferBatchResponse(results=results)
+
+    finally:
+        for outcome in decoded.values():
+            if isinstance(outcome, tuple):
+                try:
+                    outcome[0].close()
+                except Exception:
+                    pass
+
+
 @router.post("/api/ocr/pdf", response_model=TaskCreateResponse, status_code=202)
 async def enqueue_pdf_ocr(
     pdf: UploadFile = File(..., description="PDF 文件"),
@@ -280,6 +539,134 @@ async def download_task_file(
     return FileResponse(target, filename=target.name)
 
 
+def _build_image_payload(raw_text: str, image_path: str) -> dict[str, Any]:
+    orig_w, orig_h = ImageUtils.get_image_dimensions(image_path)
+
+    boxes: list[dict[str, Any]] = []
+    if GroundingParser.has_grounding_tags(raw_text) and orig_w and orig_h:
+        boxes = GroundingParser.parse_detections(raw_text, orig_w, orig_h)
+
+    cleaned_text = GroundingParser.clean_grounding_text(raw_text) or raw_text
+
+    payload: dict[str, Any] = {
+        "text": cleaned_text,
+        "raw_text": raw_text,
+        "boxes": boxes,
+    }
+    if orig_w and orig_h:
+        payload["image_dims"] = {"w": orig_w, "h": orig_h}
+    return payload
+
+
+def _build_image_response(task: OcrTask, payload: dict[str, Any]) -> ImageOCRResponse:
+    dims = payload.get("image_dims")
+    return ImageOCRResponse(
+        success=True,
+        text=payload["text"],
+        raw_text=payload["raw_text"],
+        boxes=[BoundingBox(**box) for box in payload["boxes"]],
+        image_dims=ImageDimensions(**dims) if dims else None,
+        truncated_reason=payload.get("truncated_reason"),
+        task_id=task.id,
+        timing=_build_task_timing(task),
+        duration_ms=task.duration_ms,
+    )
+
+
+async def _mark_task_failed(task_id: uuid.UUID, message: str) -> None:
+    try:
+        async with get_session_factory()() as session:
+            task = await session.get(OcrTask, task_id)
+            if task is None:
+                return
+            task.mark_failed(message)
+            await session.commit()
+    except Exception as exc:
+        print(f"⚠️ Failed to mark task {task_id} as failed: {exc}")
+
+
+def _ndjson_event(event_type: str, **fields: Any) -> str:
+    return json.dumps({"type": event_type, **fields}, ensure_ascii=False) + "\n"
+
+
+def _remove_file(path: str | None) -> None:
+    if path and os.path.exists(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _check_internal_token(token: str | None) -> None:
+    expected_token = settings.internal_api_token
+    if expected_token and token != expected_token:
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+
+def _resolve_ocr_mode(payload: InternalInferRequest) -> OcrMode:
+    """命名模式优先，其次为显式尺寸参数，最后回退到全局配置"""
+    if payload.mode:
+        preset = OCR_MODES[payload.mode]
+        if payload.crop_mode is None:
+            return preset
+        return preset._replace(crop_mode=payload.crop_mode)
+    return OcrMode(
+        base_size=payload.base_size or settings.base_size,
+        image_size=payload.image_size or settings.image_size,
+        crop_mode=settings.crop_mode if payload.crop_mode is None else payload.crop_mode,
+    )
+
+
+def _admission_http_error(exc: AdmissionRejected) -> HTTPException:
+    return HTTPException(
+        status_code=exc.status_code,
+        detail=str(exc),
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+def _inference_timeout() -> float | None:
+    return float(settings.inference_timeout_seconds) if settings.inference_timeout_seconds > 0 else None
+
+
+async def _run_until_disconnected(request: Request, awaitable: Awaitable[T]) -> T:
+    """执行推理并轮询客户端连接状态；客户端断开时取消任务，由引擎中止在途生成"""
+    task = asyncio.ensure_future(awaitable)
+    poll_interval = max(settings.disconnect_poll_interval_ms, 10) / 1000
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_interval)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                raise HTTPException(status_code=499, detail="Client disconnected")
+    finally:
+        if not task.done():
+            task.cancel()
+            try:
+                await task
+            except BaseException:
+                pass
+
+
+async def _decode_image_off_loop(
+    inference_service: VLLMDirectEngine, image_base64: str, mode: OcrMode
+) -> tuple[Image.Image, str]:
+    """在预处理池中按 OCR 模式（直接提交 RGB 图像时为引擎处理器的模式）解码图像，避免大图阻塞事件循环"""
+    image, digest, peak_bytes = await inference_service.run_preprocess(
+        _decode_base64_image, image_base64, inference_service.decode_mode(mode), nbytes=len(image_base64)
+    )
+    inference_service.record_decode(peak_bytes)
+    return image, digest
+
+
+def _decode_base64_image(image_base64: str, mode: OcrMode | None) -> tuple[Image.Image, str, int]:
+    """解码图像并返回 (图像, 原始字节内容哈希, 解码峰值像素字节数)；mode 为 None 时不降采样"""
+    image_bytes = base64.b64decode(image_base64)
+    image, peak_bytes = VLLMDirectEngine.decode_image(io.BytesIO(image_bytes), mode)
+    return image, OcrResultCache.digest_bytes(image_bytes), peak_bytes
+
+
 def _task_path(task_id: uuid.UUID, relative: Optional[str]) -> Optional[str]:
     if not relative:
         return None
@@ -376,10 +763,44 @@ def _build_task_progress(progress_payload: Any) -> Optional[TaskProgress]:
     )
 
 
-async def initialize_service() -> None:
-    global _inference_service
+def _build_result_cache() -> OcrResultCache | None:
+    if not settings.result_cache_enabled:
+        return None
+    disk_dir = _storage.root / "cache" / "ocr_results" if settings.result_cache_disk_enabled else None
+    return OcrResultCache(
+        max_entries=settings.result_cache_max_entries,
+        disk_dir=disk_dir,
+        disk_max_bytes=settings.result_cache_disk_max_mb * 1024 * 1024,
+    )
+
 
-    _inference_service = VLLMDirectEngine()
+def _build_repetition_config() -> RepetitionDetectorConfig | None:
+    if not settings.repetition_detection_enabled:
+        return None
+    return RepetitionDetectorConfig(
+        min_loop_chars=settings.repetition_min_loop_chars,
+        min_repeats=settings.repetition_min_repeats,
+        max_period=settings.repetition_max_period,
+        max_line_repeats=settings.repetition_max_line_repeats,
+        markup_min_loop_chars=settings.repetition_markup_min_loop_chars,
+        markup_max_line_repeats=settings.repetition_markup_max_line_repeats,
+    )
+
+
+async def initialize_service() -> None:
+    global _inference_service, _loop_lag_monitor
+
+    _inference_service = VLLMDirectEngine(
+        result_cache=_build_result_cache(),
+        admission=AdmissionController(
+            max_concurrency=settings.admission_max_concurrency,
+            max_queue_depth=settings.admission_max_queue_depth,
+            max_token_backlog=settings.admission_max_token_backlog,
+            output_token_estimate=settings.admission_output_token_estimate,
+            retry_after_seconds=settings.admission_retry_after_seconds,
+        ),
+        repetition=_build_repetition_config(),
+    )
     await _inference_service.load(
         model_path=settings.model_path,
         tensor_parallel_size=settings.tensor_parallel_size,
@@ -387,11 +808,28 @@ async def initialize_service() -> None:
         max_model_len=settings.max_model_len,
         enforce_eager=settings.enforce_eager,
         use_v1_engine=settings.vllm_use_v1,
+        scheduling_policy=settings.scheduling_policy,
+        preprocess_pool_kind=settings.preprocess_pool_kind,
+        preprocess_max_workers=settings.preprocess_max_workers,
+        preprocess_max_inflight_bytes=settings.preprocess_max_inflight_mb * 1024 * 1024,
+        pixel_transport_uint8=settings.pixel_transport_uint8,
+        vision_compile_mode=settings.vision_compile_mode,
+        vision_embed_cache_mb=settings.vision_embed_cache_mb,
+        vision_stage_enabled=settings.vision_stage_enabled,
+        vision_stage_device=settings.vision_stage_device,
+        vision_stage_max_batch=settings.vision_stage_max_batch,
+        vision_stage_max_wait_ms=settings.vision_stage_max_wait_ms,
     )
+    if settings.event_loop_lag_interval_ms > 0:
+        _loop_lag_monitor = EventLoopLagMonitor(settings.event_loop_lag_interval_ms)
+        _loop_lag_monitor.start()
 
 
 async def shutdown_service() -> None:
-    global _inference_service
+    global _inference_service, _loop_lag_monitor
+    if _loop_lag_monitor:
+        await _loop_lag_monitor.stop()
+        _loop_lag_monitor = None
     if _inference_service:
         await _inference_service.unload()
         _inference_service = None
@@ -2,6 +2,8 @@
 配置管理模块 - vLLM Direct 专用
 使用 Pydantic Settings 管理所有配置项
 """
+from typing import Literal
+
 from pydantic_settings import BaseSettings
 from pydantic import Field
 
@@ -119,6 +121,159 @@ class Settings(BaseSettings):
         description="PDF 渲染并发数（0 表示按 CPU 自动选择）"
     )
 
+    inference_timeout_seconds: int = Field(
+        default=0,
+        alias="INFERENCE_TIMEOUT_SECONDS",
+        description="单次推理生成超时时间，超时后中止请求（0 表示不限制）"
+    )
+    disconnect_poll_interval_ms: int = Field(
+        default=500,
+        alias="DISCONNECT_POLL_INTERVAL_MS",
+        description="推理期间检测客户端断连的轮询间隔（毫秒）"
+    )
+
+    result_cache_enabled: bool = Field(
+        default=True,
+        alias="RESULT_CACHE_ENABLED",
+        description="启用 OCR 结果缓存（按图像内容 + 提示词 + 模式寻址）"
+    )
+    result_cache_max_entries: int = Field(
+        default=1024,
+        alias="RESULT_CACHE_MAX_ENTRIES",
+        description="结果缓存内存 LRU 条目上限"
+    )
+    result_cache_disk_enabled: bool = Field(
+        default=False,
+        alias="RESULT_CACHE_DISK_ENABLED",
+        description="启用磁盘缓存层（位于 STORAGE_DIR/cache/ocr_results）"
+    )
+    result_cache_disk_max_mb: int = Field(
+        default=512,
+        alias="RESULT_CACHE_DISK_MAX_MB",
+        description="磁盘缓存层容量上限（MB），超出后按最近访问淘汰"
+    )
+
+    admission_max_concurrency: int = Field(
+        default=64,
+        alias="ADMISSION_MAX_CONCURRENCY",
+        description="同时提交给推理引擎的请求上限"
+    )
+    admission_max_queue_depth: int = Field(
+        default=256,
+        alias="ADMISSION_MAX_QUEUE_DEPTH",
+        description="等待执行的请求上限，超出返回 429（0 表示不限制）"
+    )
+    admission_max_token_backlog: int = Field(
+        default=0,
+        alias="ADMISSION_MAX_TOKEN_BACKLOG",
+        description="排队与执行中请求的预估 token 总量上限，超出返回 503（0 表示不限制）"
+    )
+    admission_output_token_estimate: int = Field(
+        default=1024,
+        alias="ADMISSION_OUTPUT_TOKEN_ESTIMATE",
+        description="估算 token 积压时单个请求的预估输出 token 数"
+    )
+    admission_retry_after_seconds: int = Field(
+        default=2,
+        alias="ADMISSION_RETRY_AFTER_SECONDS",
+        description="拒绝请求时 Retry-After 响应头的秒数"
+    )
+    repetition_detection_enabled: bool = Field(
+        default=False,
+        alias="REPETITION_DETECTION_ENABLED",
+        description="流式检测重复循环输出，命中时中止生成并截断结果"
+    )
+    repetition_min_loop_chars: int = Field(
+        default=2048,
+        alias="REPETITION_MIN_LOOP_CHARS",
+        description="判定为循环所需的最少重复字符数"
+    )
+    repetition_min_repeats: int = Field(
+        default=8,
+        alias="REPETITION_MIN_REPEATS",
+        description="判定为循环所需的最少重复次数"
+    )
+    repetition_max_period: int = Field(
+        default=256,
+        alias="REPETITION_MAX_PERIOD",
+        description="检测的重复片段最大长度（字符）"
+    )
+    repetition_max_line_repeats: int = Field(
+        default=32,
+        alias="REPETITION_MAX_LINE_REPEATS",
+        description="同一非空行允许连续出现的最大次数"
+    )
+    repetition_markup_min_loop_chars: int = Field(
+        default=32768,
+        alias="REPETITION_MARKUP_MIN_LOOP_CHARS",
+        description="只由表格骨架（空行 / 空单元格）组成的重复判定为循环所需的最少字符数"
+    )
+    repetition_markup_max_line_repeats: int = Field(
+        default=512,
+        alias="REPETITION_MARKUP_MAX_LINE_REPEATS",
+        description="只由表格骨架组成的行允许连续出现的最大次数"
+    )
+    pixel_transport_uint8: bool = Field(
+        default=False,
+        alias="PIXEL_TRANSPORT_UINT8",
+        description="以 uint8 传输 pixel_values / images_crop，在模型侧归一化（主机内存与 IPC 减少为 1/4）"
+    )
+    vision_compile_mode: Literal["off", "default", "reduce-overhead"] = Field(
+        default="off",
+        alias="VISION_COMPILE_MODE",
+        description="视觉编码器 torch.compile 模式（off / default / reduce-overhead），加载时按固定视图尺寸预热，失败回退 eager"
+    )
+    vision_embed_cache_mb: int = Field(
+        default=0,
+        alias="VISION_EMBED_CACHE_MB",
+        description="视觉特征缓存容量（MB，占用 GPU 显存，不在 vLLM 显存预算内，启用时需相应降低 GPU_MEMORY_UTILIZATION），按预处理像素摘要 + 模式寻址，0 表示关闭"
+    )
+    vision_stage_enabled: bool = Field(
+        default=False,
+        alias="VISION_STAGE_ENABLED",
+        description="编码 / 解码分离：视觉编码在独立阶段按批执行，以 image token 特征提交给语言模型引擎"
+    )
+    vision_stage_device: str = Field(
+        default="cuda",
+        alias="VISION_STAGE_DEVICE",
+        description="视觉编码阶段所在设备（如 cuda:1），与语言模型引擎分开扩容"
+    )
+    vision_stage_max_batch: int = Field(
+        default=8,
+        alias="VISION_STAGE_MAX_BATCH",
+        description="视觉编码阶段单批最多编码的图像数（跨请求合批，同尺寸视图合并前向）"
+    )
+    vision_stage_max_wait_ms: float = Field(
+        default=5.0,
+        alias="VISION_STAGE_MAX_WAIT_MS",
+        description="视觉编码阶段收到首个请求后等待凑批的最长时间（毫秒）"
+    )
+    preprocess_pool_kind: Literal["thread", "process"] = Field(
+        default="thread",
+        alias="PREPROCESS_POOL_KIND",
+        description="图像解码 / tokenize 执行池类型（thread 或 process）"
+    )
+    preprocess_max_workers: int = Field(
+        default=4,
+        alias="PREPROCESS_MAX_WORKERS",
+        description="预处理工作线程 / 进程数"
+    )
+    preprocess_max_inflight_mb: int = Field(
+        default=512,
+        alias="PREPROCESS_MAX_INFLIGHT_MB",
+        description="同时预处理的解码像素内存上限（MB，0 表示不限制）"
+    )
+    event_loop_lag_interval_ms: int = Field(
+        default=500,
+        alias="EVENT_LOOP_LAG_INTERVAL_MS",
+        description="事件循环延迟采样间隔（毫秒，0 表示关闭）"
+    )
+    scheduling_policy: Literal["fcfs", "priority"] = Field(
+        default="fcfs",
+        alias="SCHEDULING_POLICY",
+        description="vLLM 调度策略；priority 时按请求优先级（interactive/batch/background）调度"
+    )
+
     # 默认提示词
     image_prompt: str = Field(
         default="<image>\nFree OCR.",
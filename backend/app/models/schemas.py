@@ -3,7 +3,7 @@
 from __future__ import annotations
 
 from datetime import datetime
-from typing import List, Optional
+from typing import List, Literal, Optional
 from uuid import UUID
 
 from pydantic import BaseModel, Field
@@ -27,6 +27,9 @@ class ImageOCRResponse(BaseModel):
     raw_text: str
     boxes: List[BoundingBox] = Field(default_factory=list)
     image_dims: Optional[ImageDimensions] = None
+    truncated_reason: Optional[str] = Field(
+        default=None, description="检测到重复循环而提前终止生成时的原因"
+    )
     task_id: Optional[UUID] = Field(default=None, description="对应的任务 ID（仅同步调用）")
     timing: Optional["TaskTiming"] = None
     duration_ms: Optional[int] = Field(default=None, description="任务耗时（毫秒）")
@@ -91,13 +94,39 @@ class InternalInferRequest(BaseModel):
     image_base64: Optional[str] = Field(
         default=None, description="Base64 编码的图像数据（JPEG/PNG）"
     )
+    mode: Optional[Literal["tiny", "small", "base", "large", "gundam"]] = Field(
+        default=None, description="命名 OCR 模式，优先于 base_size/image_size"
+    )
     base_size: Optional[int] = None
     image_size: Optional[int] = None
     crop_mode: Optional[bool] = None
+    bypass_cache: bool = Field(default=False, description="跳过结果缓存读取")
+    priority: Literal["interactive", "batch", "background"] = Field(
+        default="batch", description="调度优先级（interactive 最先执行）"
+    )
 
 
 class InternalInferResponse(BaseModel):
     text: str = Field(..., description="模型原始输出文本")
+    truncated_reason: Optional[str] = Field(
+        default=None, description="检测到重复循环而提前终止生成时的原因（text 截止到循环开始处）"
+    )
+
+
+class InternalInferBatchRequest(BaseModel):
+    items: List[InternalInferRequest] = Field(..., min_length=1, description="批量推理条目")
+
+
+class InternalInferBatchItem(BaseModel):
+    text: str = Field("", description="模型原始输出文本")
+    error: Optional[str] = Field(default=None, description="该条目的错误信息（成功时为空）")
+    truncated_reason: Optional[str] = Field(
+        default=None, description="检测到重复循环而提前终止生成时的原因"
+    )
+
+
+class InternalInferBatchResponse(BaseModel):
+    results: List[InternalInferBatchItem] = Field(..., description="与请求顺序一致的结果")
 
 
 ImageOCRResponse.model_rebuild()
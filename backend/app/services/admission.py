@@ -0,0 +1,213 @@
+"""推理准入控制：有界排队 + token 积压上限，过载时快速拒绝并提示重试"""
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import time
+from enum import IntEnum
+from typing import Sequence
+
+from .metrics import metrics
+
+
+class Priority(IntEnum):
+    """请求优先级（数值越小越优先，与 vLLM priority 调度语义一致）"""
+
+    INTERACTIVE = 0
+    BATCH = 1
+    BACKGROUND = 2
+
+    @property
+    def label(self) -> str:
+        return self.name.lower()
+
+
+class AdmissionRejected(RuntimeError):
+    """推理请求被准入控制拒绝（调用方应在 retry_after 秒后重试）"""
+
+    def __init__(self, message: str, status_code: int, retry_after: int) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class AdmissionTicket:
+    """一次准入预约；进入上下文时等待执行槽位，退出时释放"""
+
+    def __init__(
+        self,
+        controller: AdmissionController,
+        tokens: int,
+        priority: Priority = Priority.INTERACTIVE,
+    ) -> None:
+        self.controller = controller
+        self.tokens = tokens
+        self.priority = priority
+        self.created_at = time.perf_counter()
+        self.state = "queued"
+
+    async def __aenter__(self) -> AdmissionTicket:
+        await self.acquire()
+        return self
+
+    async def acquire(self) -> None:
+        """等待执行槽位（供无法用 async with 包住整个执行过程的调用方，如流式生成器）"""
+        await self.controller._acquire(self)
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        self.release()
+
+    def release(self) -> None:
+        """释放预约（可重复调用）"""
+        self.controller._release(self)
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        max_concurrency: int,
+        max_queue_depth: int = 0,
+        max_token_backlog: int = 0,
+        output_token_estimate: int = 1024,
+        retry_after_seconds: int = 1,
+    ) -> None:
+        """
+        Args:
+            max_concurrency: 同时提交给引擎的请求上限
+            max_queue_depth: 等待执行槽位的请求上限（0 表示不限制）
+            max_token_backlog: 排队 + 执行中请求的预估 token 总量上限（0 表示不限制）
+            output_token_estimate: 单个请求预估输出 token 数（不超过 max_tokens）
+            retry_after_seconds: 拒绝时建议客户端的重试间隔
+        """
+        self.max_concurrency = max(max_concurrency, 1)
+        self.max_queue_depth = max(max_queue_depth, 0)
+        self.max_token_backlog = max(max_token_backlog, 0)
+        self.output_token_estimate = max(output_token_estimate, 0)
+        self.retry_after_seconds = max(retry_after_seconds, 1)
+        # 按 (优先级, 到达顺序) 排序的等待者；空闲槽位总是先交给最高优先级的等待者
+        self._available = self.max_concurrency
+        self._waiters: list[tuple[int, int, asyncio.Future[None]]] = []
+        self._sequence = itertools.count()
+        self._waiting = 0
+        self._running = 0
+        self._token_backlog = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return self._waiting
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    @property
+    def token_backlog(self) -> int:
+        return self._token_backlog
+
+    def estimate_tokens(self, prompt_tokens: int, max_tokens: int) -> int:
+        return prompt_tokens + min(max_tokens, self.output_token_estimate)
+
+    def check(self, tokens: int, count: int = 1) -> None:
+        """检查当前是否可以接纳 count 个请求（预估共 tokens 个 token），不可接纳时抛出 AdmissionRejected"""
+        if self.max_queue_depth and count > self.max_queue_depth:
+            metrics.increment("admission.rejected.batch_too_large")
+            raise AdmissionRejected(
+                f"批量条目数超过推理队列上限（{count}/{self.max_queue_depth}），请拆分后提交",
+                status_code=413,
+                retry_after=self.retry_after_seconds,
+            )
+        if self.max_queue_depth and self._waiting + count > self.max_queue_depth:
+            metrics.increment("admission.rejected.queue_full")
+            raise AdmissionRejected(
+                f"推理队列已满（{self._waiting}/{self.max_queue_depth}）",
+                status_code=429,
+                retry_after=self.retry_after_seconds,
+            )
+        # 空闲时总是放行单个超大请求，避免永远无法执行
+        if (
+            self.max_token_backlog
+            and self._token_backlog > 0
+            and self._token_backlog + tokens > self.max_token_backlog
+        ):
+            metrics.increment("admission.rejected.token_backlog")
+            raise AdmissionRejected(
+                f"推理 token 积压过多（{self._token_backlog}/{self.max_token_backlog}）",
+                status_code=503,
+                retry_after=self.retry_after_seconds,
+            )
+
+    def reserve(self, tokens: int, priority: Priority = Priority.INTERACTIVE) -> AdmissionTicket:
+        """预约一个排队位置；被拒绝时抛出 AdmissionRejected"""
+        return self.reserve_many([(tokens, priority)])[0]
+
+    def reserve_many(self, requests: Sequence[tuple[int, Priority]]) -> list[AdmissionTicket]:
+        """
+        把一批请求作为整体预约排队位置：全部接纳，或整体抛出 AdmissionRejected
+
+        requests 为每个请求的 (预估 token 数, 优先级)。
+        """
+        if not requests:
+            return []
+        self.check(sum(tokens for tokens, _ in requests), len(requests))
+        tickets = []
+        for tokens, priority in requests:
+            self._waiting += 1
+            self._token_backlog += tokens
+            metrics.increment("admission.admitted")
+            metrics.increment(f"admission.admitted.{priority.label}")
+            tickets.append(AdmissionTicket(self, tokens, priority))
+        self._publish()
+        return tickets
+
+    async def _acquire(self, ticket: AdmissionTicket) -> None:
+        if ticket.state != "queued":
+            return
+        if self._available > 0 and not self._waiters:
+            self._available -= 1
+        else:
+            waiter: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (int(ticket.priority), next(self._sequence), waiter))
+            try:
+                await waiter
+            except BaseException:
+                # 槽位已移交但调用方被取消时，把槽位转交给下一个等待者
+                if waiter.done() and not waiter.cancelled():
+                    self._release_slot()
+                else:
+                    waiter.cancel()
+                self._release(ticket)
+                raise
+        self._waiting -= 1
+        self._running += 1
+        ticket.state = "running"
+        wait_ms = (time.perf_counter() - ticket.created_at) * 1000
+        metrics.observe_ms("admission.wait", wait_ms)
+        metrics.observe_ms(f"admission.wait.{ticket.priority.label}", wait_ms)
+        self._publish()
+
+    def _release_slot(self) -> None:
+        while self._waiters:
+            _, _, waiter = heapq.heappop(self._waiters)
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._available += 1
+
+    def _release(self, ticket: AdmissionTicket) -> None:
+        if ticket.state == "queued":
+            self._waiting -= 1
+        elif ticket.state == "running":
+            self._running -= 1
+            self._release_slot()
+        else:
+            return
+        ticket.state = "done"
+        self._token_backlog -= ticket.tokens
+        self._publish()
+
+    def _publish(self) -> None:
+        metrics.set_gauge("admission.queue_depth", self._waiting)
+        metrics.set_gauge("admission.running", self._running)
+        metrics.set_gauge("admission.token_backlog", self._token_backlog)
@@ -0,0 +1,126 @@
+"""CPU 预处理执行池：把图像解码 / 切图 / tokenize 移出 asyncio 事件循环，并限制在途字节数"""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+import multiprocessing
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional, TypeVar
+
+from .metrics import metrics
+
+T = TypeVar("T")
+
+
+class PreprocessPool:
+    def __init__(
+        self,
+        kind: str = "thread",
+        max_workers: int = 4,
+        max_inflight_bytes: int = 0,
+        initializer: Optional[Callable[..., None]] = None,
+        initargs: tuple[Any, ...] = (),
+    ) -> None:
+        """
+        Args:
+            kind: "thread" 或 "process"；process 模式下提交的函数与参数必须可 pickle
+            max_workers: 工作线程 / 进程数
+            max_inflight_bytes: 同时处理的预估解码字节上限（0 表示不限制）
+            initializer: 进程池工作进程的初始化函数（线程池忽略）
+            initargs: initializer 参数
+        """
+        if kind not in ("thread", "process"):
+            raise ValueError(f"未知的预处理池类型: {kind}")
+        self.kind = kind
+        self.max_workers = max(max_workers, 1)
+        self.max_inflight_bytes = max(max_inflight_bytes, 0)
+        self._initializer = initializer
+        self._initargs = initargs
+        self._executor: Optional[Executor] = None
+        self._inflight_bytes = 0
+        self._condition: Optional[asyncio.Condition] = None
+
+    @property
+    def inflight_bytes(self) -> int:
+        return self._inflight_bytes
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                # spawn 避免 fork 已初始化 CUDA 的父进程
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=self._initializer,
+                    initargs=self._initargs,
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="preprocess"
+                )
+        return self._executor
+
+    async def run(self, func: Callable[..., T], *args: Any, nbytes: int = 0, **kwargs: Any) -> T:
+        """在池中执行 func，等待在途字节预算后再提交"""
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        start = time.perf_counter()
+        async with self._condition:
+            # 空闲时总是放行单个超大图像，避免永远无法执行
+            await self._condition.wait_for(
+                lambda: not self.max_inflight_bytes
+                or self._inflight_bytes == 0
+                or self._inflight_bytes + nbytes <= self.max_inflight_bytes
+            )
+            self._inflight_bytes += nbytes
+            metrics.set_gauge("preprocess_pool.inflight_bytes", self._inflight_bytes)
+        metrics.observe_ms("preprocess_pool.wait", (time.perf_counter() - start) * 1000)
+
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._get_executor(), functools.partial(func, *args, **kwargs)
+            )
+        finally:
+            async with self._condition:
+                self._inflight_bytes -= nbytes
+                metrics.set_gauge("preprocess_pool.inflight_bytes", self._inflight_bytes)
+                self._condition.notify_all()
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+class EventLoopLagMonitor:
+    """周期性测量事件循环调度延迟（实际唤醒时间 - 预期唤醒时间）"""
+
+    def __init__(self, interval_ms: int = 500) -> None:
+        self.interval = max(interval_ms, 1) / 1000
+        self._task: Optional[asyncio.Task[None]] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag_ms = max(loop.time() - expected, 0.0) * 1000
+            metrics.observe_ms("event_loop.lag", lag_ms)
+            metrics.set_gauge("event_loop.lag_ms", round(lag_ms, 3))
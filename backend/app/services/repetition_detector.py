@@ -0,0 +1,124 @@
+"""流式输出重复检测：在线识别周期性重复文本 / 连续重复行，用于提前终止陷入循环的生成"""
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from typing import List, Optional
+
+# 表格骨架：HTML 表格标签与 markdown 表格的分隔符 / 空白
+_TABLE_MARKUP = re.compile(r"</?(?:table|thead|tbody|tr|td|th)\b[^<>]*>|[\s|:\-]")
+
+
+def is_table_markup(piece: str) -> bool:
+    """片段是否只由表格骨架组成（空白表单的空行 / 空单元格）；piece 可以是循环片段的任意一个旋转"""
+    start = piece.find("<")
+    if start > 0:
+        # 旋转到标签起点，避免从标签中间切开
+        piece = piece[start:] + piece[:start]
+    return not _TABLE_MARKUP.sub("", piece)
+
+
+@dataclass(frozen=True)
+class RepetitionDetectorConfig:
+    # 周期性重复：尾部至少 min_loop_chars 个字符、且至少 min_repeats 次重复同一片段（片段长度 ≤ max_period）
+    min_loop_chars: int = 2048
+    min_repeats: int = 8
+    max_period: int = 256
+    # 行级重复：同一非空行连续出现的次数上限
+    max_line_repeats: int = 32
+    # 每新增多少字符做一次周期检测，摊薄检测开销
+    check_interval_chars: int = 256
+    # 只由表格骨架组成的重复（空白表单的空行 / 空单元格）是合法输出，需要长得多的重复才判定为循环
+    markup_min_loop_chars: int = 32768
+    markup_max_line_repeats: int = 512
+
+
+class RepetitionDetector:
+    """单个请求的重复检测器；feed 返回 True 表示检测到循环，truncate_at 为保留文本的长度"""
+
+    def __init__(self, config: RepetitionDetectorConfig) -> None:
+        self.config = config
+        self.reason: Optional[str] = None
+        self.truncate_at: Optional[int] = None
+        self._parts: List[str] = []
+        self._length = 0
+        self._next_check = config.check_interval_chars
+        # 行级状态：已扫描到的位置、上一行内容、连续重复次数与本轮重复的起点
+        self._line_scan = 0
+        self._line_start = 0
+        self._last_line: Optional[str] = None
+        self._line_limit = config.max_line_repeats
+        self._line_repeats = 0
+        self._run_start = 0
+
+    def feed(self, delta: str) -> bool:
+        if self.reason is not None:
+            return True
+        if not delta:
+            return False
+        self._parts.append(delta)
+        self._length += len(delta)
+
+        check_lines = "\n" in delta
+        check_period = self._length >= self._next_check
+        if not (check_lines or check_period):
+            return False
+
+        text = "".join(self._parts)
+        self._parts = [text]
+        if check_lines and self._scan_lines(text):
+            return True
+        if check_period:
+            self._next_check = self._length + self.config.check_interval_chars
+            return self._scan_period(text)
+        return False
+
+    def _scan_lines(self, text: str) -> bool:
+        while True:
+            end = text.find("\n", self._line_scan)
+            if end < 0:
+                return False
+            line = text[self._line_start:end]
+            self._line_scan = end + 1
+            if line.strip() and line == self._last_line:
+                self._line_repeats += 1
+            else:
+                self._last_line = line
+                self._line_limit = (self.config.markup_max_line_repeats if is_table_markup(line)
+                                    else self.config.max_line_repeats)
+                self._line_repeats = 1
+                self._run_start = self._line_start
+            self._line_start = end + 1
+            if self._line_repeats >= self._line_limit:
+                # 保留第一次出现的行
+                self._trigger("repeated_lines", self._run_start + len(line) + 1)
+                return True
+
+    def _scan_period(self, text: str) -> bool:
+        length = len(text)
+        config = self.config
+        for period in range(1, config.max_period + 1):
+            span = max(config.min_loop_chars, period * config.min_repeats)
+            if span > length:
+                continue
+            tail = text[length - span:]
+            # 尾部以 period 为周期：整体错位 period 后与自身相同
+            if tail[period:] != tail[:-period]:
+                continue
+            if span < config.markup_min_loop_chars and is_table_markup(tail[-period:]):
+                # 表格骨架的重复须覆盖 markup_min_loop_chars 才判定为循环
+                span = config.markup_min_loop_chars
+                if span > length or text[length - span + period:] != text[length - span:length - period]:
+                    continue
+            start = length - span
+            while start > 0 and text[start - 1] == text[start - 1 + period]:
+                start -= 1
+            # 保留循环片段的第一次出现
+            self._trigger("repeated_text", start + period)
+            return True
+        return False
+
+    def _trigger(self, reason: str, truncate_at: int) -> None:
+        self.reason = reason
+        self.truncate_at = truncate_at
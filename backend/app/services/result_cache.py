@@ -0,0 +1,174 @@
+"""OCR 结果缓存：按图像内容 + 提示词 + 模式 + 生成参数 + 模型寻址，内存 LRU + 可选磁盘两级（均有上限）"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+from .metrics import metrics
+
+
+class OcrResultCache:
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        disk_dir: Optional[Path] = None,
+        disk_max_bytes: int = 512 * 1024 * 1024,
+    ) -> None:
+        self.max_entries = max(max_entries, 0)
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = max(disk_max_bytes, 0)
+        self._entries: OrderedDict[str, str] = OrderedDict()
+        # 磁盘层索引：键 -> 文件字节数，按最近访问排序（启动时按 mtime 恢复），超出 disk_max_bytes 时淘汰最久未用
+        self._disk_entries: OrderedDict[str, int] = OrderedDict()
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        if self.disk_dir is not None:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            self._load_disk_index()
+
+    @staticmethod
+    def digest_bytes(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    @staticmethod
+    def digest_file(path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def make_key(
+        image_digest: str,
+        prompt: str,
+        base_size: int,
+        image_size: int,
+        crop_mode: bool,
+        model_path: str,
+        temperature: float = 0.0,
+        max_tokens: int = 8192,
+    ) -> str:
+        parts = [
+            image_digest, prompt, str(base_size), str(image_size), str(bool(crop_mode)), model_path,
+            repr(float(temperature)), str(max_tokens),
+        ]
+        return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            text = self._entries.get(key)
+            if text is not None:
+                self._entries.move_to_end(key)
+        if text is not None:
+            metrics.increment("result_cache.memory_hits")
+            return text
+
+        text = self._read_disk(key)
+        if text is not None:
+            metrics.increment("result_cache.disk_hits")
+            self._put_memory(key, text)
+            return text
+
+        metrics.increment("result_cache.misses")
+        return None
+
+    def put(self, key: str, text: str) -> None:
+        self._put_memory(key, text)
+        self._write_disk(key, text)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+        metrics.set_gauge("result_cache.entries", 0)
+
+    def _put_memory(self, key: str, text: str) -> None:
+        if self.max_entries == 0:
+            return
+        with self._lock:
+            self._entries[key] = text
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            size = len(self._entries)
+        metrics.set_gauge("result_cache.entries", size)
+
+    def _disk_path(self, key: str) -> Optional[Path]:
+        if self.disk_dir is None:
+            return None
+        return self.disk_dir / key[:2] / f"{key}.txt"
+
+    def _load_disk_index(self) -> None:
+        files = []
+        for path in self.disk_dir.glob("*/*.txt"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, path.stem, stat.st_size))
+        with self._lock:
+            for _, key, size in sorted(files):
+                self._disk_entries[key] = size
+                self._disk_bytes += size
+        self._prune_disk()
+
+    def _prune_disk(self) -> None:
+        """按最近访问顺序淘汰磁盘条目，直到总字节数不超过 disk_max_bytes"""
+        evicted = []
+        with self._lock:
+            while self._disk_entries and self._disk_bytes > self.disk_max_bytes:
+                key, size = self._disk_entries.popitem(last=False)
+                self._disk_bytes -= size
+                evicted.append(key)
+            total = self._disk_bytes
+        for key in evicted:
+            try:
+                self._disk_path(key).unlink()
+            except OSError:
+                pass
+        if evicted:
+            metrics.increment("result_cache.disk_evictions", len(evicted))
+        metrics.set_gauge("result_cache.disk_bytes", total)
+
+    def _read_disk(self, key: str) -> Optional[str]:
+        path = self._disk_path(key)
+        if path is None:
+            return None
+        with self._lock:
+            if key not in self._disk_entries:
+                return None
+            self._disk_entries.move_to_end(key)
+        try:
+            text = path.read_text(encoding="utf-8")
+            # 更新 mtime，重启后仍按最近访问顺序淘汰
+            os.utime(path)
+            return text
+        except OSError:
+            return None
+
+    def _write_disk(self, key: str, text: str) -> None:
+        path = self._disk_path(key)
+        if path is None or self.disk_max_bytes == 0:
+            return
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # 先写临时文件再原子替换，避免并发读到半截内容
+            with tempfile.NamedTemporaryFile(
+                "w", encoding="utf-8", dir=path.parent, delete=False, suffix=".tmp"
+            ) as tmp:
+                tmp.write(text)
+            os.replace(tmp.name, path)
+            size = path.stat().st_size
+        except OSError as e:
+            print(f"⚠️ 写入结果缓存失败: {e}")
+            return
+        with self._lock:
+            self._disk_bytes += size - self._disk_entries.pop(key, 0)
+            self._disk_entries[key] = size
+        self._prune_disk()
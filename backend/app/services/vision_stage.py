@@ -0,0 +1,140 @@
+"""视觉编码阶段：跨请求收集处理器输出，在专用线程 / 设备上按批编码，把 image token 特征交给语言模型引擎"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Optional, Tuple
+
+import torch
+
+from ..vllm_models.deepencoder.view_encoder import read_crop_shapes
+from ..vllm_models.vision_encoder import DeepseekOCRVisionEncoder
+from .metrics import metrics
+
+# 单张图像的编码输入：(全局视图 [1, 3, H, W], 切块 [1, n_tiles, 3, h, w] 或 None, 切图网格 [2], 像素摘要 [2])
+ImageViews = Tuple[torch.Tensor, Optional[torch.Tensor], torch.Tensor, torch.Tensor]
+
+
+class VisionEncoderStage:
+    def __init__(
+        self,
+        encoder: DeepseekOCRVisionEncoder,
+        max_batch_images: int = 8,
+        max_wait_ms: float = 5.0,
+    ) -> None:
+        """
+        Args:
+            encoder: 已加载权重的独立视觉编码器
+            max_batch_images: 单批最多编码的图像数（批内同尺寸视图再合并前向）
+            max_wait_ms: 收到第一个请求后等待凑批的最长时间
+        """
+        self.encoder = encoder
+        self.max_batch_images = max(max_batch_images, 1)
+        self.max_wait = max(max_wait_ms, 0.0) / 1000
+        # 单线程执行：编码器独占所在设备，批次之间串行
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vision-stage")
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task[None]] = None
+        # 正在编码的批次，关闭时一并取消其等待者
+        self._batch: list = []
+
+    @staticmethod
+    def split_payload(payload: Any) -> List[ImageViews]:
+        """把 tokenize_with_images 的输出拆成逐图像的编码输入（切块按各图网格从拼接的 images_crop 中切出）"""
+        _, pixel_values, images_crop, _, images_spatial_crop, _, _, _, image_digests = payload[0]
+        crop_shapes = read_crop_shapes(images_spatial_crop)
+        images: List[ImageViews] = []
+        offset = 0
+        for jdx, (width, height) in enumerate(crop_shapes):
+            crops = None
+            if width > 1 or height > 1:
+                crops = images_crop[0][offset:offset + width * height].unsqueeze(0)
+                offset += width * height
+            images.append((pixel_values[jdx:jdx + 1], crops, images_spatial_crop[jdx], image_digests[jdx]))
+        return images
+
+    async def encode(self, payload: Any) -> List[torch.Tensor]:
+        """编码一个请求的处理器输出，返回每张图像的 image token 特征 [n_tokens, n_embed]（CPU 张量）"""
+        images = self.split_payload(payload)
+        if not images:
+            return []
+        loop = asyncio.get_running_loop()
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._run())
+        future: asyncio.Future[List[torch.Tensor]] = loop.create_future()
+        self._queue.put_nowait((images, future, time.perf_counter()))
+        return await future
+
+    async def _next_batch(self) -> list:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        count = len(batch[0][0])
+        deadline = loop.time() + self.max_wait
+        while count < self.max_batch_images:
+            try:
+                entry = self._queue.get_nowait()
+            except asyncio.QueueEmpty:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    entry = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            batch.append(entry)
+            count += len(entry[0])
+        # 已取消（客户端断开 / 超时）的请求不再编码
+        return [entry for entry in batch if not entry[1].done()]
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = self._batch = await self._next_batch()
+            if not batch:
+                continue
+            start = time.perf_counter()
+            for _, _, queued_at in batch:
+                metrics.observe_ms("vision_stage.wait", (start - queued_at) * 1000)
+            images = [image for entry in batch for image in entry[0]]
+            try:
+                features = await loop.run_in_executor(self._executor, self._encode, images)
+            except Exception as exc:
+                print(f"❌ 视觉编码阶段失败: {type(exc).__name__}: {exc}")
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+            metrics.observe_ms("vision_stage.encode", (time.perf_counter() - start) * 1000)
+            metrics.increment("vision_stage.batches")
+            metrics.increment("vision_stage.images", len(images))
+            metrics.set_gauge("vision_stage.last_batch_images", len(images))
+
+            offset = 0
+            for entry_images, future, _ in batch:
+                if not future.done():
+                    future.set_result(features[offset:offset + len(entry_images)])
+                offset += len(entry_images)
+
+    def _encode(self, images: List[ImageViews]) -> List[torch.Tensor]:
+        global_views, crops, spatial_crop, digests = zip(*images)
+        features = self.encoder.encode(global_views, crops, torch.stack(spatial_crop), torch.stack(digests))
+        # 特征随请求交给引擎（v1 引擎经 IPC 传入引擎进程），复制回 CPU，不与编码器缓存共享存储
+        return [feature.to("cpu", copy=True) for feature in features]
+
+    def shutdown(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        pending = list(self._batch)
+        if self._queue is not None:
+            while not self._queue.empty():
+                pending.append(self._queue.get_nowait())
+            self._queue = None
+        for _, future, _ in pending:
+            if not future.done():
+                future.cancel()
+        self._batch = []
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -3,12 +3,16 @@ vLLM Direct Engine
 直接使用 AsyncLLMEngine 进行推理，避免 OpenAI API 的限制
 参考：third_party/DeepSeek-OCR-vllm/run_dpsk_ocr_image.py
 """
+import asyncio
 import os
 import time
-from typing import Optional
+import uuid
+from contextlib import aclosing, nullcontext
+from dataclasses import dataclass
+from typing import IO, Any, AsyncIterator, Callable, List, Optional, Sequence, Union
 
 import torch
-from PIL import Image, ImageOps
+from PIL import Image
 
 from vllm import AsyncLLMEngine, SamplingParams
 from vllm.engine.arg_utils import AsyncEngineArgs
@@ -22,19 +26,128 @@ except ImportError:
     from ..vllm_models.deepseek_ocr import DeepseekOCRForCausalLM  # type: ignore
     _USING_OFFICIAL_MODEL = False
 
-from ..vllm_models.process.image_process import DeepseekOCRProcessor
+from ..utils.image_utils import ImageUtils
+from ..vllm_models.config import OcrMode
+from ..vllm_models.process.image_process import (DeepseekOCRProcessor, count_image_tokens, decode_factor_for_mode,
+                                                 decode_mode_for_request)
 from ..vllm_models.process.ngram_norepeat import NoRepeatNGramLogitsProcessor
-from ..vllm_models import config as vllm_config
+from ..vllm_models.vision_encoder import DeepseekOCRVisionEncoder
+
+# v1 引擎的批级 n-gram 防重复处理器（依赖 vLLM v1 logits processor 接口）
+try:
+    from ..vllm_models.process.ngram_norepeat_v1 import NoRepeatNGramBatchLogitsProcessor
+except ImportError:
+    NoRepeatNGramBatchLogitsProcessor = None
+from .admission import AdmissionController, AdmissionTicket, Priority
+from .metrics import metrics
+from .preprocess_pool import PreprocessPool
+from .repetition_detector import RepetitionDetector, RepetitionDetectorConfig
+from .result_cache import OcrResultCache
+from .vision_stage import VisionEncoderStage
+
+
+# n-gram 防重复参数；<td>, </td> 标签允许重复
+NGRAM_SIZE = 30
+NGRAM_WINDOW_SIZE = 90
+NGRAM_WHITELIST_TOKEN_IDS = frozenset({128821, 128822})
+
+
+@dataclass
+class InferenceItem:
+    """单个推理条目（提示词 + 图像 + OCR 模式）"""
+
+    prompt: str
+    image_path: Optional[str] = None
+    image_data: Optional[Image.Image] = None
+    base_size: int = 1024
+    image_size: int = 640
+    crop_mode: bool = True
+    # 图像内容哈希（调用方已持有原始字节时提供，否则由 _inspect_image 计算），用于结果缓存寻址
+    image_digest: Optional[str] = None
+    # 图像宽高（由 _inspect_image 读取一次，供内存与 token 估算复用）
+    image_dimensions: Optional[tuple[int, int]] = None
+    # False 时跳过缓存读取（结果仍会写回缓存）
+    use_cache: bool = True
+    priority: Priority = Priority.INTERACTIVE
+
+
+@dataclass
+class InferenceResult:
+    """单个推理条目的结果"""
+
+    text: str = ""
+    error: Optional[str] = None
+    # 检测到重复循环并提前终止时的原因（repeated_text / repeated_lines），text 截止到循环开始处
+    truncated_reason: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+# 进程池模式下每个工作进程各自持有的处理器（由 _init_preprocess_worker 构建）
+_worker_processor: Optional[DeepseekOCRProcessor] = None
+
+
+def _init_preprocess_worker(model_path: Optional[str], uint8_pixels: bool) -> None:
+    global _worker_processor
+    if model_path:
+        _worker_processor = VLLMDirectEngine._build_processor(model_path, uint8_pixels)
+
+
+def _inspect_image_file(path: str, with_digest: bool) -> tuple[Optional[str], Optional[tuple[int, int]]]:
+    """在预处理池中读取图像文件的 (内容哈希, 宽高)；宽高只解析文件头，不解码像素"""
+    digest = None
+    if with_digest:
+        try:
+            digest = OcrResultCache.digest_file(path)
+        except OSError:
+            pass
+    try:
+        with Image.open(path) as img:
+            size = img.size
+    except Exception:
+        size = None
+    return digest, size
+
+
+def _preprocess_item(
+    item: InferenceItem,
+    processor: Optional[DeepseekOCRProcessor],
+    raw_image: bool,
+    decode_mode: Optional[OcrMode],
+) -> tuple[dict, int]:
+    """在预处理池中执行的入口（进程池要求模块级函数）"""
+    return VLLMDirectEngine._build_request(item, processor or _worker_processor, raw_image, decode_mode)
 
 
 class VLLMDirectEngine:
     """直接使用 vLLM AsyncLLMEngine 的推理引擎"""
     
-    def __init__(self):
+    def __init__(
+        self,
+        result_cache: Optional[OcrResultCache] = None,
+        admission: Optional[AdmissionController] = None,
+        repetition: Optional[RepetitionDetectorConfig] = None,
+    ):
         self.engine: Optional[AsyncLLMEngine] = None
+        self.result_cache = result_cache
+        self.admission = admission
+        # 为 None 时不做流式重复检测
+        self.repetition = repetition
         self.model_path: Optional[str] = None
         self._loaded = False
         self._use_v1_engine = False
+        # 为 True 时把请求优先级传给 vLLM 调度器（需 scheduling_policy="priority"）
+        self._priority_scheduling = False
+        # legacy 路径复用的处理器（含 tokenizer），在 load() 时构建一次
+        self._processor: Optional[DeepseekOCRProcessor] = None
+        # 正在生成中的请求 ID，用于取消/超时/断连时主动 abort
+        self._inflight: set[str] = set()
+        # 图像解码 / tokenize 等 CPU 工作的执行池，避免阻塞事件循环
+        self.preprocess_pool = PreprocessPool()
+        # 编码 / 解码分离时的独立视觉编码阶段，请求以 image token 特征提交给引擎
+        self.vision_stage: Optional[VisionEncoderStage] = None
         
     def is_loaded(self) -> bool:
         """检查引擎是否已加载"""
@@ -48,6 +161,17 @@ class VLLMDirectEngine:
         max_model_len: int = 8192,
         enforce_eager: bool = False,
         use_v1_engine: bool = False,
+        scheduling_policy: str = "fcfs",
+        preprocess_pool_kind: str = "thread",
+        preprocess_max_workers: int = 4,
+        preprocess_max_inflight_bytes: int = 0,
+        pixel_transport_uint8: bool = False,
+        vision_compile_mode: str = "off",
+        vision_embed_cache_mb: int = 0,
+        vision_stage_enabled: bool = False,
+        vision_stage_device: str = "cuda",
+        vision_stage_max_batch: int = 8,
+        vision_stage_max_wait_ms: float = 5.0,
         **kwargs
     ):
         """
@@ -59,15 +183,54 @@ class VLLMDirectEngine:
             gpu_memory_utilization: GPU 内存利用率
             max_model_len: 最大模型长度
             enforce_eager: 是否强制使用 eager 模式
+            scheduling_policy: vLLM 调度策略，"priority" 时按请求优先级调度
+            preprocess_pool_kind: 预处理执行池类型（thread / process）
+            preprocess_max_workers: 预处理工作线程 / 进程数
+            preprocess_max_inflight_bytes: 同时预处理的解码字节上限（0 表示不限制）
+            pixel_transport_uint8: 以 uint8 传输像素，在模型侧（GPU 上）归一化
+            vision_compile_mode: 视觉编码器 torch.compile 模式（off / default / reduce-overhead，仅自定义模型）
+            vision_embed_cache_mb: 视觉特征缓存容量（MB，仅自定义模型，在 gpu_memory_utilization 之外占用显存），0 表示关闭
+            vision_stage_enabled: 在独立的视觉编码阶段编码图像，以 image token 特征提交给引擎（仅自定义模型）
+            vision_stage_device: 视觉编码阶段所在设备（如 cuda:1，与语言模型分开扩容）
+            vision_stage_max_batch: 视觉编码阶段单批最多编码的图像数
+            vision_stage_max_wait_ms: 视觉编码阶段等待凑批的最长时间（毫秒）
         """
         print(f"🔧 初始化 vLLM Direct Engine...")
         print(f"📦 模型路径: {model_path}")
         
         self.model_path = model_path
         self._use_v1_engine = use_v1_engine
+        if vision_stage_enabled and _USING_OFFICIAL_MODEL:
+            print("⚠️ 使用 vLLM 内置模型时不支持预计算图像特征，VISION_STAGE_ENABLED 不生效")
+            vision_stage_enabled = False
+        # 视觉编码阶段需要处理器输出的像素张量，v1 引擎下也在 API 进程内预处理
+        needs_processor = not use_v1_engine or vision_stage_enabled
+        self._priority_scheduling = scheduling_policy == "priority"
+        # 处理器（含预处理池内构建的）按此决定是否计算像素摘要，模型按此分配视觉特征缓存，须在创建池之前写入
+        os.environ["VISION_EMBED_CACHE_MB"] = str(vision_embed_cache_mb)
+        self.preprocess_pool.shutdown()
+        self.preprocess_pool = PreprocessPool(
+            kind=preprocess_pool_kind,
+            max_workers=preprocess_max_workers,
+            max_inflight_bytes=preprocess_max_inflight_bytes,
+            initializer=_init_preprocess_worker,
+            initargs=(model_path if needs_processor else None, pixel_transport_uint8),
+        )
+        print(f"🧵 预处理执行池: {preprocess_pool_kind} x{self.preprocess_pool.max_workers}")
 
         os.environ["VLLM_USE_V1"] = "1" if use_v1_engine else "0"
         print(f"🧠 VLLM_USE_V1={os.environ['VLLM_USE_V1']}")
+        # 引擎子进程内构建的处理器从环境变量读取像素传输格式
+        os.environ["PIXEL_TRANSPORT_UINT8"] = "1" if pixel_transport_uint8 else "0"
+        # 自定义模型在引擎子进程中构建时读取编译模式，加载权重后预热
+        os.environ["VISION_COMPILE_MODE"] = vision_compile_mode
+        if vision_compile_mode != "off":
+            if _USING_OFFICIAL_MODEL:
+                print("⚠️ 使用 vLLM 内置模型时 VISION_COMPILE_MODE 不生效")
+            else:
+                print(f"🧩 视觉编码器编译模式: {vision_compile_mode}")
+        if vision_embed_cache_mb > 0 and not _USING_OFFICIAL_MODEL:
+            print(f"🗂️ 视觉特征缓存: {vision_embed_cache_mb} MB")
         
         # 设置 CUDA 环境变量（如果需要）
         if torch.version.cuda == '11.8':
@@ -84,6 +247,20 @@ class VLLMDirectEngine:
             else:
                 print("ℹ️ 自定义 DeepSeek-OCR 模型已注册，跳过重复注册")
         
+        # legacy 路径 / 视觉编码阶段在 API 进程内做图像 token 化，提前构建处理器，避免每个请求重复加载 tokenizer
+        if needs_processor:
+            print("🔤 加载 DeepSeek-OCR 处理器与 tokenizer...")
+            self._processor = self._build_processor(model_path, pixel_transport_uint8)
+
+        engine_kwargs = {}
+        if use_v1_engine and NoRepeatNGramBatchLogitsProcessor is not None:
+            engine_kwargs["logits_processors"] = [NoRepeatNGramBatchLogitsProcessor]
+        elif use_v1_engine:
+            print("⚠️ 当前 vLLM 不支持 v1 logits processor，n-gram 防重复未启用")
+        # 新版 vLLM 需显式允许以 embedding 形式提交多模态输入
+        if vision_stage_enabled and "enable_mm_embeds" in AsyncEngineArgs.__dataclass_fields__:
+            engine_kwargs["enable_mm_embeds"] = True
+
         # 创建引擎参数
         engine_args = AsyncEngineArgs(
             model=model_path,
@@ -91,14 +268,31 @@ class VLLMDirectEngine:
             block_size=256,
             max_model_len=max_model_len,
             enforce_eager=enforce_eager,
+            scheduling_policy=scheduling_policy,
             trust_remote_code=True,
             tensor_parallel_size=tensor_parallel_size,
             gpu_memory_utilization=gpu_memory_utilization,
+            **engine_kwargs,
         )
         
         # 创建异步引擎
         print("🚀 创建 AsyncLLMEngine...")
         self.engine = AsyncLLMEngine.from_engine_args(engine_args)
+
+        # 在引擎之后加载：vLLM 按 gpu_memory_utilization 先划定自己的显存，视觉编码阶段使用剩余部分或另一张卡
+        if vision_stage_enabled:
+            print(f"👁️ 加载独立视觉编码阶段: {vision_stage_device}")
+            encoder = DeepseekOCRVisionEncoder.from_pretrained(
+                model_path,
+                device=vision_stage_device,
+                compile_mode=vision_compile_mode,
+                cache_bytes=vision_embed_cache_mb * 1024 * 1024,
+            )
+            self.vision_stage = VisionEncoderStage(
+                encoder,
+                max_batch_images=vision_stage_max_batch,
+                max_wait_ms=vision_stage_max_wait_ms,
+            )
         
         self._loaded = True
         print("✅ vLLM Direct Engine 加载完成!")
@@ -107,33 +301,438 @@ class VLLMDirectEngine:
         """卸载引擎"""
         if self.engine:
             print("🛑 卸载 vLLM Direct Engine...")
+            await self.abort_all()
             # vLLM engine 没有显式的 close 方法，只需要设置为 None
             self.engine = None
+            self._processor = None
+            self.preprocess_pool.shutdown()
+            if self.vision_stage is not None:
+                self.vision_stage.shutdown()
+                self.vision_stage = None
             self._loaded = False
+
+    @staticmethod
+    def _build_processor(model_path: str, uint8_pixels: bool = False) -> DeepseekOCRProcessor:
+        """构建处理器；处理器只读共享，可在并发请求间复用"""
+        from transformers import AutoTokenizer
+
+        tokenizer = AutoTokenizer.from_pretrained(model_path, trust_remote_code=True)
+        return DeepseekOCRProcessor(tokenizer=tokenizer, uint8_pixels=uint8_pixels)
     
-    def _load_image(self, image_path: str) -> Optional[Image.Image]:
+    @property
+    def _raw_image(self) -> bool:
+        """v1 引擎且未启用视觉编码阶段时直接提交 RGB 图像，由引擎内的处理器预处理"""
+        return self._use_v1_engine and self.vision_stage is None
+
+    def decode_mode(self, mode: OcrMode) -> Optional[OcrMode]:
+        """图像解码降采样所依据的模式：直接提交 RGB 图像时按引擎内处理器的固定模式（见 decode_mode_for_request）"""
+        return decode_mode_for_request(mode, self._raw_image, _USING_OFFICIAL_MODEL)
+
+    @staticmethod
+    def decode_image(
+        source: Union[str, IO[bytes]],
+        mode: Optional[OcrMode],
+    ) -> tuple[Image.Image, int]:
+        """
+        按 OCR 模式以有限内存解码图像（EXIF 旋转 + RGB）
+
+        超大图像只解码到该模式所需的最小分辨率（切图网格与 token 数不变）；mode 为 None 时按原分辨率解码。
+
+        Returns:
+            (RGB 图像, 解码峰值像素字节数)
+        """
+        return ImageUtils.decode_reduced(source, decode_factor_for_mode(mode))
+
+    @staticmethod
+    def _load_image(item: InferenceItem, decode_mode: Optional[OcrMode]) -> tuple[Optional[Image.Image], int]:
         """
         加载图像并处理 EXIF 旋转
         
         Args:
-            image_path: 图像文件路径
+            item: 推理条目（使用其 image_path）
+            decode_mode: 解码降采样所依据的模式（VLLMDirectEngine.decode_mode）
             
         Returns:
-            PIL Image 对象
+            (PIL Image 对象, 解码峰值像素字节数)
         """
         try:
-            image = Image.open(image_path)
-            # 根据 EXIF 信息自动旋转
-            corrected_image = ImageOps.exif_transpose(image)
-            return corrected_image
+            return VLLMDirectEngine.decode_image(item.image_path, decode_mode)
         except Exception as e:
             print(f"❌ 加载图像失败: {e}")
             try:
-                return Image.open(image_path)
+                image = Image.open(item.image_path)
+                return image, ImageUtils.pixel_nbytes(image)
             except:
-                return None
+                return None, 0
+
+    @staticmethod
+    def record_decode(peak_bytes: int) -> None:
+        """记录单次请求的图像解码内存峰值"""
+        if peak_bytes:
+            metrics.increment("image_decode.count")
+            metrics.increment("image_decode.peak_bytes_total", peak_bytes)
+            metrics.set_gauge("image_decode.last_peak_bytes", peak_bytes)
     
-    async def infer(
+    async def _prepare_request(self, item: InferenceItem) -> dict:
+        """
+        在预处理池中预处理单个推理条目，构建提交给引擎的请求
+
+        Args:
+            item: 推理条目
+
+        Returns:
+            vLLM generate 所需的请求字典
+        """
+        # 进程池工作进程使用各自初始化的处理器，不跨进程传递
+        processor = None if self.preprocess_pool.kind == "process" else self._processor
+        with metrics.timer("preprocess"):
+            request, decode_peak_bytes = await self.preprocess_pool.run(
+                _preprocess_item,
+                item,
+                processor,
+                self._raw_image,
+                self.decode_mode(OcrMode(item.base_size, item.image_size, item.crop_mode)),
+                nbytes=self._estimate_image_bytes(item),
+            )
+        # 进程池模式下工作进程的指标不可见，解码峰值随结果带回主进程记录
+        self.record_decode(decode_peak_bytes)
+        if self.vision_stage is not None and "multi_modal_data" in request:
+            # 处理器输出交给视觉编码阶段，引擎只接收 image token 特征（每张图像 [n_tokens, n_embed]）
+            request["multi_modal_data"] = {
+                "image": await self.vision_stage.encode(request["multi_modal_data"]["image"])
+            }
+        return request
+
+    async def run_preprocess(self, func: Callable[..., Any], *args: Any, nbytes: int = 0) -> Any:
+        """在预处理池中执行其它 CPU 密集型工作（如 base64 图像解码）"""
+        return await self.preprocess_pool.run(func, *args, nbytes=nbytes)
+
+    @staticmethod
+    def _build_request(
+        item: InferenceItem,
+        processor: Optional[DeepseekOCRProcessor],
+        raw_image: bool,
+        decode_mode: Optional[OcrMode],
+    ) -> tuple[dict, int]:
+        """
+        加载图像并构建多模态请求（在预处理池中执行），返回 (请求, 解码峰值字节数)
+
+        raw_image 为 True（v1 引擎）时直接提交 RGB 图像，由引擎内的处理器预处理；
+        否则在此调用处理器，提交其输出（legacy 路径或交给视觉编码阶段）。
+        """
+        prompt = item.prompt
+
+        # 处理图像（如果提供）
+        image_payload = None
+        source_image: Optional[Image.Image] = None
+        decode_peak_bytes = 0
+        if item.image_data is not None:
+            source_image = item.image_data
+        elif item.image_path and '<image>' in prompt:
+            source_image, decode_peak_bytes = VLLMDirectEngine._load_image(item, decode_mode)
+            if source_image is None:
+                raise ValueError(f"无法加载图像: {item.image_path}")
+
+        if source_image is not None and '<image>' in prompt:
+            # 已是 RGB 时 convert 仍会复制整图，这里跳过
+            image = source_image if source_image.mode == 'RGB' else source_image.convert('RGB')
+
+            if raw_image:
+                image_payload = image
+            else:
+                if processor is None:
+                    raise RuntimeError("DeepSeek-OCR 处理器未初始化")
+                image_payload = processor.tokenize_with_images(
+                    images=[image],
+                    bos=True,
+                    eos=True,
+                    cropping=item.crop_mode,
+                    base_size=item.base_size,
+                    image_size=item.image_size,
+                )
+
+        if image_payload and '<image>' in prompt:
+            return {
+                "prompt": prompt,
+                "multi_modal_data": {"image": image_payload}
+            }, decode_peak_bytes
+        return {
+            "prompt": prompt
+        }, decode_peak_bytes
+
+    async def _inspect_image(self, item: InferenceItem, with_digest: bool = True) -> None:
+        """
+        在预处理池中读取图像文件的内容哈希与宽高并记录到条目上（每个请求只读一次）
+
+        Args:
+            item: 推理条目
+            with_digest: 是否计算内容哈希（启用结果缓存且调用方未提供时才需要）
+        """
+        if '<image>' not in item.prompt:
+            return
+        if item.image_data is not None:
+            item.image_dimensions = item.image_data.size
+            return
+        if not item.image_path:
+            return
+        with_digest = with_digest and self.result_cache is not None and item.image_digest is None
+        if not with_digest and item.image_dimensions is not None:
+            return
+        digest, size = await self.run_preprocess(_inspect_image_file, item.image_path, with_digest)
+        if digest is not None:
+            item.image_digest = digest
+        if item.image_dimensions is None:
+            item.image_dimensions = size
+
+    def _cache_key(self, item: InferenceItem, temperature: float, max_tokens: int) -> Optional[str]:
+        """
+        计算结果缓存键；纯文本请求、无法获取图像内容（文件哈希由 _inspect_image 预先计算）
+        或 temperature > 0（采样结果不可复现）时不缓存
+        """
+        if self.result_cache is None or '<image>' not in item.prompt or item.image_digest is None:
+            return None
+        if temperature > 0:
+            return None
+        return OcrResultCache.make_key(
+            item.image_digest,
+            item.prompt,
+            item.base_size,
+            item.image_size,
+            item.crop_mode,
+            self.model_path or "",
+            temperature=temperature,
+            max_tokens=max_tokens,
+        )
+
+    def _lookup_cache(
+        self, item: InferenceItem, temperature: float, max_tokens: int
+    ) -> tuple[Optional[str], Optional[str]]:
+        """返回 (缓存键, 命中的文本)"""
+        key = self._cache_key(item, temperature, max_tokens)
+        if key is None:
+            return None, None
+        if not item.use_cache:
+            metrics.increment("result_cache.bypass")
+            return key, None
+        return key, self.result_cache.get(key)
+
+    def _store_cache(self, key: Optional[str], text: str) -> None:
+        # 空结果通常意味着异常输出，不写入缓存以便重试
+        if key is not None and text and self.result_cache is not None:
+            self.result_cache.put(key, text)
+
+    def _store_result(self, key: Optional[str], result: InferenceResult) -> None:
+        # 截断的结果取决于检测阈值，不写入缓存
+        if result.truncated_reason is None:
+            self._store_cache(key, result.text)
+
+    @staticmethod
+    def _image_dimensions(item: InferenceItem) -> Optional[tuple[int, int]]:
+        """图像宽高（文件图像使用 _inspect_image 记录的结果，不在事件循环上读取文件）"""
+        if '<image>' not in item.prompt:
+            return None
+        if item.image_data is not None:
+            return item.image_data.size
+        return item.image_dimensions
+
+    def _estimate_image_bytes(self, item: InferenceItem) -> int:
+        """预估解码后的 RGB 像素字节数，用于限制预处理在途内存"""
+        size = self._image_dimensions(item)
+        return size[0] * size[1] * 3 if size else 0
+
+    def _estimate_prompt_tokens(self, item: InferenceItem) -> int:
+        """粗略估计请求的输入 token 数（文本按字符数取上界，图像按模式精确计算）"""
+        tokens = len(item.prompt)
+        size = self._image_dimensions(item)
+        if size is None:
+            return tokens
+        return tokens + count_image_tokens(
+            size[0],
+            size[1],
+            base_size=item.base_size,
+            image_size=item.image_size,
+            cropping=item.crop_mode,
+        )
+
+    def _reserve(self, item: InferenceItem, max_tokens: int) -> Optional[AdmissionTicket]:
+        """向准入控制预约排队位置；过载时抛出 AdmissionRejected"""
+        if self.admission is None:
+            return None
+        tokens = self.admission.estimate_tokens(self._estimate_prompt_tokens(item), max_tokens)
+        return self.admission.reserve(tokens, item.priority)
+
+    def _reserve_many(self, items: Sequence[InferenceItem], max_tokens: int) -> List[Optional[AdmissionTicket]]:
+        """整批预约排队位置（全部接纳或整体拒绝）；过载时抛出 AdmissionRejected"""
+        if self.admission is None:
+            return [None] * len(items)
+        return self.admission.reserve_many([
+            (self.admission.estimate_tokens(self._estimate_prompt_tokens(item), max_tokens), item.priority)
+            for item in items
+        ])
+
+    async def check_admission(
+        self,
+        prompt: str,
+        image_path: Optional[str] = None,
+        image_data: Optional[Image.Image] = None,
+        base_size: int = 1024,
+        image_size: int = 640,
+        crop_mode: bool = True,
+        max_tokens: int = 8192,
+        **kwargs
+    ) -> None:
+        """
+        预检当前能否接纳请求（不占用名额），过载时抛出 AdmissionRejected
+
+        流式接口在开始响应前调用，以便仍能返回 429/503 状态码。
+        """
+        if self.admission is None:
+            return
+        item = InferenceItem(
+            prompt=prompt,
+            image_path=image_path,
+            image_data=image_data,
+            base_size=base_size,
+            image_size=image_size,
+            crop_mode=crop_mode,
+        )
+        await self._inspect_image(item, with_digest=False)
+        self.admission.check(
+            self.admission.estimate_tokens(self._estimate_prompt_tokens(item), max_tokens)
+        )
+
+    def check_batch_admission(self, count: int, max_tokens: int = 8192) -> None:
+        """
+        批量请求在解码图像前的预检（不占用名额），过载时抛出 AdmissionRejected
+
+        图像尚未解码，token 只按输出估计取下界；infer_many 预约时再按图像尺寸精确检查。
+        """
+        if self.admission is None or count == 0:
+            return
+        self.admission.check(count * self.admission.estimate_tokens(0, max_tokens), count)
+
+    def _build_sampling_params(self, temperature: float, max_tokens: int) -> SamplingParams:
+        """创建采样参数"""
+        sampling_params_kwargs = dict(
+            temperature=temperature,
+            max_tokens=max_tokens,
+            skip_special_tokens=False,
+        )
+        # 防止重复 n-gram：legacy 按请求挂载处理器，v1 由引擎级批处理器按 extra_args 启用
+        if not self._use_v1_engine:
+            sampling_params_kwargs["logits_processors"] = [
+                NoRepeatNGramLogitsProcessor(
+                    ngram_size=NGRAM_SIZE,
+                    window_size=NGRAM_WINDOW_SIZE,
+                    whitelist_token_ids=set(NGRAM_WHITELIST_TOKEN_IDS),
+                )
+            ]
+        elif NoRepeatNGramBatchLogitsProcessor is not None:
+            sampling_params_kwargs["extra_args"] = {
+                "ngram_size": NGRAM_SIZE,
+                "window_size": NGRAM_WINDOW_SIZE,
+                "whitelist_token_ids": sorted(NGRAM_WHITELIST_TOKEN_IDS),
+            }
+
+        return SamplingParams(**sampling_params_kwargs)
+
+    async def _stream(
+        self,
+        request: dict,
+        sampling_params: SamplingParams,
+        request_id: Optional[str] = None,
+        priority: Priority = Priority.INTERACTIVE,
+    ) -> AsyncIterator[str]:
+        """提交请求并逐步产出新增文本"""
+        if request_id is None:
+            request_id = self._new_request_id()
+        generate_kwargs = {}
+        if self._priority_scheduling:
+            generate_kwargs["priority"] = int(priority)
+
+        # 执行推理（流式）；调用方取消、超时或异常退出时 abort，避免 GPU 继续为无人接收的请求解码
+        self._inflight.add(request_id)
+        finished = False
+        emitted = 0
+        try:
+            async for request_output in self.engine.generate(
+                request, sampling_params, request_id, **generate_kwargs
+            ):
+                if request_output.outputs:
+                    text = request_output.outputs[0].text
+                    if len(text) > emitted:
+                        delta = text[emitted:]
+                        emitted = len(text)
+                        yield delta
+                finished = request_output.finished
+        finally:
+            self._inflight.discard(request_id)
+            if not finished:
+                await asyncio.shield(self.abort(request_id))
+
+    async def _generate(
+        self,
+        request: dict,
+        sampling_params: SamplingParams,
+        request_id: Optional[str] = None,
+        priority: Priority = Priority.INTERACTIVE,
+    ) -> InferenceResult:
+        """提交请求并等待生成完成；检测到重复循环时中止请求并截断输出"""
+        chunks: List[str] = []
+        detector = self._new_detector()
+        async with aclosing(self._stream(request, sampling_params, request_id, priority)) as stream:
+            async for delta in stream:
+                chunks.append(delta)
+                if detector is not None and detector.feed(delta):
+                    # 退出迭代后 _stream 会中止引擎中的请求
+                    break
+        text = "".join(chunks)
+        if detector is not None and detector.reason is not None:
+            metrics.increment(f"repetition.truncated.{detector.reason}")
+            return InferenceResult(text=text[:detector.truncate_at], truncated_reason=detector.reason)
+        return InferenceResult(text=text)
+
+    def _new_detector(self) -> Optional[RepetitionDetector]:
+        if self.repetition is None:
+            return None
+        return RepetitionDetector(self.repetition)
+
+    @staticmethod
+    def _observe_latency(priority: Priority, start: float) -> None:
+        """记录按优先级划分的端到端推理耗时（含排队）"""
+        metrics.observe_ms(f"latency.{priority.label}", (time.perf_counter() - start) * 1000)
+
+    @staticmethod
+    def _new_request_id(prefix: str = "request") -> str:
+        """生成全局唯一的请求 ID"""
+        return f"{prefix}-{uuid.uuid4().hex}"
+
+    @property
+    def inflight_count(self) -> int:
+        """当前正在生成的请求数"""
+        return len(self._inflight)
+
+    async def abort(self, request_id: str) -> None:
+        """中止正在生成的请求，释放调度槽位与 KV cache"""
+        self._inflight.discard(request_id)
+        if self.engine is None:
+            return
+        try:
+            await self.engine.abort(request_id)
+        except Exception as e:
+            print(f"⚠️ 中止请求失败 {request_id}: {e}")
+
+    async def abort_all(self) -> None:
+        """中止全部在途请求"""
+        for request_id in list(self._inflight):
+            await self.abort(request_id)
+
+    async def infer(self, prompt: str, **kwargs) -> str:
+        """执行推理并只返回生成的文本（参数与 infer_result 相同）"""
+        result = await self.infer_result(prompt, **kwargs)
+        return result.text
+
+    async def infer_result(
         self,
         prompt: str,
         image_path: Optional[str] = None,
@@ -144,8 +743,12 @@ class VLLMDirectEngine:
         temperature: float = 0.0,
         max_tokens: int = 8192,
         test_compress: bool = False,
+        timeout: Optional[float] = None,
+        image_digest: Optional[str] = None,
+        use_cache: bool = True,
+        priority: Priority = Priority.INTERACTIVE,
         **kwargs
-    ) -> str:
+    ) -> InferenceResult:
         """
         执行推理
         
@@ -158,84 +761,221 @@ class VLLMDirectEngine:
             temperature: 采样温度
             max_tokens: 最大生成 token 数
             test_compress: 是否测试压缩
+            timeout: 生成超时时间（秒），超时后中止请求并抛出 asyncio.TimeoutError
+            image_digest: 图像内容哈希（可选，用于结果缓存）
+            use_cache: 是否读取结果缓存
+            priority: 请求优先级（排队与 vLLM 调度均按此排序）
             
         Returns:
-            生成的文本
+            推理结果；检测到重复循环时 truncated_reason 非空
         """
         if not self.is_loaded():
             raise RuntimeError("Engine 未加载，请先调用 load()")
-        
-        # 设置配置参数（运行时覆盖）
-        vllm_config.BASE_SIZE = base_size
-        vllm_config.IMAGE_SIZE = image_size
-        vllm_config.CROP_MODE = crop_mode
-        
-        # 处理图像（如果提供）
-        image_payload = None
-        source_image: Optional[Image.Image] = None
-        if image_data is not None:
-            source_image = image_data
-        elif image_path and '<image>' in prompt:
-            source_image = self._load_image(image_path)
-            if source_image is None:
-                raise ValueError(f"无法加载图像: {image_path}")
 
-        if source_image is not None and '<image>' in prompt:
-            image = source_image.convert('RGB')
+        item = InferenceItem(
+            prompt=prompt,
+            image_path=image_path,
+            image_data=image_data,
+            base_size=base_size,
+            image_size=image_size,
+            crop_mode=crop_mode,
+            image_digest=image_digest,
+            use_cache=use_cache,
+            priority=priority,
+        )
+        start = time.perf_counter()
+        await self._inspect_image(item)
+        cache_key, cached_text = self._lookup_cache(item, temperature, max_tokens)
+        if cached_text is not None:
+            return InferenceResult(text=cached_text)
 
-            if self._use_v1_engine:
-                image_payload = image
-            else:
-                processor = DeepseekOCRProcessor()
-                image_payload = processor.tokenize_with_images(
-                    images=[image],
-                    bos=True,
-                    eos=True,
-                    cropping=crop_mode
-                )
-        
-        # 创建采样参数
-        # NoRepeatNGramLogitsProcessor: 防止重复 n-gram
-        # whitelist_token_ids: <td>, </td> 标签允许重复
-        logits_processors = None
-        if not self._use_v1_engine:
-            logits_processors = [
-                NoRepeatNGramLogitsProcessor(
-                    ngram_size=30,
-                    window_size=90,
-                    whitelist_token_ids={128821, 128822}
-                )
-            ]
-        
-        sampling_params_kwargs = dict(
-            temperature=temperature,
-            max_tokens=max_tokens,
-            skip_special_tokens=False,
+        ticket = self._reserve(item, max_tokens)
+        sampling_params = self._build_sampling_params(temperature, max_tokens)
+
+        async def _run() -> InferenceResult:
+            # 排队等待执行槽位也计入超时
+            async with ticket or nullcontext():
+                request = await self._prepare_request(item)
+                return await self._generate(request, sampling_params, priority=item.priority)
+
+        try:
+            result = await (asyncio.wait_for(_run(), timeout) if timeout else _run())
+        finally:
+            if ticket is not None:
+                ticket.release()
+        self._observe_latency(item.priority, start)
+        self._store_result(cache_key, result)
+        return result
+
+    async def infer_stream(
+        self,
+        prompt: str,
+        image_path: Optional[str] = None,
+        image_data: Optional[Image.Image] = None,
+        base_size: int = 1024,
+        image_size: int = 640,
+        crop_mode: bool = True,
+        temperature: float = 0.0,
+        max_tokens: int = 8192,
+        image_digest: Optional[str] = None,
+        use_cache: bool = True,
+        priority: Priority = Priority.INTERACTIVE,
+        timeout: Optional[float] = None,
+        result: Optional[InferenceResult] = None,
+        **kwargs
+    ) -> AsyncIterator[str]:
+        """
+        流式推理：随生成逐步产出新增文本
+
+        参数与 infer 相同。调用方提前结束迭代（或连接断开导致取消）时，
+        请求会被中止；建议使用 contextlib.aclosing 包裹以确保及时清理。
+        检测到重复循环时提前结束（已产出的片段无法撤回）；流正常结束后完整文本（截止到循环开始处）
+        与 truncated_reason 写入调用方传入的 result。
+        timeout 与 infer_result 口径相同（从调用开始计时，含排队、预处理与生成），到期后中止请求并抛出
+        asyncio.TimeoutError；超时只在等待引擎时触发，不会打断调用方处理产出片段。
+
+        Yields:
+            新增的文本片段
+        """
+        if not self.is_loaded():
+            raise RuntimeError("Engine 未加载，请先调用 load()")
+
+        item = InferenceItem(
+            prompt=prompt,
+            image_path=image_path,
+            image_data=image_data,
+            base_size=base_size,
+            image_size=image_size,
+            crop_mode=crop_mode,
+            image_digest=image_digest,
+            use_cache=use_cache,
+            priority=priority,
         )
-        if logits_processors is not None:
-            sampling_params_kwargs["logits_processors"] = logits_processors
-        
-        sampling_params = SamplingParams(**sampling_params_kwargs)
-        
-        # 构建请求
-        request_id = f"request-{int(time.time() * 1000)}"
-        
-        if image_payload and '<image>' in prompt:
-            request = {
-                "prompt": prompt,
-                "multi_modal_data": {"image": image_payload}
-            }
-        else:
-            request = {
-                "prompt": prompt
-            }
-        
-        # 执行推理（流式）
-        full_text = ""
-        async for request_output in self.engine.generate(
-            request, sampling_params, request_id
-        ):
-            if request_output.outputs:
-                full_text = request_output.outputs[0].text
-        
-        return full_text
+        start = time.perf_counter()
+        await self._inspect_image(item)
+        cache_key, cached_text = self._lookup_cache(item, temperature, max_tokens)
+        if cached_text is not None:
+            if result is not None:
+                result.text = cached_text
+            yield cached_text
+            return
+
+        ticket = self._reserve(item, max_tokens)
+        sampling_params = self._build_sampling_params(temperature, max_tokens)
+        deadline = asyncio.get_running_loop().time() + timeout if timeout else None
+        chunks: List[str] = []
+        detector = self._new_detector()
+        try:
+            # 超时只包住等待引擎的部分：生成器挂起在 yield 时运行的是调用方的代码，不能在其上触发取消
+            async with asyncio.timeout_at(deadline):
+                if ticket is not None:
+                    await ticket.acquire()
+                request = await self._prepare_request(item)
+            stream = self._stream(request, sampling_params, priority=item.priority)
+            async with aclosing(stream):
+                while True:
+                    # 超时取消 _stream 时由其 finally 中止引擎中的请求
+                    async with asyncio.timeout_at(deadline):
+                        try:
+                            delta = await anext(stream)
+                        except StopAsyncIteration:
+                            break
+                    chunks.append(delta)
+                    yield delta
+                    if detector is not None and detector.feed(delta):
+                        break
+        finally:
+            if ticket is not None:
+                ticket.release()
+        self._observe_latency(item.priority, start)
+        text = "".join(chunks)
+        if detector is not None and detector.reason is not None:
+            metrics.increment(f"repetition.truncated.{detector.reason}")
+            if result is not None:
+                result.text = text[:detector.truncate_at]
+                result.truncated_reason = detector.reason
+            return
+        if result is not None:
+            result.text = text
+        self._store_cache(cache_key, text)
+
+    async def infer_many(
+        self,
+        items: Sequence[InferenceItem],
+        temperature: float = 0.0,
+        max_tokens: int = 8192,
+        timeout: Optional[float] = None,
+    ) -> List[InferenceResult]:
+        """
+        批量推理：整批一次性预约准入，各条目获得执行槽位后预处理并提交，由 vLLM 调度器合并为同一批次
+
+        Args:
+            items: 推理条目列表
+            temperature: 采样温度
+            max_tokens: 最大生成 token 数
+            timeout: 单个条目的超时时间（秒，含排队与预处理）
+
+        Returns:
+            与输入顺序一致的结果列表，单个条目失败不影响其它条目
+
+        Raises:
+            AdmissionRejected: 整批无法接纳（排队过深 / token 积压过大 / 条目数超过队列上限）
+        """
+        if not self.is_loaded():
+            raise RuntimeError("Engine 未加载，请先调用 load()")
+
+        inspections = await asyncio.gather(
+            *(self._inspect_image(item) for item in items), return_exceptions=True
+        )
+        results: List[Optional[InferenceResult]] = [None] * len(items)
+        cache_keys: List[Optional[str]] = []
+        pending: List[int] = []
+        for index, (item, inspection) in enumerate(zip(items, inspections)):
+            # 读取失败（文件缺失 / 无法识别的图像）只影响该条目，不占用准入名额
+            if isinstance(inspection, BaseException):
+                results[index] = InferenceResult(error=f"{type(inspection).__name__}: {inspection}")
+                cache_keys.append(None)
+                continue
+            cache_key, cached_text = self._lookup_cache(item, temperature, max_tokens)
+            cache_keys.append(cache_key)
+            if cached_text is not None:
+                results[index] = InferenceResult(text=cached_text)
+            else:
+                pending.append(index)
+
+        # 整批预约：要么全部排队，要么整体拒绝（由调用方返回 429/503），不会占满队列后逐条失败
+        tickets = self._reserve_many([items[index] for index in pending], max_tokens)
+        sampling_params = self._build_sampling_params(temperature, max_tokens)
+        batch_id = self._new_request_id("batch")
+        start = time.perf_counter()
+
+        async def _run(index: int, ticket: Optional[AdmissionTicket]) -> InferenceResult:
+            item = items[index]
+
+            async def _generate_admitted() -> InferenceResult:
+                # 与 infer_result 相同：获得执行槽位后才预处理，在途像素张量数受并发上限约束
+                async with ticket or nullcontext():
+                    request = await self._prepare_request(item)
+                    return await self._generate(request, sampling_params, f"{batch_id}-{index}", item.priority)
+
+            try:
+                generation = _generate_admitted()
+                result = await (asyncio.wait_for(generation, timeout) if timeout else generation)
+            except Exception as exc:
+                return InferenceResult(error=f"{type(exc).__name__}: {exc}")
+            finally:
+                if ticket is not None:
+                    ticket.release()
+            self._observe_latency(item.priority, start)
+            self._store_result(cache_keys[index], result)
+            return result
+
+        try:
+            outcomes = await asyncio.gather(*(_run(index, ticket) for index, ticket in zip(pending, tickets)))
+        finally:
+            for ticket in tickets:
+                if ticket is not None:
+                    ticket.release()
+        for index, result in zip(pending, outcomes):
+            results[index] = result
+        return results
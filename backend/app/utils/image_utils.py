@@ -3,10 +3,33 @@
 """
 import tempfile
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import IO, Callable, Optional, Tuple, Union
 from PIL import Image
 
 
+# EXIF Orientation -> 对应的 transpose 操作（与 ImageOps.exif_transpose 相同）
+_EXIF_ORIENTATION_TAG = 0x0112
+_EXIF_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+# Image.reduce 不支持的模式 -> 先转换到的模式（与直接 convert("RGB") 的结果一致）
+_REDUCE_CONVERT = {
+    "1": "L",
+    "P": "RGB",
+    "I;16": "I",
+    "I;16B": "I",
+    "I;16L": "I",
+    "I;16N": "I",
+}
+
+
 class ImageUtils:
     """图像处理工具类"""
     
@@ -69,3 +92,74 @@ class ImageUtils:
             return True
         except Exception:
             return False
+
+    @staticmethod
+    def pixel_nbytes(image: Image.Image) -> int:
+        """估算图像像素占用的内存（PIL 以每像素 4 字节存储多通道图像）"""
+        width, height = image.size
+        if image.mode in ("1", "L", "P"):
+            return width * height
+        if image.mode in ("LA", "PA", "I;16", "I;16B", "I;16L"):
+            return width * height * 2
+        return width * height * 4
+
+    @staticmethod
+    def decode_reduced(
+        source: Union[str, IO[bytes]],
+        reduction_factor: Callable[[int, int], int],
+    ) -> Tuple[Image.Image, int]:
+        """
+        以有限内存解码图像：按需降采样、按 EXIF 旋转并转换为 RGB
+
+        reduction_factor 接收 EXIF 旋转后的 (宽, 高)，返回 2 的幂次降采样倍数。
+        JPEG 通过 draft 在解码阶段直接按 1/2、1/4、1/8 输出 RGB；其它格式完整解码后 reduce。
+        旋转与模式转换都在缩小后的图像上进行，每一步的中间结果立即释放。
+
+        Args:
+            source: 图像文件路径或二进制文件对象
+            reduction_factor: 降采样倍数计算函数
+
+        Returns:
+            (RGB 图像, 解码过程中同时存活的像素字节峰值)
+        """
+        image = Image.open(source)
+        orientation = image.getexif().get(_EXIF_ORIENTATION_TAG, 1)
+        # TIFF 插件打开时已按方向交换尺寸、load 时原地旋转，不再重复处理
+        if image.format == "TIFF":
+            orientation = 1
+        width, height = image.size
+        oriented = (height, width) if orientation in (5, 6, 7, 8) else (width, height)
+        factor = max(int(reduction_factor(*oriented)), 1)
+
+        if factor > 1 and image.format == "JPEG":
+            image.draft("RGB", (width // factor, height // factor))
+        image.load()
+        current = ImageUtils.pixel_nbytes(image)
+        peak = current
+
+        def replace(new_image: Image.Image) -> Image.Image:
+            nonlocal current, peak
+            new_bytes = ImageUtils.pixel_nbytes(new_image)
+            peak = max(peak, current + new_bytes)
+            current = new_bytes
+            image.close()
+            return new_image
+
+        # draft 只能按 1/2、1/4、1/8 缩小，剩余倍数（及非 JPEG 的全部倍数）用 reduce 补足
+        residual = factor * image.size[0] // width
+        if residual > 1:
+            # 调色板 / 1 位 / 16 位图像不能直接 reduce，先转换到支持的模式
+            if image.mode in _REDUCE_CONVERT:
+                image = replace(image.convert(_REDUCE_CONVERT[image.mode]))
+            image = replace(image.reduce(residual))
+
+        transpose = _EXIF_TRANSPOSE.get(orientation)
+        # 单字节模式先旋转再转 RGB，旋转的副本更小
+        if transpose is not None and image.mode in ("1", "L", "P"):
+            image = replace(image.transpose(transpose))
+            transpose = None
+        if image.mode != "RGB":
+            image = replace(image.convert("RGB"))
+        if transpose is not None:
+            image = replace(image.transpose(transpose))
+        return image, peak
@@ -3,6 +3,7 @@ DeepSeek OCR 配置文件
 适配后端应用使用
 """
 import os
+from typing import NamedTuple
 
 # 模型配置模式参考：
 # Tiny: base_size=512, image_size=512, crop_mode=False
@@ -17,6 +18,53 @@ IMAGE_SIZE = int(os.environ.get('IMAGE_SIZE', '640'))
 CROP_MODE = os.environ.get('CROP_MODE', 'True').lower() in ('true', '1', 'yes')
 MIN_CROPS = 2
 MAX_CROPS = 9  # 最大值为9，如果 GPU 内存较小建议设为6
+# 以 uint8 传输像素、在模型侧归一化（主机内存与多模态 IPC 字节减少为 1/4）
+PIXEL_TRANSPORT_UINT8 = os.environ.get('PIXEL_TRANSPORT_UINT8', 'False').lower() in ('true', '1', 'yes')
+# 与 DeepseekOCRProcessor 默认的 image_mean / image_std 一致
+IMAGE_MEAN = (0.5, 0.5, 0.5)
+IMAGE_STD = (0.5, 0.5, 0.5)
+# 视觉编码器单次前向的最大视图数（全局视图 / 局部切块分别计），0 表示不分块
+VISION_ENCODER_MAX_BATCH = int(os.environ.get('VISION_ENCODER_MAX_BATCH', '64'))
+# 视觉编码器 torch.compile 模式（off / default / reduce-overhead），在模型构建时读取，见 vision_compile_mode()
+VISION_COMPILE_MODES = ('off', 'default', 'reduce-overhead')
+# 编译预热的视图边长：640 切块与 1024 / 1280 全局视图
+VISION_COMPILE_SHAPES = (640, 1024, 1280)
+
+
+def vision_compile_mode() -> str:
+    """读取视觉编码器编译模式；引擎 load() 在创建 vLLM 引擎前写入环境变量，这里在模型构建时才读取"""
+    mode = os.environ.get('VISION_COMPILE_MODE', 'off').strip().lower()
+    if mode not in VISION_COMPILE_MODES:
+        raise ValueError(f"VISION_COMPILE_MODE 必须是 {VISION_COMPILE_MODES} 之一，当前为 {mode!r}")
+    return mode
+
+
+def vision_embed_cache_bytes() -> int:
+    """视觉特征缓存容量（字节），默认 0 关闭；与编译模式一样在构建处理器 / 模型时才读取环境变量"""
+    megabytes = int(os.environ.get('VISION_EMBED_CACHE_MB', '0'))
+    if megabytes < 0:
+        raise ValueError(f"VISION_EMBED_CACHE_MB 不能为负数，当前为 {megabytes}")
+    return megabytes * 1024 * 1024
+
+
+class OcrMode(NamedTuple):
+    """单个请求的图像处理模式，随请求显式传递，避免并发请求改写模块级全局变量"""
+
+    base_size: int
+    image_size: int
+    crop_mode: bool
+
+
+OCR_MODES = {
+    'tiny': OcrMode(base_size=512, image_size=512, crop_mode=False),
+    'small': OcrMode(base_size=640, image_size=640, crop_mode=False),
+    'base': OcrMode(base_size=1024, image_size=1024, crop_mode=False),
+    'large': OcrMode(base_size=1280, image_size=1280, crop_mode=False),
+    'gundam': OcrMode(base_size=1024, image_size=640, crop_mode=True),
+}
+
+# 未显式指定模式时使用的默认值（来自环境变量）
+DEFAULT_MODE = OcrMode(base_size=BASE_SIZE, image_size=IMAGE_SIZE, crop_mode=CROP_MODE)
 
 # 推理引擎参数
 MAX_CONCURRENCY = 200  # 最大并发数，GPU 内存有限时请降低
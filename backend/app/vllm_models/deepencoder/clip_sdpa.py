@@ -7,6 +7,8 @@ import torch
 from torch.nn import functional as F
 from torch import nn
 
+from .pos_cache import PositionCache
+
 # flash_attn 是可选的，如果没有就使用标准的 PyTorch SDPA
 try:
     from flash_attn import flash_attn_qkvpacked_func, flash_attn_func
@@ -135,6 +137,8 @@ class CLIPVisionEmbeddings(nn.Module):
         self.register_buffer(
             "position_ids", torch.arange(self.num_positions).expand((1, -1))
         )
+        # 按目标 token 数缓存插值后的位置编码（640 切块与 1024 全局视图都与预训练网格不同）
+        self._pos_cache = PositionCache()
 
     def forward(self, pixel_values, patch_embeds):
         batch_size = pixel_values.shape[0]
@@ -159,10 +163,18 @@ class CLIPVisionEmbeddings(nn.Module):
         embeddings = torch.cat([class_embeds, patch_embeds], dim=1)
 
         # x = torch.cat([cls_token, x], dim=1)
-        embeddings = embeddings + get_abs_pos(self.position_embedding(self.position_ids), embeddings.size(1))
+        embeddings = embeddings + self.abs_pos_embed(embeddings.size(1))
         # embeddings = embeddings + self.position_embedding(self.position_ids)
         return embeddings
 
+    def abs_pos_embed(self, tgt_size: int) -> torch.Tensor:
+        weight = self.position_embedding.weight
+        return self._pos_cache.get(
+            weight,
+            (tgt_size, weight.dtype, weight.device),
+            lambda: get_abs_pos(self.position_embedding(self.position_ids), tgt_size),
+        )
+
 
 class NoTPFeedForward(nn.Module):
     def __init__(
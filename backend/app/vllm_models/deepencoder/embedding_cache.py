@@ -0,0 +1,97 @@
+"""
+投影后视觉特征缓存
+
+同一张图像换提示词（Free OCR / grounding markdown / describe）或重复提交时，
+SAM -> CLIP -> projector 的输出完全相同。处理器对预处理后的像素与模式做内容摘要，
+模型在编码前按摘要查找，命中时跳过整个视觉编码器。条目按字节数 LRU 淘汰；
+重新加载权重后需调用 clear()。
+
+缓存张量与视觉编码器在同一设备上，不在 vLLM 按 gpu_memory_utilization 划定的显存预算内，
+启用时需为其预留同等大小的显存余量。
+"""
+from collections import OrderedDict
+from typing import Hashable, List, Optional, Sequence, Tuple, Union
+
+import torch
+
+from ...services.metrics import metrics
+
+
+def read_image_keys(image_digests: Union[torch.Tensor, Sequence[torch.Tensor], None],
+                    num_images: int) -> List[Optional[Tuple[int, ...]]]:
+    """读取每张图像的摘要键；字段缺失、数量不符或全零（处理器未计算摘要）时为 None"""
+    if image_digests is None:
+        return [None] * num_images
+    if isinstance(image_digests, torch.Tensor):
+        rows = image_digests.reshape(image_digests.size(0), -1).tolist()
+    else:
+        rows = [torch.as_tensor(row).reshape(-1).tolist() for row in image_digests]
+    if len(rows) != num_images:
+        return [None] * num_images
+    return [tuple(row) if any(row) else None for row in rows]
+
+
+class VisionEmbeddingCache:
+    """
+    按图像摘要寻址的视觉特征 LRU，容量按张量字节数计
+
+    只在模型前向中（单线程）访问，不加锁。命中 / 未命中 / 淘汰计入进程内 metrics，
+    指标名以 name 为前缀，模型内缓存与独立视觉编码阶段的缓存互不覆盖。
+    """
+
+    def __init__(self, max_bytes: int, name: str = "vision_cache") -> None:
+        self.max_bytes = max(max_bytes, 0)
+        self.name = name
+        self._entries: "OrderedDict[Hashable, torch.Tensor]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @property
+    def nbytes(self) -> int:
+        return self._bytes
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[torch.Tensor]:
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            metrics.increment(f"{self.name}.hits")
+        else:
+            self.misses += 1
+            metrics.increment(f"{self.name}.misses")
+        metrics.set_gauge(f"{self.name}.hit_rate", self.hits / (self.hits + self.misses))
+        return value
+
+    def put(self, key: Hashable, value: torch.Tensor) -> None:
+        size = value.numel() * value.element_size()
+        if size > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= previous.numel() * previous.element_size()
+        self._entries[key] = value
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.numel() * evicted.element_size()
+            self.evictions += 1
+            metrics.increment(f"{self.name}.evictions")
+        self._report_size()
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._bytes = 0
+        self._report_size()
+
+    def _report_size(self) -> None:
+        metrics.set_gauge(f"{self.name}.entries", len(self._entries))
+        metrics.set_gauge(f"{self.name}.bytes", self._bytes)
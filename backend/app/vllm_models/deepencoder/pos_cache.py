@@ -0,0 +1,46 @@
+"""
+由参数派生的位置编码缓存
+
+插值后的绝对位置编码只取决于源参数与 (目标尺寸, dtype, device)，推理时按键缓存，避免每次前向重新插值。
+load_weights 通过 param.data.copy_ 原地写入权重，不改变 data_ptr / _version，
+因此重新加载权重后必须调用 clear_position_caches(model) 显式失效。
+"""
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+import torch
+import torch.nn as nn
+
+
+class PositionCache:
+
+    def __init__(self) -> None:
+        self._entries: Dict[Hashable, torch.Tensor] = {}
+        self._source: Optional[Tuple[int, int]] = None
+
+    def get(self, source: torch.Tensor, key: Hashable, compute: Callable[[], torch.Tensor]) -> torch.Tensor:
+        """返回 compute() 的缓存结果；需要梯度或处于 torch.compile 追踪中时不缓存，源参数被替换（如 .to()）时自动清空"""
+        if (torch.is_grad_enabled() and source.requires_grad) or torch.compiler.is_compiling():
+            return compute()
+        source_id = (source.data_ptr(), source._version)
+        if source_id != self._source:
+            self._entries.clear()
+            self._source = source_id
+        value = self._entries.get(key)
+        if value is None:
+            value = self._entries[key] = compute()
+        return value
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._source = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def clear_position_caches(model: nn.Module) -> None:
+    """清空模型内所有子模块持有的 PositionCache（权重重新加载后调用）"""
+    for module in model.modules():
+        for value in vars(module).values():
+            if isinstance(value, PositionCache):
+                value.clear()
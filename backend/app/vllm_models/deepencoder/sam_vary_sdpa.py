@@ -9,7 +9,9 @@ import torch.nn as nn
 import torch.nn.functional as F
 
 from typing import Optional, Tuple, Type
-from functools import partial
+from functools import lru_cache, partial
+
+from .pos_cache import PositionCache
 
 # flash_attn 是可选的，如果没有就使用标准的 PyTorch SDPA
 try:
@@ -135,6 +137,8 @@ class ImageEncoderViT(nn.Module):
             self.pos_embed = nn.Parameter(
                 torch.zeros(1, img_size // patch_size, img_size // patch_size, embed_dim)
             )
+        # 按目标网格缓存插值后的位置编码
+        self._pos_cache = PositionCache()
 
         self.blocks = nn.ModuleList()
         for i in range(depth):
@@ -177,7 +181,11 @@ class ImageEncoderViT(nn.Module):
         x = self.patch_embed(x)
         if self.pos_embed is not None:
             # x = x + self.pos_embed
-            x = x + get_abs_pos(self.pos_embed, x.size(1))
+            x = x + self._pos_cache.get(
+                self.pos_embed,
+                (x.size(1), self.pos_embed.dtype, self.pos_embed.device),
+                lambda: get_abs_pos(self.pos_embed, x.size(1)),
+            )
 
         for blk in self.blocks:
             x = blk(x)
@@ -294,6 +302,9 @@ class Attention(nn.Module):
             # initialize relative positional embeddings
             self.rel_pos_h = nn.Parameter(torch.zeros(2 * input_size[0] - 1, head_dim))
             self.rel_pos_w = nn.Parameter(torch.zeros(2 * input_size[1] - 1, head_dim))
+            # 按 (q_size, k_size, dtype, device) 缓存插值 + 按相对位置取出的表，窗口与全局网格在每种模式下固定
+            self._rel_pos_h_cache = PositionCache()
+            self._rel_pos_w_cache = PositionCache()
 
     def forward(self, x: torch.Tensor) -> torch.Tensor:
         B, H, W, _ = x.shape
@@ -304,7 +315,17 @@ class Attention(nn.Module):
 
         rel_h, rel_w = None, None
         if self.use_rel_pos:
-            rel_h, rel_w = add_decomposed_rel_pos(q, self.rel_pos_h, self.rel_pos_w, (H, W), (H, W))
+            Rh = self._rel_pos_h_cache.get(
+                self.rel_pos_h,
+                (H, H, self.rel_pos_h.dtype, self.rel_pos_h.device),
+                lambda: get_rel_pos(H, H, self.rel_pos_h),
+            )
+            Rw = self._rel_pos_w_cache.get(
+                self.rel_pos_w,
+                (W, W, self.rel_pos_w.dtype, self.rel_pos_w.device),
+                lambda: get_rel_pos(W, W, self.rel_pos_w),
+            )
+            rel_h, rel_w = decomposed_rel_pos(q, Rh, Rw, (H, W), (H, W))
 
         q = q.view(B, self.num_heads, H * W, -1)
         k = k.view(B, self.num_heads, H * W, -1)
@@ -406,12 +427,26 @@ def get_rel_pos(q_size: int, k_size: int, rel_pos: torch.Tensor) -> torch.Tensor
     else:
         rel_pos_resized = rel_pos
 
+    if torch.compiler.is_compiling():
+        # 编译时下标表作为图内常量计算，不经过 Python 缓存
+        return rel_pos_resized[_build_rel_pos_index(q_size, k_size, rel_pos.device)]
+    return rel_pos_resized[rel_pos_index(q_size, k_size, rel_pos.device)]
+
+
+def _build_rel_pos_index(q_size: int, k_size: int, device: torch.device) -> torch.Tensor:
     # Scale the coords with short length if shapes for q and k are different.
-    q_coords = torch.arange(q_size, device=rel_pos.device)[:, None] * max(k_size / q_size, 1.0)
-    k_coords = torch.arange(k_size, device=rel_pos.device)[None, :] * max(q_size / k_size, 1.0)
+    q_coords = torch.arange(q_size, device=device)[:, None] * max(k_size / q_size, 1.0)
+    k_coords = torch.arange(k_size, device=device)[None, :] * max(q_size / k_size, 1.0)
     relative_coords = (q_coords - k_coords) + (k_size - 1) * max(q_size / k_size, 1.0)
+    return relative_coords.long()
 
-    return rel_pos_resized[relative_coords.long()]
+
+@lru_cache(maxsize=64)
+def rel_pos_index(q_size: int, k_size: int, device: torch.device) -> torch.Tensor:
+    """(q_size, k_size) 的相对位置下标表，只依赖尺寸与设备，按键缓存（调用方不得原地修改）"""
+    # 在 inference_mode 中首次调用时也创建普通张量，避免之后在需要梯度的前向中无法用作索引
+    with torch.inference_mode(False):
+        return _build_rel_pos_index(q_size, k_size, device)
 
 
 def add_decomposed_rel_pos(
@@ -438,7 +473,30 @@ def add_decomposed_rel_pos(
     k_h, k_w = k_size
     Rh = get_rel_pos(q_h, k_h, rel_pos_h)
     Rw = get_rel_pos(q_w, k_w, rel_pos_w)
+    return decomposed_rel_pos(q, Rh, Rw, q_size, k_size)
+
 
+def decomposed_rel_pos(
+    q: torch.Tensor,
+    Rh: torch.Tensor,
+    Rw: torch.Tensor,
+    q_size: Tuple[int, int],
+    k_size: Tuple[int, int],
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    add_decomposed_rel_pos 的后半部分：使用已经取出的相对位置表（get_rel_pos 的结果，可缓存）。
+    Args:
+        q (Tensor): query q in the attention layer with shape (B, q_h * q_w, C).
+        Rh (Tensor): height-axis table with shape (q_h, k_h, C).
+        Rw (Tensor): width-axis table with shape (q_w, k_w, C).
+        q_size (Tuple): spatial sequence size of query q with (q_h, q_w).
+        k_size (Tuple): spatial sequence size of key k with (k_h, k_w).
+
+    Returns:
+        (rel_h, rel_w) with shapes (B, q_h * q_w, k_h, 1) and (B, q_h * q_w, 1, k_w).
+    """
+    q_h, q_w = q_size
+    k_h, k_w = k_size
     B, _, dim = q.shape
     r_q = q.reshape(B, q_h, q_w, dim)
     rel_h = torch.einsum("bhwc,hkc->bhwk", r_q, Rh)
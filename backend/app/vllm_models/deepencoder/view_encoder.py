@@ -0,0 +1,324 @@
+"""
+全局视图 / 局部切块的批量编码
+
+调度器一个批次内的多张图像按视图尺寸分组，每组只做一次 SAM -> CLIP -> projector 前向，
+再按原有布局（每行末尾 image_newline，局部在前、全局在后、最后 view_seperator）拆回每张图像。
+不依赖 vLLM，可在 CPU 上用随机权重与逐图实现对比。
+"""
+import time
+from functools import lru_cache
+from typing import Callable, Dict, Hashable, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+import torch
+import torch.nn as nn
+
+from ..config import (IMAGE_MEAN, IMAGE_STD, PRINT_NUM_VIS_TOKENS, VISION_COMPILE_MODES,
+                      VISION_ENCODER_MAX_BATCH)
+from .embedding_cache import VisionEmbeddingCache
+
+
+def to_model_pixels(pixels: torch.Tensor, dtype: torch.dtype = torch.bfloat16) -> torch.Tensor:
+    """转为模型精度；uint8 输入在设备上归一化，运算顺序与处理器的 ToTensor + Normalize 相同"""
+    if pixels.dtype != torch.uint8:
+        return pixels.to(dtype)
+    mean = pixels.new_tensor(IMAGE_MEAN, dtype=torch.float32).view(-1, 1, 1)
+    std = pixels.new_tensor(IMAGE_STD, dtype=torch.float32).view(-1, 1, 1)
+    return pixels.to(torch.float32).div_(255).sub_(mean).div_(std).to(dtype)
+
+
+def encode_views(
+    sam_model: nn.Module,
+    vision_model: nn.Module,
+    projector: nn.Module,
+    views: torch.Tensor,
+    max_batch: int = VISION_ENCODER_MAX_BATCH,
+) -> torch.Tensor:
+    """views: [N, 3, H, W] -> [N, hw, n_dim]；N 超过 max_batch 时分块前向以限制激活显存"""
+    if max_batch <= 0 or views.size(0) <= max_batch:
+        features_1 = sam_model(views)
+        features_2 = vision_model(views, features_1)
+        features = torch.cat((features_2[:, 1:], features_1.flatten(2).permute(0, 2, 1)), dim=-1)
+        return projector(features)
+    return torch.cat([
+        encode_views(sam_model, vision_model, projector, chunk, max_batch)
+        for chunk in views.split(max_batch)
+    ])
+
+
+class VisionEncoderRunner:
+    """
+    SAM -> CLIP -> projector 的执行入口，可选 torch.compile
+
+    视图边长固定为少数几种（640 切块、1024 / 1280 全局视图），编译时只把 batch 维标为动态，
+    边长保持静态；reduce-overhead（CUDA graph）模式下 batch 补齐到 2 的幂，限制录制的图数量。
+    编译或编译后执行失败时打印原因并永久退回 eager。
+    """
+
+    def __init__(
+        self,
+        sam_model: nn.Module,
+        vision_model: nn.Module,
+        projector: nn.Module,
+        compile_mode: str = "off",
+        max_batch: int = VISION_ENCODER_MAX_BATCH,
+        backend: Union[str, Callable] = "inductor",
+    ) -> None:
+        if compile_mode not in VISION_COMPILE_MODES:
+            raise ValueError(f"未知的视觉编码器编译模式: {compile_mode}")
+        self.sam_model = sam_model
+        self.vision_model = vision_model
+        self.projector = projector
+        self.compile_mode = compile_mode
+        self.max_batch = max_batch
+        self._compiled: Optional[Callable[[torch.Tensor], torch.Tensor]] = None
+        if compile_mode != "off":
+            options = {"mode": compile_mode} if compile_mode == "reduce-overhead" else {}
+            self._compiled = torch.compile(self._forward, backend=backend, **options)
+
+    @property
+    def compiled(self) -> bool:
+        return self._compiled is not None
+
+    def _forward(self, views: torch.Tensor) -> torch.Tensor:
+        return encode_views(self.sam_model, self.vision_model, self.projector, views, max_batch=0)
+
+    def _bucket(self, batch: int) -> int:
+        bucket = 1 << (batch - 1).bit_length()
+        return min(bucket, self.max_batch) if self.max_batch > 0 else bucket
+
+    def _run_compiled(self, views: torch.Tensor) -> torch.Tensor:
+        batch = views.size(0)
+        graphs = self.compile_mode == "reduce-overhead"
+        if graphs:
+            bucket = self._bucket(batch)
+            if bucket > batch:
+                views = torch.cat([views, views.new_zeros((bucket - batch, *views.shape[1:]))])
+            # 每次调用都是新的 CUDA graph 代次：输出位于图的静态缓冲区，下一次调用会覆盖，返回前复制
+            torch.compiler.cudagraph_mark_step_begin()
+        torch._dynamo.maybe_mark_dynamic(views, 0)
+        features = self._compiled(views)
+        if features.size(0) != batch:
+            features = features[:batch]
+        return features.clone() if graphs else features
+
+    def __call__(self, views: torch.Tensor) -> torch.Tensor:
+        """views: [N, 3, H, W] -> [N, hw, n_dim]，N 超过 max_batch 时分块执行"""
+        if self.max_batch > 0 and views.size(0) > self.max_batch:
+            return torch.cat([self(chunk) for chunk in views.split(self.max_batch)])
+        if self._compiled is not None:
+            try:
+                return self._run_compiled(views)
+            except Exception as exc:
+                print(f"⚠️ 视觉编码器编译执行失败，回退到 eager: {type(exc).__name__}: {exc}")
+                self._compiled = None
+        return self._forward(views)
+
+    def warmup_batches(self) -> List[int]:
+        """
+        预热的 batch 大小：default 模式 batch 维动态，1 与 2 各编译一次即可；
+        reduce-overhead 模式每个补齐档位（2 的幂，直到 max_batch）各录制一张 CUDA graph，全部在加载阶段完成
+        """
+        if self.compile_mode != "reduce-overhead":
+            return [1, 2]
+        limit = self.max_batch if self.max_batch > 0 else VISION_ENCODER_MAX_BATCH
+        return sorted({self._bucket(1 << shift) for shift in range(max(limit - 1, 0).bit_length() + 1)})
+
+    def warmup(self, sizes: Sequence[int], device: torch.device, dtype: torch.dtype) -> None:
+        """在加载阶段按固定视图边长与 warmup_batches() 触发编译 / CUDA graph 录制，避免落在线上请求上"""
+        if self._compiled is None:
+            return
+        # CUDA graph 在同一输入形状的第二次调用时录制
+        rounds = 2 if self.compile_mode == "reduce-overhead" else 1
+        for size in sizes:
+            for batch in self.warmup_batches():
+                start = time.perf_counter()
+                with torch.no_grad():
+                    for _ in range(rounds):
+                        self(torch.zeros((batch, 3, size, size), device=device, dtype=dtype))
+                if self._compiled is None:
+                    return
+                print(f"🔥 视觉编码器预热 {size}px x{batch}: {time.perf_counter() - start:.1f}s")
+
+
+def encode_grouped(
+    encode: Callable[[torch.Tensor], torch.Tensor],
+    views: Sequence[Optional[torch.Tensor]],
+    prepare: Callable[[torch.Tensor], torch.Tensor] = lambda x: x,
+) -> List[Optional[torch.Tensor]]:
+    """
+    views[i] 为第 i 张图像的 [n_i, 3, H, W] 视图（None 表示没有），同尺寸的视图拼成一个批次编码
+
+    Returns:
+        与 views 对应的 [n_i, hw, n_dim] 特征列表
+    """
+    groups: Dict[Tuple[int, ...], List[int]] = {}
+    for index, view in enumerate(views):
+        if view is not None:
+            groups.setdefault(tuple(view.shape[1:]), []).append(index)
+
+    outputs: List[Optional[torch.Tensor]] = [None] * len(views)
+    for indices in groups.values():
+        batch = views[indices[0]] if len(indices) == 1 else torch.cat([views[i] for i in indices])
+        features = encode(prepare(batch))
+        for index, chunk in zip(indices, features.split([views[i].size(0) for i in indices])):
+            outputs[index] = chunk
+    return outputs
+
+
+def read_crop_shapes(images_spatial_crop: Union[torch.Tensor, Sequence[torch.Tensor]]) -> List[Tuple[int, int]]:
+    """
+    读取每张图像的切图网格 (宽块数, 高块数)，是否有局部切块、是否为占位输入都只由这份元数据决定
+
+    处理器在没有图像时输出全零占位，此时返回空列表。元数据应保留在 CPU 上，这里不触发设备同步。
+    """
+    if isinstance(images_spatial_crop, torch.Tensor):
+        rows = images_spatial_crop.reshape(images_spatial_crop.size(0), -1).tolist()
+    else:
+        rows = [torch.as_tensor(row).reshape(-1).tolist() for row in images_spatial_crop]
+    if not any(any(row) for row in rows):
+        return []
+    return [(int(row[0]), int(row[1])) for row in rows]
+
+
+class ImageLayout(NamedTuple):
+    """单张图像 image token 序列的布局（局部切块区 + 全局视图区 + view_seperator）"""
+
+    side: int  # 全局视图每行 / 每列 token 数
+    side2: int  # 切块每行 / 每列 token 数，无切块时为 0
+    width_crop_num: int
+    height_crop_num: int
+    local_len: int  # 局部切块区长度（含每行 image_newline）
+    total: int
+
+
+@lru_cache(maxsize=256)
+def image_layout(side: int, crop_shape: Tuple[int, int], side2: int) -> ImageLayout:
+    """
+    按 (全局视图边长, 切图网格, 切块边长) 缓存的序列布局
+
+    局部切块拼成 (nh*h2) 行 x (nw*w2) 列、每行末尾一个 image_newline；随后全局视图 h 行 x h 列、
+    每行末尾一个 image_newline；最后一个 view_seperator。
+    """
+    width_crop_num, height_crop_num = crop_shape
+    local_len = height_crop_num * side2 * (width_crop_num * side2 + 1) if side2 else 0
+    return ImageLayout(side, side2, width_crop_num, height_crop_num, local_len,
+                       local_len + side * (side + 1) + 1)
+
+
+def layout_image_features(
+    global_features: torch.Tensor,
+    local_features: Optional[torch.Tensor],
+    crop_shape: Sequence[int],
+    image_newline: torch.Tensor,
+    view_seperator: torch.Tensor,
+) -> torch.Tensor:
+    """
+    把单张图像的全局 [1, hw, C] 与局部 [nw*nh, hw2, C] 特征排成 image token 序列
+
+    按缓存的布局预分配整条输出，各段通过输出上的跨步视图直接写入（切块重排也在这一次拷贝中完成），
+    不再为每行 image_newline 与各段拼接分配中间张量。
+    """
+    _, hw, n_dim = global_features.shape
+    side2 = 0 if local_features is None else int(local_features.size(1) ** 0.5)
+    layout = image_layout(int(hw ** 0.5), (int(crop_shape[0]), int(crop_shape[1])), side2)
+    dtype = torch.promote_types(global_features.dtype, image_newline.dtype)
+    output = global_features.new_empty((layout.total, n_dim), dtype=dtype)
+
+    if side2:
+        nw, nh = layout.width_crop_num, layout.height_crop_num
+        cols = nw * side2
+        local = output[:layout.local_len].view(nh * side2, cols + 1, n_dim)
+        # (切块行, 块内行, 切块列, 块内列) 的目标视图 <- (切块行, 切块列, 块内行, 块内列) 的源特征
+        local[:, :cols].view(nh, side2, nw, side2, n_dim).copy_(
+            local_features.view(nh, nw, side2, side2, n_dim).permute(0, 2, 1, 3, 4)
+        )
+        local[:, cols] = image_newline
+
+    side = layout.side
+    global_view = output[layout.local_len:-1].view(side, side + 1, n_dim)
+    global_view[:, :side].copy_(global_features.view(side, side, n_dim))
+    global_view[:, side] = image_newline
+    output[-1] = view_seperator
+    return output
+
+
+def pixel_values_to_embedding(
+    encode: Callable[[torch.Tensor], torch.Tensor],
+    image_newline: torch.Tensor,
+    view_seperator: torch.Tensor,
+    pixel_values: Union[torch.Tensor, Sequence[torch.Tensor]],
+    images_crop: Union[torch.Tensor, Sequence[torch.Tensor]],
+    crop_shapes: Sequence[Tuple[int, int]],
+    dtype: torch.dtype = torch.bfloat16,
+    cache: Optional[VisionEmbeddingCache] = None,
+    image_keys: Optional[Sequence[Optional[Hashable]]] = None,
+) -> List[torch.Tensor]:
+    """
+    批量编码一个调度批次的所有图像
+
+    Args:
+        encode: 视图编码函数（VisionEncoderRunner），[N, 3, H, W] -> [N, hw, n_dim]
+        pixel_values: 全局视图 [n_image, 1, 3, base, base]，不同尺寸时为列表；与切块一样在编码前才转为 dtype，命中缓存的图像不做转换
+        images_crop: 局部切块 [n_image, 1, n_tiles, 3, size, size]，切块数不同时为列表
+        crop_shapes: read_crop_shapes 读出的每张图 (宽块数, 高块数)
+        cache / image_keys: 视觉特征缓存与每张图像的摘要键（None 表示该图不查缓存），命中的图像不参与编码
+
+    Returns:
+        每张图像的 image token 特征 [n_tokens, n_dim]
+    """
+    if cache is None or not cache.enabled or image_keys is None:
+        return _encode_images(encode, image_newline, view_seperator, pixel_values, images_crop, crop_shapes, dtype)
+
+    # 同一批次内摘要相同的图像不去重：vLLM 启动时用相同的占位图像做显存 profile，去重会低估编码器峰值显存
+    outputs: List[Optional[torch.Tensor]] = [
+        cache.get(key) if key is not None else None for key in image_keys
+    ]
+    to_encode = [jdx for jdx, features in enumerate(outputs) if features is None]
+    if to_encode:
+        encoded = _encode_images(
+            encode, image_newline, view_seperator,
+            [pixel_values[jdx] for jdx in to_encode],
+            [images_crop[jdx] for jdx in to_encode],
+            [crop_shapes[jdx] for jdx in to_encode],
+            dtype,
+        )
+        for jdx, features in zip(to_encode, encoded):
+            outputs[jdx] = features
+            if image_keys[jdx] is not None:
+                cache.put(image_keys[jdx], features)
+    return outputs
+
+
+def _encode_images(
+    encode: Callable[[torch.Tensor], torch.Tensor],
+    image_newline: torch.Tensor,
+    view_seperator: torch.Tensor,
+    pixel_values: Union[torch.Tensor, Sequence[torch.Tensor]],
+    images_crop: Union[torch.Tensor, Sequence[torch.Tensor]],
+    crop_shapes: Sequence[Tuple[int, int]],
+    dtype: torch.dtype,
+) -> List[torch.Tensor]:
+    # 网格大于 1x1 才有局部切块；分支全部由主机侧元数据决定，不对像素张量做归约
+    has_crops = [width > 1 or height > 1 for width, height in crop_shapes]
+
+    prepare = lambda views: to_model_pixels(views, dtype)
+    with torch.no_grad():
+        global_features = encode_grouped(
+            encode, [pixel_values[jdx] for jdx in range(len(crop_shapes))], prepare=prepare
+        )
+        local_features = encode_grouped(
+            encode,
+            [images_crop[jdx][0] if crop else None for jdx, crop in enumerate(has_crops)],
+            prepare=prepare,
+        )
+
+        if PRINT_NUM_VIS_TOKENS:
+            print('=====================')
+            print('BASE: ', [tuple(features.shape) for features in global_features])
+            print('PATCHES: ', [tuple(features.shape) if features is not None else None for features in local_features])
+            print('=====================')
+
+        return [
+            layout_image_features(global_feature, local_feature, crop_shape, image_newline, view_seperator)
+            for global_feature, local_feature, crop_shape in zip(global_features, local_features, crop_shapes)
+        ]
@@ -28,7 +28,7 @@ from vllm.transformers_utils.configs.deepseek_vl2 import (DeepseekVLV2Config,
                                                           MlpProjectorConfig,
                                                           VisionEncoderConfig)
 from .process.image_process import (
-    DeepseekOCRProcessor, count_tiles)
+    DeepseekOCRProcessor, count_image_tokens)
 from vllm.transformers_utils.tokenizer import cached_tokenizer_from_config
 # from vllm.utils import is_list_of
 
@@ -40,13 +40,25 @@ from vllm.model_executor.models.utils import (AutoWeightsLoader, WeightsMapper,
 from .deepencoder.sam_vary_sdpa import build_sam_vit_b
 from .deepencoder.clip_sdpa import build_clip_l
 from .deepencoder.build_linear import MlpProjector
+from .deepencoder.embedding_cache import VisionEmbeddingCache, read_image_keys
+from .deepencoder.pos_cache import clear_position_caches
+from .deepencoder.view_encoder import VisionEncoderRunner, pixel_values_to_embedding, read_crop_shapes
 from addict import Dict
 # import time
-from .config import IMAGE_SIZE, BASE_SIZE, CROP_MODE, PRINT_NUM_VIS_TOKENS, PROMPT
+from .config import (IMAGE_SIZE, BASE_SIZE, CROP_MODE, PROMPT, DEFAULT_MODE, VISION_COMPILE_SHAPES, OcrMode,
+                     vision_compile_mode, vision_embed_cache_bytes)
 # The image token id may be various
 _IMAGE_TOKEN = "<image>"
 
 
+def _cpu_batched_field(modality: str) -> MultiModalFieldConfig:
+    """不随批次搬到 GPU 的元数据字段（旧版 vLLM 不支持 keep_on_cpu 时退化为普通字段）"""
+    try:
+        return MultiModalFieldConfig.batched(modality, keep_on_cpu=True)
+    except TypeError:
+        return MultiModalFieldConfig.batched(modality)
+
+
 class DeepseekOCRProcessingInfo(BaseProcessingInfo):
 
     def get_hf_config(self):
@@ -62,48 +74,13 @@ class DeepseekOCRProcessingInfo(BaseProcessingInfo):
                              *,
                              image_width: int,
                              image_height: int,
-                             cropping: bool = True) -> int:
-        hf_processor = self.get_hf_processor()
-
-
-        # image_size = hf_processor.image_size
-        # patch_size = hf_processor.patch_size
-        # downsample_ratio = hf_processor.downsample_ratio
-
-        image_size = IMAGE_SIZE
-        base_size = BASE_SIZE
-        patch_size = 16
-        downsample_ratio = 4
-
-        if CROP_MODE:
-            if image_width <= 640 and image_height <= 640:
-                crop_ratio = [1, 1]
-            else:
-                # images_crop_raw, crop_ratio = hf_processor.dynamic_preprocess(image)
-
-                # find the closest aspect ratio to the target
-                crop_ratio = count_tiles(image_width, image_height, image_size=IMAGE_SIZE)
-
-                # print('===========')
-                # print('crop_ratio ', crop_ratio)
-                # print('============')
-                
-            num_width_tiles, num_height_tiles = crop_ratio
-        else:
-            num_width_tiles = num_height_tiles = 1
-
-        h = w = math.ceil((base_size // patch_size) / downsample_ratio)
-
-        h2 = w2 = math.ceil((image_size // patch_size) / downsample_ratio)
-
-        global_views_tokens = h * (w + 1)
-        if num_width_tiles >1 or num_height_tiles>1:
-            local_views_tokens = (num_height_tiles * h2) * (num_width_tiles * w2 + 1)
-        else:
-            local_views_tokens = 0
-
-
-        return global_views_tokens + local_views_tokens + 1
+                             cropping: bool = DEFAULT_MODE.crop_mode,
+                             base_size: int = DEFAULT_MODE.base_size,
+                             image_size: int = DEFAULT_MODE.image_size) -> int:
+        return count_image_tokens(image_width, image_height,
+                                  base_size=base_size,
+                                  image_size=image_size,
+                                  cropping=cropping)
 
     def get_image_size_with_most_features(self) -> ImageSize:
 
@@ -183,9 +160,13 @@ class DeepseekOCRMultiModalProcessor(
     ) -> Mapping[str, MultiModalFieldConfig]:
         return dict(
             pixel_values=MultiModalFieldConfig.batched("image"),
-            images_spatial_crop=MultiModalFieldConfig.batched("image"),
-            # image_embeds=MultiModalFieldConfig.batched("image2"),
+            # 切图网格只用于主机侧分支，留在 CPU 上避免读取时同步设备
+            images_spatial_crop=_cpu_batched_field("image"),
+            # 编码 / 解码分离时请求直接携带 image token 特征（独立视觉编码阶段的输出）
+            image_embeds=MultiModalFieldConfig.batched("image"),
             images_crop=MultiModalFieldConfig.batched("image"),
+            # 预处理像素 + 模式的内容摘要，模型侧视觉特征缓存的键，只在主机侧读取
+            image_digests=_cpu_batched_field("image"),
         )
 
     def _get_prompt_updates(
@@ -209,15 +190,18 @@ class DeepseekOCRMultiModalProcessor(
                 num_image_tokens = images.get_feature_size(item_idx)
             else:
 
-                
-                width = images[0][-1][0][0]
-                height = images[0][-1][0][1]
+                # 处理器输出: [..., image_shapes, ocr_mode]，模式随请求携带
+                image_shapes, ocr_mode = images[0][6], OcrMode(*images[0][7])
+                width = image_shapes[0][0]
+                height = image_shapes[0][1]
 
                 num_image_tokens = self.info.get_num_image_tokens(
                     image_width=width,
                     image_height=height,
                     # flag = True,
-                    cropping=CROP_MODE,
+                    cropping=ocr_mode.crop_mode,
+                    base_size=ocr_mode.base_size,
+                    image_size=ocr_mode.image_size,
                 )
             return [image_token_id] * num_image_tokens
 
@@ -293,10 +277,13 @@ class DeepseekOCRForCausalLM(nn.Module, SupportsMultiModal, SupportsPP):
         self.projector =  MlpProjector(Dict(projector_type="linear", input_dim=2048, n_embed=n_embed))
         self.tile_tag = config.tile_tag
         self.global_view_pos = config.global_view_pos
-    
-        # self.sam_model = torch.compile(self.sam_model, mode="reduce-overhead")
-        # self.vision_model = torch.compile(self.vision_model, mode="reduce-overhead")
-        # self.projector = torch.compile(self.projector, mode="max-autotune")
+
+        # 视觉编码器执行入口；VISION_COMPILE_MODE 非 off 时用 torch.compile，加载权重后按固定尺寸预热
+        self.vision_encoder = VisionEncoderRunner(
+            self.sam_model, self.vision_model, self.projector, compile_mode=vision_compile_mode()
+        )
+        # 按像素摘要缓存投影后的视觉特征，同一图像换提示词 / 重复提交时跳过编码器（VISION_EMBED_CACHE_MB=0 关闭）
+        self.vision_cache = VisionEmbeddingCache(vision_embed_cache_bytes(), name="vision_cache.model")
 
 
 
@@ -337,9 +324,10 @@ class DeepseekOCRForCausalLM(nn.Module, SupportsMultiModal, SupportsPP):
         pixel_values = kwargs.pop("pixel_values", None)
         images_spatial_crop = kwargs.pop("images_spatial_crop", None)
         images_crop = kwargs.pop("images_crop", None)
+        image_digests = kwargs.pop("image_digests", None)
 
 
-        if pixel_values is None or torch.sum(pixel_values).item() == 0:
+        if pixel_values is None:
             return None
 
         if pixel_values is not None:
@@ -355,7 +343,15 @@ class DeepseekOCRForCausalLM(nn.Module, SupportsMultiModal, SupportsPP):
                 raise ValueError("Incorrect type of image crop. "
                                  f"Got type: {type(images_crop)}")
 
-            return [pixel_values, images_crop, images_spatial_crop]
+            # 占位输入（无图像）与有无局部切块都由 images_spatial_crop 判断，不对像素张量求和，避免 GPU 同步
+            crop_shapes = read_crop_shapes(images_spatial_crop)
+            if not crop_shapes:
+                return None
+
+            # 视觉特征缓存键（处理器未计算摘要时为 None，对应图像照常编码）
+            image_keys = read_image_keys(image_digests, len(crop_shapes)) if self.vision_cache.enabled else None
+
+            return [pixel_values, images_crop, crop_shapes, image_keys]
 
 
         raise AssertionError("This line should be unreachable.")
@@ -366,114 +362,33 @@ class DeepseekOCRForCausalLM(nn.Module, SupportsMultiModal, SupportsPP):
         self,
         pixel_values: torch.Tensor,
         images_crop: torch.Tensor,
-        images_spatial_crop: torch.Tensor,
+        crop_shapes: List[Tuple[int, int]],
+        image_keys: Optional[List[Optional[Tuple[int, ...]]]] = None,
     ) -> NestedTensors:
 
         # Pixel_values (global view): [n_image, batch_size, 3, height, width]
-        # images_spatial_crop: [n_image, batch_size, [num_tiles_w, num_tiles_h]]
+        # crop_shapes: [n_image, (num_tiles_w, num_tiles_h)]，由 images_spatial_crop 在主机侧读出
         # images_crop (local view): [n_image, batch_size, num_pathes, 3, h, w]
         # split the pixel and image_crop, all batch_size = 1
-
-        images_in_this_batch = []
-
-
-        # print(type(images_crop))
-
-        # print(pixel_values.shape)
-
-
-        with torch.no_grad():
-            for jdx in range(images_spatial_crop.size(0)):
-                # with torch.set_grad_enabled(False):
-                patches = images_crop[jdx][0].to(torch.bfloat16) # batch_size = 1
-                image_ori = pixel_values[jdx]
-                crop_shape = images_spatial_crop[jdx][0]
-
-                if torch.sum(patches).item() != 0:  # if all values = 0, no crop
-                    # P, C, H, W = patches.shape
-                    # crop_flag = 1
-                    local_features_1 = self.sam_model(patches)
-                    #TODO del patches 
-                    # torch.compiler.cudagraph_mark_step_begin()
-                    local_features_2 = self.vision_model(patches, local_features_1)  
-
-
-                    local_features = torch.cat((local_features_2[:, 1:], local_features_1.flatten(2).permute(0, 2, 1)), dim=-1) 
-                    local_features = self.projector(local_features)
-
-
-                    global_features_1 = self.sam_model(image_ori)
-                    global_features_2 = self.vision_model(image_ori, global_features_1) 
-                    global_features = torch.cat((global_features_2[:, 1:], global_features_1.flatten(2).permute(0, 2, 1)), dim=-1) 
-                    global_features = self.projector(global_features)
-
-                    if PRINT_NUM_VIS_TOKENS:
-                        print('=====================')
-                        print('BASE: ', global_features.shape)
-                        print('PATCHES: ', local_features.shape)
-                        print('=====================')
-
-                    _, hw, n_dim = global_features.shape
-                    h = w = int(hw ** 0.5)
-
-                    _2, hw2, n_dim2 = local_features.shape
-                    h2 = w2 = int(hw2 ** 0.5)
-
-                    width_crop_num, height_crop_num = crop_shape[0], crop_shape[1]
-
-                    global_features = global_features.view(h, w, n_dim)
-
-                    global_features = torch.cat(
-                        [global_features, self.image_newline[None, None, :].expand(h, 1, n_dim)], dim=1
-                    )
-
-                    global_features = global_features.view(-1, n_dim)
-
-
-                    local_features = local_features.view(height_crop_num, width_crop_num, h2, w2, n_dim2).permute(0, 2, 1, 3, 4).reshape(height_crop_num*h2, width_crop_num*w2, n_dim2)
-                    local_features = torch.cat(
-                        [local_features, self.image_newline[None, None, :].expand(height_crop_num * h2, 1, n_dim2)], dim=1
-                    )
-                    local_features = local_features.view(-1, n_dim2)
-
-                    global_local_features = torch.cat([local_features, global_features, self.view_seperator[None, :]], dim=0)
-                
-                else:
-                    global_features_1 = self.sam_model(image_ori)
-                    global_features_2 = self.vision_model(image_ori, global_features_1) 
-                    global_features = torch.cat((global_features_2[:, 1:], global_features_1.flatten(2).permute(0, 2, 1)), dim=-1) 
-                    global_features = self.projector(global_features)
-
-                    if PRINT_NUM_VIS_TOKENS:
-                        print('=====================')
-                        print('BASE: ', global_features.shape)
-                        print('NO PATCHES')
-                        print('=====================')
-
-                    _, hw, n_dim = global_features.shape
-                    h = w = int(hw ** 0.5)
-
-                    global_features = global_features.view(h, w, n_dim)
-
-                    global_features = torch.cat(
-                        [global_features, self.image_newline[None, None, :].expand(h, 1, n_dim)], dim=1
-                    )
-
-                    global_features = global_features.view(-1, n_dim)
-
-                    global_local_features = torch.cat([global_features, self.view_seperator[None, :]], dim=0)
-
-                images_in_this_batch.append(global_local_features)
-
-        return images_in_this_batch
+        # 同尺寸的全局视图、局部切块各自拼成一个批次编码，再按原布局拆回每张图像；命中视觉特征缓存的图像跳过编码
+        return pixel_values_to_embedding(
+            self.vision_encoder,
+            self.image_newline,
+            self.view_seperator,
+            pixel_values,
+            images_crop,
+            crop_shapes,
+            cache=self.vision_cache,
+            image_keys=image_keys,
+        )
 
     def _process_image_input(
             self, image_input) -> torch.Tensor:
         
 
-        # image_input: [pixel_values, images_crop, images_spatial_crop]
-    
-        pixel_values = image_input[0].to(torch.bfloat16)
+        # image_input: [pixel_values, images_crop, crop_shapes, image_keys]
+        # 像素在编码前才转为 bfloat16（uint8 输入在设备上归一化），命中缓存的图像不做转换
+        pixel_values = image_input[0]
         # print(image_input[1][0].shape)
         # print(type(image_input[1]))
         # exit()
@@ -481,11 +396,12 @@ class DeepseekOCRForCausalLM(nn.Module, SupportsMultiModal, SupportsPP):
         # images_crop = image_input[1].to(torch.bfloat16)
         images_crop = image_input[1]
         # images_crop = image_input[1]
-        images_spatial_crop = image_input[2].to(dtype=torch.long)
+        crop_shapes = image_input[2]
+        image_keys = image_input[3]
 
         # local_start = time.time()
         vision_features = self._pixel_values_to_embedding(
-            pixel_values=pixel_values, images_crop = images_crop,  images_spatial_crop=images_spatial_crop)
+            pixel_values=pixel_values, images_crop = images_crop,  crop_shapes=crop_shapes, image_keys=image_keys)
 
         # local_total_time = time.time() - local_start
 
@@ -496,8 +412,21 @@ class DeepseekOCRForCausalLM(nn.Module, SupportsMultiModal, SupportsPP):
     def get_language_model(self) -> torch.nn.Module:
         return self.language_model
 
+    def _parse_image_embeds(self, image_embeds: object) -> List[torch.Tensor]:
+        """预计算的 image token 特征：每张图像 [n_tokens, n_embed]，同长度时由批处理堆叠为 [n_image, n_tokens, n_embed]"""
+        if isinstance(image_embeds, torch.Tensor):
+            image_embeds = list(image_embeds) if image_embeds.dim() == 3 else [image_embeds]
+        if not isinstance(image_embeds, list):
+            raise ValueError("Incorrect type of image embeddings. "
+                             f"Got type: {type(image_embeds)}")
+        return [embeds.to(self.image_newline.dtype) for embeds in image_embeds]
+
     def get_multimodal_embeddings(
             self, **kwargs: object) -> Optional[MultiModalEmbeddings]:
+        image_embeds = kwargs.pop("image_embeds", None)
+        if image_embeds is not None:
+            # 视觉编码已在独立阶段完成，跳过编码器
+            return self._parse_image_embeds(image_embeds)
         image_input = self._parse_and_validate_image_input(**kwargs)
         if image_input is None:
             return None
@@ -574,4 +503,10 @@ class DeepseekOCRForCausalLM(nn.Module, SupportsMultiModal, SupportsPP):
         
         loader = AutoWeightsLoader(self)
         autoloaded_weights = loader.load_weights(processed_weights, mapper=self.hf_to_vllm_mapper)
+        # 权重原地写入不会让位置编码缓存 / 视觉特征缓存自动失效
+        clear_position_caches(self)
+        self.vision_cache.clear()
+        self.vision_encoder.warmup(
+            VISION_COMPILE_SHAPES, device=self.image_newline.device, dtype=torch.bfloat16
+        )
         return autoloaded_weights
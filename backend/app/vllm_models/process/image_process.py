@@ -1,12 +1,17 @@
+import hashlib
 import math
-from typing import List, Tuple
+import threading
+from functools import lru_cache
+from typing import List, Optional, Tuple
 
+import numpy as np
 import torch
 import torchvision.transforms as T
 from PIL import Image, ImageOps
 from transformers import AutoProcessor, BatchFeature, LlamaTokenizerFast
 from transformers.processing_utils import ProcessorMixin
-from ..config import IMAGE_SIZE, BASE_SIZE, CROP_MODE, MIN_CROPS, MAX_CROPS, PROMPT
+from ..config import (IMAGE_SIZE, BASE_SIZE, CROP_MODE, MIN_CROPS, MAX_CROPS, IMAGE_MEAN, IMAGE_STD,
+                      PIXEL_TRANSPORT_UINT8, PROMPT, DEFAULT_MODE, OcrMode, vision_embed_cache_bytes)
 
 def find_closest_aspect_ratio(aspect_ratio, target_ratios, width, height, image_size):
     best_ratio_diff = float('inf')
@@ -25,37 +30,104 @@ def find_closest_aspect_ratio(aspect_ratio, target_ratios, width, height, image_
     return best_ratio
 
 
-def count_tiles(orig_width, orig_height, min_num=MIN_CROPS, max_num=MAX_CROPS, image_size=640, use_thumbnail=False):
-    aspect_ratio = orig_width / orig_height
-
+@lru_cache(maxsize=None)
+def get_target_ratios(min_num=MIN_CROPS, max_num=MAX_CROPS):
+    """候选切图网格 (宽块数, 高块数)，按块数排序；每组 (min_num, max_num) 只构建一次"""
     # calculate the existing image aspect ratio
     target_ratios = set(
         (i, j) for n in range(min_num, max_num + 1) for i in range(1, n + 1) for j in range(1, n + 1) if
         i * j <= max_num and i * j >= min_num)
-    # print(target_ratios)
-    target_ratios = sorted(target_ratios, key=lambda x: x[0] * x[1])
+    # 同块数的先后顺序决定平局时的选择，这里保持与逐次构建完全相同的排序方式
+    return tuple(sorted(target_ratios, key=lambda x: x[0] * x[1]))
 
-    # find the closest aspect ratio to the target
-    target_aspect_ratio = find_closest_aspect_ratio(
-        aspect_ratio, target_ratios, orig_width, orig_height, image_size)
 
-    return target_aspect_ratio
+@lru_cache(maxsize=8192)
+def select_tile_ratio(orig_width, orig_height, image_size=640, min_num=MIN_CROPS, max_num=MAX_CROPS):
+    """按原图尺寸选择切图网格，结果按 (宽, 高, image_size, min_num, max_num) 记忆"""
+    return find_closest_aspect_ratio(
+        orig_width / orig_height, get_target_ratios(min_num, max_num), orig_width, orig_height, image_size)
+
+
+def count_tiles(orig_width, orig_height, min_num=MIN_CROPS, max_num=MAX_CROPS, image_size=640, use_thumbnail=False):
+    return select_tile_ratio(orig_width, orig_height, image_size, min_num, max_num)
+
+
+def count_image_tokens(width, height, base_size=BASE_SIZE, image_size=IMAGE_SIZE, cropping=CROP_MODE,
+                       patch_size=16, downsample_ratio=4):
+    """计算单张图像展开后的 image token 数（与 tokenize_with_images 的布局一致）"""
+    if cropping and (width > 640 or height > 640):
+        num_width_tiles, num_height_tiles = count_tiles(width, height, image_size=image_size)
+    else:
+        num_width_tiles = num_height_tiles = 1
+
+    h = w = math.ceil((base_size // patch_size) / downsample_ratio)
+    h2 = w2 = math.ceil((image_size // patch_size) / downsample_ratio)
+
+    global_views_tokens = h * (w + 1)
+    if num_width_tiles > 1 or num_height_tiles > 1:
+        local_views_tokens = (num_height_tiles * h2) * (num_width_tiles * w2 + 1)
+    else:
+        local_views_tokens = 0
+
+    return global_views_tokens + local_views_tokens + 1
+
+
+def decode_reduction_factor(width, height, base_size=BASE_SIZE, image_size=IMAGE_SIZE, cropping=CROP_MODE,
+                            max_factor=8):
+    """
+    返回解码时可使用的最大降采样倍数（2 的幂，1 表示按原分辨率解码）
+
+    缩小后的图像须与原图选出相同的切图网格（token 数不变），且全局视图与切块都不需要放大。
+    """
+    def tiled(w, h):
+        return cropping and (w > 640 or h > 640)
+
+    orig_tiled = tiled(width, height)
+    ratio = select_tile_ratio(width, height, image_size, MIN_CROPS, MAX_CROPS) if orig_tiled else None
+    factor = max_factor
+    while factor > 1:
+        w, h = -(-width // factor), -(-height // factor)
+        if tiled(w, h) == orig_tiled:
+            if image_size <= 640 and not cropping:
+                # 全局视图先缩放到 image_size 见方再填充
+                ok = w >= image_size and h >= image_size
+            else:
+                ok = max(w, h) >= base_size
+            if ok and ratio is not None:
+                ok = (select_tile_ratio(w, h, image_size, MIN_CROPS, MAX_CROPS) == ratio
+                      and w >= image_size * ratio[0] and h >= image_size * ratio[1])
+            if ok:
+                return factor
+        factor //= 2
+    return 1
+
+
+def decode_mode_for_request(mode, raw_image, official_model=False):
+    """
+    图像解码降采样所依据的 OCR 模式（None 表示按原分辨率解码）
+
+    raw_image（v1 引擎直接提交 RGB 图像）时由引擎内的处理器按其固定模式重新预处理，请求模式不生效：
+    自定义模型为 DEFAULT_MODE；vLLM 内置模型的模式在本进程不可知，不降采样。
+    """
+    if not raw_image:
+        return mode
+    return None if official_model else DEFAULT_MODE
+
+
+def decode_factor_for_mode(mode):
+    """ImageUtils.decode_reduced 所需的降采样倍数函数；mode 为 None 时不降采样"""
+    if mode is None:
+        return lambda width, height: 1
+    return lambda width, height: decode_reduction_factor(
+        width, height, base_size=mode.base_size, image_size=mode.image_size, cropping=mode.crop_mode
+    )
 
 
 def dynamic_preprocess(image, min_num=MIN_CROPS, max_num=MAX_CROPS, image_size=640, use_thumbnail=False):
     orig_width, orig_height = image.size
-    aspect_ratio = orig_width / orig_height
-
-    # calculate the existing image aspect ratio
-    target_ratios = set(
-        (i, j) for n in range(min_num, max_num + 1) for i in range(1, n + 1) for j in range(1, n + 1) if
-        i * j <= max_num and i * j >= min_num)
-    # print(target_ratios)
-    target_ratios = sorted(target_ratios, key=lambda x: x[0] * x[1])
 
     # find the closest aspect ratio to the target
-    target_aspect_ratio = find_closest_aspect_ratio(
-        aspect_ratio, target_ratios, orig_width, orig_height, image_size)
+    target_aspect_ratio = select_tile_ratio(orig_width, orig_height, image_size, min_num, max_num)
 
     # print(target_aspect_ratio)
     # calculate the target width and height
@@ -83,7 +155,83 @@ def dynamic_preprocess(image, min_num=MIN_CROPS, max_num=MAX_CROPS, image_size=6
     return processed_images, target_aspect_ratio
 
 
-
+def resize_for_tiles(image, min_num=MIN_CROPS, max_num=MAX_CROPS, image_size=640):
+    """按选定网格缩放整图（与 dynamic_preprocess 相同），切块留给调用方以视图方式完成"""
+    target_aspect_ratio = select_tile_ratio(image.size[0], image.size[1], image_size, min_num, max_num)
+    resized_img = image.resize((image_size * target_aspect_ratio[0], image_size * target_aspect_ratio[1]))
+    return resized_img, target_aspect_ratio
+
+
+def build_image_views(images, cropping, base_size, image_size, image_transform, uint8_pixels=False, digests=None):
+    """
+    构建全局视图与局部切块张量
+
+    每张图只做一次数组转换；切块是缩放后整图的 reshape/permute 视图，
+    归一化一次性写入预分配的输出，与逐块 ToTensor + Normalize 的结果逐位一致。
+    uint8_pixels 为 True 时输出未归一化的 uint8 像素，由模型在 GPU 上归一化。
+    不切图时（base / small 模式或小图）只有全局视图一步张量转换，耗时主要是与原实现相同的 PIL 缩放 / 填充，
+    整体收益有限但不会变慢，因此不按尺寸分支（对比见 benchmarks/image_views_bench.py 的 convert 列）。
+    digests 传入列表时，按图像追加预处理后像素（uint8 全局视图 + 切块源图）与模式的 16 字节摘要。
+
+    Returns:
+        (pixel_values [n_images, 3, base, base], images_crop [1, n_tiles, 3, size, size], crop_ratios)
+    """
+    crop_ratios = []
+    resized_tiles = []
+    hashers = []
+    for image in images:
+        if cropping and (image.size[0] > 640 or image.size[1] > 640):
+            resized_img, crop_ratio = resize_for_tiles(image, image_size=image_size)
+        else:
+            resized_img, crop_ratio = None, (1, 1)
+        crop_ratios.append(crop_ratio)
+        hasher = None
+        if digests is not None:
+            hasher = hashlib.blake2b(f"{base_size}:{image_size}:{bool(cropping)}:{crop_ratio}".encode(), digest_size=16)
+            hashers.append(hasher)
+        if crop_ratio[0] > 1 or crop_ratio[1] > 1:
+            resized_tiles.append((resized_img, crop_ratio, hasher))
+
+    dtype = torch.uint8 if uint8_pixels else torch.float32
+    if not images:
+        pixel_values = torch.zeros((1, 3, base_size, base_size), dtype=dtype)
+    else:
+        pixel_values = torch.empty((len(images), 3, base_size, base_size), dtype=dtype)
+        pad_color = tuple(int(x * 255) for x in image_transform.mean)
+        for index, image in enumerate(images):
+            if image_size <= 640 and not cropping:
+                image = image.resize((image_size, image_size))
+            global_view = np.array(ImageOps.pad(image, (base_size, base_size), color=pad_color))
+            if digests is not None:
+                hashers[index].update(global_view)
+            image_transform.fill(pixel_values[index], global_view)
+
+    num_tiles = sum(ratio[0] * ratio[1] for _, ratio, _ in resized_tiles)
+    if num_tiles == 0:
+        images_crop = torch.zeros((1, 3, image_size, image_size), dtype=dtype).unsqueeze(0)
+    else:
+        images_crop = torch.empty((num_tiles, 3, image_size, image_size), dtype=dtype)
+        offset = 0
+        for resized_img, (num_width_tiles, num_height_tiles), hasher in resized_tiles:
+            count = num_width_tiles * num_height_tiles
+            array = np.array(resized_img)
+            if hasher is not None:
+                # 切块是 resized_img 的无重叠划分，哈希整图即覆盖全部切块像素
+                hasher.update(array)
+            pixels = torch.from_numpy(array)
+            # (行块, size, 列块, size, 3) -> (行块, 列块, 3, size, size)，切块顺序与逐行 crop 相同
+            tiles = pixels.view(num_height_tiles, image_size, num_width_tiles, image_size, 3).permute(0, 2, 4, 1, 3)
+            image_transform.fill(
+                images_crop[offset:offset + count].view(num_height_tiles, num_width_tiles, 3, image_size, image_size),
+                tiles,
+                channels_last=False,
+            )
+            offset += count
+        images_crop = images_crop.unsqueeze(0)
+
+    if digests is not None:
+        digests.extend(hasher.digest() for hasher in hashers)
+    return pixel_values, images_crop, crop_ratios
 
 
 class ImageTransform:
@@ -102,11 +250,25 @@ class ImageTransform:
             transform_pipelines.append(T.Normalize(mean, std))
 
         self.transform = T.Compose(transform_pipelines)
+        self._mean = torch.tensor(mean, dtype=torch.float32).view(-1, 1, 1)
+        self._std = torch.tensor(std, dtype=torch.float32).view(-1, 1, 1)
 
     def __call__(self, pil_img: Image.Image):
         x = self.transform(pil_img)
         return x
 
+    def fill(self, out: torch.Tensor, pixels, channels_last: bool = True) -> torch.Tensor:
+        """把 uint8 像素原地转换 + 归一化写入 out（运算顺序与 ToTensor + Normalize 相同）；out 为 uint8 时只做布局转换"""
+        if not isinstance(pixels, torch.Tensor):
+            pixels = torch.from_numpy(pixels)
+        out.copy_(pixels.movedim(-1, -3) if channels_last else pixels)
+        if out.dtype == torch.uint8:
+            return out
+        out.div_(255)
+        if self.normalize:
+            out.sub_(self._mean).div_(self._std)
+        return out
+
 
 class DeepseekOCRProcessor(ProcessorMixin):
     tokenizer_class = ("LlamaTokenizer", "LlamaTokenizerFast")
@@ -118,8 +280,8 @@ class DeepseekOCRProcessor(ProcessorMixin):
         candidate_resolutions: Tuple[Tuple[int, int]] = [[1024, 1024]],
         patch_size: int = 16,
         downsample_ratio: int = 4,
-        image_mean: Tuple[float, float, float] = (0.5, 0.5, 0.5),
-        image_std: Tuple[float, float, float] = (0.5, 0.5, 0.5),
+        image_mean: Tuple[float, float, float] = IMAGE_MEAN,
+        image_std: Tuple[float, float, float] = IMAGE_STD,
         normalize: bool = True,
         image_token: str = "<image>",
         pad_token: str = "<｜▁pad▁｜>",
@@ -127,6 +289,8 @@ class DeepseekOCRProcessor(ProcessorMixin):
         sft_format: str = "deepseek",
         mask_prompt: bool = True,
         ignore_id: int = -100,
+        uint8_pixels: bool = PIXEL_TRANSPORT_UINT8,
+        image_digests: Optional[bool] = None,
         **kwargs,
     ):
 
@@ -142,6 +306,10 @@ class DeepseekOCRProcessor(ProcessorMixin):
         self.downsample_ratio = 4
 
         self.image_transform = ImageTransform(mean=image_mean, std=image_std, normalize=normalize)
+        # 为 True 时 pixel_values / images_crop 以 uint8 传输，归一化推迟到模型侧（GPU 上）
+        self.uint8_pixels = uint8_pixels
+        # 为 True 时输出每张图像的像素内容摘要，作为模型侧视觉特征缓存的键；默认随 VISION_EMBED_CACHE_MB 开关
+        self.image_digests = vision_embed_cache_bytes() > 0 if image_digests is None else image_digests
 
         # 如果没有提供 tokenizer，从模型路径加载
         if tokenizer is None:
@@ -186,6 +354,11 @@ class DeepseekOCRProcessor(ProcessorMixin):
         self.sft_format = sft_format
         self.mask_prompt = mask_prompt
         self.ignore_id = ignore_id
+        # fast tokenizer 在多线程并发 encode 时可能抛出 "Already borrowed"，共享实例时串行化 encode
+        self._encode_lock = threading.Lock()
+        # 提示词分段编码与 token 序列模板缓存（只增不改，多线程读写 dict 由 GIL 保证安全）
+        self._split_cache = {}
+        self._layout_cache = {}
 
         super().__init__(self.tokenizer, **kwargs)
 
@@ -229,7 +402,8 @@ class DeepseekOCRProcessor(ProcessorMixin):
         return self.tokenizer.pad_token_id
 
     def encode(self, text: str, bos: bool = True, eos: bool = False):
-        t = self.tokenizer.encode(text, add_special_tokens=False)
+        with self._encode_lock:
+            t = self.tokenizer.encode(text, add_special_tokens=False)
 
         if bos:
             t = [self.bos_id] + t
@@ -272,7 +446,7 @@ class DeepseekOCRProcessor(ProcessorMixin):
 
         sft_format = prompt
 
-        input_ids, pixel_values, images_crop, images_seq_mask, images_spatial_crop, num_image_tokens, _ = images[0]
+        input_ids, pixel_values, images_crop, images_seq_mask, images_spatial_crop, num_image_tokens, _, _, image_digests = images[0]
 
 
         return {
@@ -282,6 +456,7 @@ class DeepseekOCRProcessor(ProcessorMixin):
             "images_seq_mask": images_seq_mask,
             "images_spatial_crop": images_spatial_crop,
             "num_image_tokens": num_image_tokens,
+            "image_digests": image_digests,
         }
 
 
@@ -330,6 +505,65 @@ class DeepseekOCRProcessor(ProcessorMixin):
 
         return prepare
 
+    def _encode_splits(self, conversation: str):
+        """按 <image> 切分提示词并编码各段文本（结果缓存，提示词通常是常量）"""
+        encoded = self._split_cache.get(conversation)
+        if encoded is None:
+            encoded = tuple(
+                tuple(self.encode(text_sep, bos=False, eos=False))
+                for text_sep in conversation.split(self.image_token)
+            )
+            self._split_cache[conversation] = encoded
+        return encoded
+
+    def _image_token_count(self, base_size, image_size, crop_ratio):
+        num_queries = math.ceil((image_size // self.patch_size) / self.downsample_ratio)
+        num_queries_base = math.ceil((base_size // self.patch_size) / self.downsample_ratio)
+        num_width_tiles, num_height_tiles = crop_ratio
+        # 全局视图每行 + 换行 token，再加视图分隔 token
+        count = (num_queries_base + 1) * num_queries_base + 1
+        if num_width_tiles > 1 or num_height_tiles > 1:
+            count += (num_queries * num_width_tiles + 1) * (num_queries * num_height_tiles)
+        return count
+
+    def _sequence_layout(self, conversation, base_size, image_size, crop_ratios, bos, eos):
+        """返回缓存的 (input_ids [1, L], images_seq_mask [L], num_image_tokens)，调用方需复制后再使用"""
+        key = (conversation, base_size, image_size, crop_ratios, bos, eos)
+        layout = self._layout_cache.get(key)
+        if layout is not None:
+            return layout
+
+        text_tokens = self._encode_splits(conversation)
+        token_parts, mask_parts, num_image_tokens = [], [], []
+        if bos:
+            token_parts.append(torch.tensor([self.bos_id], dtype=torch.long))
+            mask_parts.append(torch.zeros(1, dtype=torch.bool))
+        for tokenized_sep, crop_ratio in zip(text_tokens, crop_ratios):
+            count = self._image_token_count(base_size, image_size, crop_ratio)
+            token_parts += [torch.tensor(tokenized_sep, dtype=torch.long),
+                            torch.full((count,), self.image_token_id, dtype=torch.long)]
+            mask_parts += [torch.zeros(len(tokenized_sep), dtype=torch.bool),
+                           torch.ones(count, dtype=torch.bool)]
+            num_image_tokens.append(count)
+        """process the last text split"""
+        token_parts.append(torch.tensor(text_tokens[-1], dtype=torch.long))
+        mask_parts.append(torch.zeros(len(text_tokens[-1]), dtype=torch.bool))
+        if eos:
+            token_parts.append(torch.tensor([self.eos_id], dtype=torch.long))
+            mask_parts.append(torch.zeros(1, dtype=torch.bool))
+
+        input_ids = torch.cat(token_parts)
+        images_seq_mask = torch.cat(mask_parts)
+        input_ids[input_ids < 0] = self.pad_id
+
+        # Remove the ending eos token
+        assert input_ids[-1] == self.eos_id
+        layout = (input_ids[:-1].unsqueeze(0), images_seq_mask[:-1], tuple(num_image_tokens))
+        if len(self._layout_cache) >= 1024:
+            self._layout_cache.clear()
+        self._layout_cache[key] = layout
+        return layout
+
     def tokenize_with_images(
         self,
         # conversation: str,
@@ -337,169 +571,49 @@ class DeepseekOCRProcessor(ProcessorMixin):
         bos: bool = True,
         eos: bool = True,
         cropping: bool = True,
+        base_size: Optional[int] = None,
+        image_size: Optional[int] = None,
     ):
-        """Tokenize text with <image> tags."""
+        """Tokenize text with <image> tags.
+
+        base_size / image_size 为本次请求的模式参数，未指定时回退到处理器默认值；
+        实际使用的模式会作为输出的最后一项返回，供 token 数计算复用。
+        """
+        base_size = base_size or self.base_size
+        image_size = image_size or self.image_size
 
         # print(conversation)
         conversation = PROMPT
         assert conversation.count(self.image_token) == len(images)
-        text_splits = conversation.split(self.image_token)
-        images_list, images_crop_list, images_seq_mask, images_spatial_crop = [], [], [], []
-        image_shapes = []
-        num_image_tokens = []
-        tokenized_str = []
-        # print('image: ', len(images))
-        for text_sep, image in zip(text_splits, images):
-            """encode text_sep"""
-            tokenized_sep = self.encode(text_sep, bos=False, eos=False)
-            tokenized_str += tokenized_sep
-            images_seq_mask += [False] * len(tokenized_sep)
-
-            """select best resolution for anyres"""
-            # if cropping:
-            #     best_width, best_height = self.select_best_resolution(image.size)
-            # else:
-            #     best_width, best_height = self.image_size, self.image_size
-
-            image_shapes.append(image.size)
-
-            if image.size[0] <= 640 and image.size[1] <= 640:
-                crop_ratio = [1, 1]
-            else:
-                if cropping:
-                    # print('image-size: ', image.size)
-                    # best_width, best_height = select_best_resolution(image.size, self.candidate_resolutions)
-                    # print('image ', image.size)
-                    # print('open_size:', image.size)
-                    images_crop_raw, crop_ratio = dynamic_preprocess(image, image_size=IMAGE_SIZE)
-                    # print('crop_ratio: ', crop_ratio)
-                else:
-                    # best_width, best_height = self.image_size, self.image_size
-                    crop_ratio = [1, 1]
-            # print(image.size, (best_width, best_height)) # check the select_best_resolutions func
-
-            # print(crop_ratio)
-            """process the global view"""
-
-            # if cropping
-            if self.image_size <= 640 and not cropping:
-                # print('directly resize')
-                image = image.resize((self.image_size, self.image_size))
-
-            global_view = ImageOps.pad(image, (self.base_size, self.base_size),
-                                    color=tuple(int(x * 255) for x in self.image_transform.mean))
-            images_list.append(self.image_transform(global_view))
-
-            """record height / width crop num"""
-            # width_crop_num, height_crop_num = best_width // self.image_size, best_height // self.image_size
-            num_width_tiles, num_height_tiles = crop_ratio
-            images_spatial_crop.append([num_width_tiles, num_height_tiles])
-
-
-
-
-            if num_width_tiles > 1 or num_height_tiles > 1:
-                """process the local views"""
-                # local_view = ImageOps.pad(image, (best_width, best_height),
-                #                         color=tuple(int(x * 255) for x in self.image_transform.mean))
-                # for i in range(0, best_height, self.image_size):
-                #     for j in range(0, best_width, self.image_size):
-                #         images_crop_list.append(
-                #             self.image_transform(local_view.crop((j, i, j + self.image_size, i + self.image_size))))
-                for i in range(len(images_crop_raw)):
-                    images_crop_list.append(self.image_transform(images_crop_raw[i]))
-
-            # """process the global view"""
-            # global_view = ImageOps.pad(image, (self.image_size, self.image_size),
-            #                            color=tuple(int(x * 255) for x in self.image_transform.mean))
-            # images_list.append(self.image_transform(global_view))
-
-            # """process the local views"""
-            # local_view = ImageOps.pad(image, (best_width, best_height),
-            #                           color=tuple(int(x * 255) for x in self.image_transform.mean))
-            # for i in range(0, best_height, self.image_size):
-            #     for j in range(0, best_width, self.image_size):
-            #         images_list.append(
-            #             self.image_transform(local_view.crop((j, i, j + self.image_size, i + self.image_size))))
-
-            # """add image tokens"""
-            """add image tokens"""
-            num_queries = math.ceil((self.image_size // self.patch_size) / self.downsample_ratio)
-            num_queries_base = math.ceil((self.base_size // self.patch_size) / self.downsample_ratio)
-
-
-            tokenized_image = ([self.image_token_id] * num_queries_base + [self.image_token_id]) * num_queries_base
-            tokenized_image += [self.image_token_id]
-            if num_width_tiles > 1 or num_height_tiles > 1:
-                tokenized_image += ([self.image_token_id] * (num_queries * num_width_tiles) + [self.image_token_id]) * (
-                            num_queries * num_height_tiles)
-            tokenized_str += tokenized_image
-            images_seq_mask += [True] * len(tokenized_image)
-            num_image_tokens.append(len(tokenized_image))
-
-        """process the last text split"""
-        tokenized_sep = self.encode(text_splits[-1], bos=False, eos=False)
-        tokenized_str += tokenized_sep
-        images_seq_mask += [False] * len(tokenized_sep)
-
-        """add the bos and eos tokens"""
-        if bos:
-            tokenized_str = [self.bos_id] + tokenized_str
-            images_seq_mask = [False] + images_seq_mask
-        if eos:
-            tokenized_str = tokenized_str + [self.eos_id]
-            images_seq_mask = images_seq_mask + [False]
-
-        assert len(tokenized_str) == len(
-            images_seq_mask), f"tokenize_with_images func: tokenized_str's length {len(tokenized_str)} is not equal to imags_seq_mask's length {len(images_seq_mask)}"
-        
 
+        digests = [] if self.image_digests else None
+        pixel_values, images_crop, crop_ratios = build_image_views(
+            images, cropping, base_size, image_size, self.image_transform, uint8_pixels=self.uint8_pixels,
+            digests=digests)
 
-        masked_tokenized_str = []
-        for token_index in tokenized_str:
-            if token_index != self.image_token_id:
-                masked_tokenized_str.append(token_index)
-            else:
-                masked_tokenized_str.append(self.ignore_id)
-
-        assert len(tokenized_str) == len(images_seq_mask) == len(masked_tokenized_str), \
-            (f"tokenized_str's length {len(tokenized_str)}, input_ids' length {len(masked_tokenized_str)}, "
-             f"imags_seq_mask's length {len(images_seq_mask)}, are not equal")
-
-        input_ids = torch.LongTensor(tokenized_str)
-        target_ids = torch.LongTensor(masked_tokenized_str)
-        images_seq_mask = torch.tensor(images_seq_mask, dtype=torch.bool)
-
-        # set input_ids < 0 | input_ids == self.image_token_id as ignore_id
-        target_ids[(input_ids < 0) |
-                   (input_ids == self.image_token_id)] = self.ignore_id
-        input_ids[input_ids < 0] = self.pad_id
-
-        inference_mode = True
-
-        if inference_mode:
-            # Remove the ending eos token
-            assert input_ids[-1] == self.eos_id
-            input_ids = input_ids[:-1]
-            target_ids = target_ids[:-1]
-            images_seq_mask = images_seq_mask[:-1]
-
-        if len(images_list) == 0:
-            pixel_values = torch.zeros((1, 3, self.base_size, self.base_size))
+        image_shapes = [image.size for image in images]
+        """record height / width crop num"""
+        if len(images) == 0:
             images_spatial_crop = torch.zeros((1, 1), dtype=torch.long)
-            images_crop = torch.zeros((1, 3, self.image_size, self.image_size)).unsqueeze(0)
         else:
-            pixel_values = torch.stack(images_list, dim=0)
-            images_spatial_crop = torch.tensor(images_spatial_crop, dtype=torch.long)
-            if images_crop_list:
-                images_crop = torch.stack(images_crop_list, dim=0).unsqueeze(0)
-            else:
-                images_crop = torch.zeros((1, 3, self.image_size, self.image_size)).unsqueeze(0)
+            images_spatial_crop = torch.tensor([list(ratio) for ratio in crop_ratios], dtype=torch.long)
+        # 每张图像 16 字节摘要拆成两个 int64；全零表示没有摘要（未启用或占位输入），模型侧不查缓存
+        if digests:
+            image_digests = torch.from_numpy(np.frombuffer(b"".join(digests), dtype=np.int64).reshape(-1, 2).copy())
+        else:
+            image_digests = torch.zeros((max(len(images), 1), 2), dtype=torch.long)
 
-        input_ids = input_ids.unsqueeze(0)
+        # token 序列只取决于提示词、模式与各图切图网格，按模板缓存，每次请求只复制张量
+        input_ids, images_seq_mask, num_image_tokens = self._sequence_layout(
+            conversation, base_size, image_size, tuple(tuple(ratio) for ratio in crop_ratios), bos, eos)
+        input_ids = input_ids.clone()
+        images_seq_mask = images_seq_mask.clone()
+        num_image_tokens = list(num_image_tokens)
 
-        
-        return [[input_ids, pixel_values, images_crop, images_seq_mask, images_spatial_crop, num_image_tokens, image_shapes]]
+        ocr_mode = OcrMode(base_size=base_size, image_size=image_size, crop_mode=cropping)
+
+        return [[input_ids, pixel_values, images_crop, images_seq_mask, images_spatial_crop, num_image_tokens, image_shapes, ocr_mode,
+                 image_digests]]
 
 
 AutoProcessor.register("DeepseekVLV2Processor", DeepseekOCRProcessor)
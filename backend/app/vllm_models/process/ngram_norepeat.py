@@ -1,10 +1,50 @@
 import torch
+from collections import deque
 from transformers import LogitsProcessor
-from transformers.generation.logits_process import _calc_banned_ngram_tokens
-from typing import List, Set
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+# 前缀滚动哈希的模数（梅森素数 2^61 - 1）与基数；窗口内最多 window_size 个前缀，碰撞概率可忽略
+_HASH_MOD = (1 << 61) - 1
+_HASH_BASE = 1_000_003
+
+
+class _NGramWindow:
+    """单条序列在窗口内的 n-gram 索引：前缀哈希 -> {下一个 token: 出现次数}"""
+
+    __slots__ = ("length", "prefix_hash", "next_tokens", "entries")
+
+    def __init__(self) -> None:
+        self.length = 0
+        # 当前末尾 ngram_size - 1 个 token（下一步要查询的前缀）的滚动哈希
+        self.prefix_hash = 0
+        self.next_tokens: Dict[int, Dict[int, int]] = {}
+        # 按起始位置排列的 (起始位置, 前缀哈希, 下一个 token)，用于窗口滑动时淘汰
+        self.entries: Deque[Tuple[int, int, int]] = deque()
+
+    def add(self, start: int, prefix_hash: int, token: int) -> None:
+        self.entries.append((start, prefix_hash, token))
+        counts = self.next_tokens.get(prefix_hash)
+        if counts is None:
+            counts = self.next_tokens[prefix_hash] = {}
+        counts[token] = counts.get(token, 0) + 1
+
+    def evict_before(self, start: int) -> None:
+        while self.entries and self.entries[0][0] < start:
+            _, prefix_hash, token = self.entries.popleft()
+            counts = self.next_tokens[prefix_hash]
+            if counts[token] == 1:
+                del counts[token]
+                if not counts:
+                    del self.next_tokens[prefix_hash]
+            else:
+                counts[token] -= 1
 
 
 class NoRepeatNGramLogitsProcessor(LogitsProcessor):
+    """
+    窗口内 n-gram 防重复；每个实例只跟踪一条持续增长的序列（每个请求 / 批内每行各建一个实例），
+    每个新 token 以 O(1) 增量更新索引，序列长度不连续时从头构建。
+    """
 
     def __init__(self, ngram_size: int, window_size: int = 100, whitelist_token_ids: set = None):
         if not isinstance(ngram_size, int) or ngram_size <= 0:
@@ -14,27 +54,74 @@ class NoRepeatNGramLogitsProcessor(LogitsProcessor):
         self.ngram_size = ngram_size
         self.window_size = window_size
         self.whitelist_token_ids = whitelist_token_ids or set()
-    
+        # 移出前缀的 token 在哈希中的权重 BASE^(ngram_size - 2)
+        self._drop_weight = pow(_HASH_BASE, max(ngram_size - 2, 0), _HASH_MOD)
+        self._window: Optional[_NGramWindow] = None
+
     def __call__(self, input_ids: List[int], scores: torch.FloatTensor) -> torch.FloatTensor:
-        if len(input_ids) < self.ngram_size:
-            return scores
-        
-        current_prefix = tuple(input_ids[-(self.ngram_size - 1):])
-        
-        search_start = max(0, len(input_ids) - self.window_size)
-        search_end = len(input_ids) - self.ngram_size + 1
-        
-        banned_tokens = set()
-        for i in range(search_start, search_end):
-            ngram = tuple(input_ids[i:i + self.ngram_size])
-            if ngram[:-1] == current_prefix:
-                banned_tokens.add(ngram[-1])
-        
-        banned_tokens = banned_tokens - self.whitelist_token_ids
-        
+        banned_tokens = self.banned_tokens(input_ids)
         if banned_tokens:
-            scores = scores.clone()
-            for token in banned_tokens:
-                scores[token] = -float("inf")
-        
-        return scores
\ No newline at end of file
+            # 原地一次性屏蔽：scores 是引擎 logits 中的一行，无需复制整张词表
+            index = torch.tensor(list(banned_tokens), dtype=torch.long, device=scores.device)
+            scores.index_fill_(-1, index, -float("inf"))
+        return scores
+
+    def banned_tokens(self, input_ids: List[int]) -> Set[int]:
+        """返回当前步需要屏蔽的 token（窗口内以当前前缀开头的 n-gram 的末尾 token）"""
+        length = len(input_ids)
+        # ngram_size == 1 时前缀为空，原实现永远匹配不到，不屏蔽任何 token
+        if length < self.ngram_size or self.ngram_size == 1:
+            return set()
+
+        window = self._advance(input_ids)
+        counts = window.next_tokens.get(window.prefix_hash)
+        if not counts:
+            return set()
+        return counts.keys() - self.whitelist_token_ids
+
+    def _advance(self, input_ids: List[int]) -> _NGramWindow:
+        """把窗口索引推进到当前长度；相差超过一个窗口（或序列变短）时从头构建"""
+        length = len(input_ids)
+        window = self._window
+        if window is None or window.length > length or length - window.length > self.window_size:
+            window = self._window = self._build(input_ids)
+        while window.length < length:
+            self._push(window, input_ids, window.length + 1)
+        return window
+
+    def _push(self, window: _NGramWindow, input_ids: List[int], length: int) -> None:
+        """前进到长度 length（新 token 为 input_ids[length - 1]）"""
+        token = input_ids[length - 1]
+        start = length - self.ngram_size
+        window_start = max(0, length - self.window_size)
+        # 新进入窗口的 n-gram 的前缀恰好是上一步的查询前缀
+        if start >= window_start:
+            window.add(start, window.prefix_hash, token)
+        window.evict_before(window_start)
+        window.prefix_hash = self._roll(window.prefix_hash, input_ids[length - self.ngram_size], token)
+        window.length = length
+
+    @staticmethod
+    def _hash(tokens: List[int]) -> int:
+        prefix_hash = 0
+        for token in tokens:
+            prefix_hash = (prefix_hash * _HASH_BASE + token) % _HASH_MOD
+        return prefix_hash
+
+    def _roll(self, prefix_hash: int, dropped: int, token: int) -> int:
+        return ((prefix_hash - dropped * self._drop_weight) * _HASH_BASE + token) % _HASH_MOD
+
+    def _build(self, input_ids: List[int]) -> _NGramWindow:
+        length = len(input_ids)
+        prefix_len = self.ngram_size - 1
+        window = _NGramWindow()
+        search_start = max(0, length - self.window_size)
+        search_end = length - self.ngram_size + 1
+        prefix_hash = self._hash(input_ids[search_start:search_start + prefix_len])
+        for i in range(search_start, search_end):
+            token = input_ids[i + prefix_len]
+            window.add(i, prefix_hash, token)
+            prefix_hash = self._roll(prefix_hash, input_ids[i], token)
+        window.prefix_hash = self._hash(input_ids[length - prefix_len:])
+        window.length = length
+        return window
@@ -0,0 +1,87 @@
+"""
+vLLM v1 批级 n-gram 防重复 logits processor
+
+在引擎参数 logits_processors 中注册后，通过 SamplingParams.extra_args 按请求启用：
+    extra_args={"ngram_size": 30, "window_size": 90, "whitelist_token_ids": [128821, 128822]}
+每步对整个批次只做一次索引写入，不复制 logits。
+"""
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+import torch
+from vllm import SamplingParams
+from vllm.v1.sample.logits_processor import BatchUpdate, LogitsProcessor, MoveDirectionality
+
+from .ngram_norepeat import NoRepeatNGramLogitsProcessor
+
+if TYPE_CHECKING:
+    from vllm.config import VllmConfig
+
+
+class NoRepeatNGramBatchLogitsProcessor(LogitsProcessor):
+
+    def __init__(self, vllm_config: "VllmConfig", device: torch.device, is_pin_memory: bool):
+        self.device = device
+        self.is_pin_memory = is_pin_memory
+        # 批内行号 -> (该请求持续增长的输出 token 列表, 增量 n-gram 索引)
+        self._rows: Dict[int, Tuple[List[int], NoRepeatNGramLogitsProcessor]] = {}
+
+    @staticmethod
+    def _build_row_processor(params: SamplingParams) -> Optional[NoRepeatNGramLogitsProcessor]:
+        extra_args = params.extra_args or {}
+        ngram_size = extra_args.get("ngram_size")
+        if ngram_size is None:
+            return None
+        return NoRepeatNGramLogitsProcessor(
+            ngram_size=ngram_size,
+            window_size=extra_args.get("window_size", 100),
+            whitelist_token_ids=set(extra_args.get("whitelist_token_ids") or ()),
+        )
+
+    @classmethod
+    def validate_params(cls, params: SamplingParams) -> None:
+        # 构造时会校验 ngram_size / window_size，非法参数在提交请求时即报错
+        cls._build_row_processor(params)
+
+    def is_argmax_invariant(self) -> bool:
+        return False
+
+    def update_state(self, batch_update: Optional[BatchUpdate]) -> None:
+        if batch_update is None:
+            return
+
+        for index in batch_update.removed:
+            self._rows.pop(index, None)
+
+        for index, params, _prompt_token_ids, output_token_ids in batch_update.added:
+            processor = self._build_row_processor(params)
+            if processor is None:
+                self._rows.pop(index, None)
+            else:
+                self._rows[index] = (output_token_ids, processor)
+
+        for a_index, b_index, direction in batch_update.moved:
+            a_row = self._rows.pop(a_index, None)
+            b_row = self._rows.pop(b_index, None)
+            if a_row is not None:
+                self._rows[b_index] = a_row
+            if direction == MoveDirectionality.SWAP and b_row is not None:
+                self._rows[a_index] = b_row
+
+    def apply(self, logits: torch.Tensor) -> torch.Tensor:
+        if not self._rows:
+            return logits
+
+        rows: List[int] = []
+        columns: List[int] = []
+        for index, (output_token_ids, processor) in self._rows.items():
+            banned_tokens = processor.banned_tokens(output_token_ids)
+            rows.extend([index] * len(banned_tokens))
+            columns.extend(banned_tokens)
+        if rows:
+            row_index = torch.tensor(rows, dtype=torch.long, pin_memory=self.is_pin_memory)
+            column_index = torch.tensor(columns, dtype=torch.long, pin_memory=self.is_pin_memory)
+            logits[
+                row_index.to(self.device, non_blocking=True),
+                column_index.to(self.device, non_blocking=True),
+            ] = -float("inf")
+        return logits
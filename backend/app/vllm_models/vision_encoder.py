@@ -0,0 +1,140 @@
+"""
+独立的 DeepSeek-OCR 视觉编码器（编码 / 解码分离）
+
+结构与参数名和 DeepseekOCRForCausalLM 的视觉部分（sam_model / vision_model / projector /
+image_newline / view_seperator）一致，只从检查点读取这些权重，不依赖 vLLM。
+输出的 image token 特征可作为 ImageEmbeddingItems 直接提交给语言模型引擎，
+使视觉编码可以在单独的设备 / 工作线程上运行，与解码分开扩容。
+"""
+import glob
+import os
+from typing import Iterable, Iterator, List, Optional, Sequence, Set, Tuple, Union
+
+import torch
+import torch.nn as nn
+from addict import Dict
+
+from .config import VISION_COMPILE_SHAPES, VISION_ENCODER_MAX_BATCH
+from .deepencoder.build_linear import MlpProjector
+from .deepencoder.clip_sdpa import build_clip_l
+from .deepencoder.embedding_cache import VisionEmbeddingCache, read_image_keys
+from .deepencoder.pos_cache import clear_position_caches
+from .deepencoder.sam_vary_sdpa import build_sam_vit_b
+from .deepencoder.view_encoder import VisionEncoderRunner, pixel_values_to_embedding, read_crop_shapes
+
+# 检查点中视觉部分的参数名片段（与 DeepseekOCRForCausalLM.load_weights 的判断一致）
+VISION_WEIGHT_NAMES = ('sam_model', 'vision_model', 'projector', 'image_newline', 'view_seperator')
+
+
+def iter_vision_weights(model_path: str) -> Iterator[Tuple[str, torch.Tensor]]:
+    """只读取检查点中的视觉权重（按名字过滤后再加载张量，不读入语言模型权重）"""
+    from safetensors import safe_open
+
+    if os.path.isdir(model_path):
+        directory = model_path
+    else:
+        from huggingface_hub import snapshot_download
+        directory = snapshot_download(model_path, allow_patterns=["*.safetensors", "*.json"])
+
+    files = sorted(glob.glob(os.path.join(directory, "*.safetensors")))
+    if not files:
+        raise FileNotFoundError(f"未找到 safetensors 权重: {directory}")
+    for path in files:
+        with safe_open(path, framework="pt") as f:
+            for name in f.keys():
+                if any(part in name for part in VISION_WEIGHT_NAMES):
+                    yield name, f.get_tensor(name)
+
+
+class DeepseekOCRVisionEncoder(nn.Module):
+
+    def __init__(
+        self,
+        compile_mode: str = "off",
+        max_batch: int = VISION_ENCODER_MAX_BATCH,
+        cache_bytes: int = 0,
+    ) -> None:
+        super().__init__()
+        self.sam_model = build_sam_vit_b()
+        self.vision_model = build_clip_l()
+
+        n_embed = 1280
+        self.projector = MlpProjector(Dict(projector_type="linear", input_dim=2048, n_embed=n_embed))
+        embed_std = 1 / torch.sqrt(torch.tensor(n_embed, dtype=torch.float32))
+        self.image_newline = nn.Parameter(torch.randn(n_embed) * embed_std)
+        self.view_seperator = nn.Parameter(torch.randn(n_embed) * embed_std)
+
+        self.runner = VisionEncoderRunner(
+            self.sam_model, self.vision_model, self.projector, compile_mode=compile_mode, max_batch=max_batch
+        )
+        self.cache = VisionEmbeddingCache(cache_bytes, name="vision_cache.stage")
+
+    @classmethod
+    def from_pretrained(
+        cls,
+        model_path: str,
+        device: Union[str, torch.device] = "cuda",
+        dtype: torch.dtype = torch.bfloat16,
+        **kwargs,
+    ) -> "DeepseekOCRVisionEncoder":
+        """构建并加载视觉权重，dtype 与语言模型引擎内的视觉部分一致（bfloat16）时两条路径输出相同"""
+        encoder = cls(**kwargs)
+        encoder.load_weights(iter_vision_weights(model_path))
+        encoder.to(device=device, dtype=dtype).eval()
+        encoder.warmup(dtype=dtype)
+        return encoder
+
+    @property
+    def device(self) -> torch.device:
+        return self.image_newline.device
+
+    @property
+    def dtype(self) -> torch.dtype:
+        return self.image_newline.dtype
+
+    def load_weights(self, weights: Iterable[Tuple[str, torch.Tensor]]) -> Set[str]:
+        """加载检查点权重（名字带 model. 前缀），忽略语言模型权重；视觉参数缺失时报错"""
+        state = {}
+        for name, tensor in weights:
+            if any(part in name for part in VISION_WEIGHT_NAMES):
+                state[name.replace('model.', '', 1)] = tensor
+        self.load_state_dict(state, strict=False)
+        missing = {name for name, _ in self.named_parameters()} - set(state)
+        if missing:
+            raise ValueError(f"检查点缺少视觉权重: {sorted(missing)[:5]} 等 {len(missing)} 项")
+        clear_position_caches(self)
+        self.cache.clear()
+        return set(state)
+
+    def warmup(self, dtype: Optional[torch.dtype] = None) -> None:
+        self.runner.warmup(VISION_COMPILE_SHAPES, device=self.device, dtype=dtype or self.dtype)
+
+    def encode(
+        self,
+        pixel_values: Union[torch.Tensor, Sequence[torch.Tensor]],
+        images_crop: Union[torch.Tensor, Sequence[Optional[torch.Tensor]]],
+        images_spatial_crop: Union[torch.Tensor, Sequence[torch.Tensor]],
+        image_digests: Union[torch.Tensor, Sequence[torch.Tensor], None] = None,
+    ) -> List[torch.Tensor]:
+        """
+        输入与模型 forward 收到的多模态字段相同（pixel_values[j]: [1, 3, H, W]，images_crop[j]: [1, n_tiles, 3, h, w]，
+        没有切块的图像可为 None），返回每张图像的 image token 特征 [n_tokens, n_embed]
+        """
+        crop_shapes = read_crop_shapes(images_spatial_crop)
+        if not crop_shapes:
+            return []
+        image_keys = read_image_keys(image_digests, len(crop_shapes)) if self.cache.enabled else None
+        device = self.device
+        with torch.inference_mode():
+            return pixel_values_to_embedding(
+                self.runner,
+                self.image_newline,
+                self.view_seperator,
+                [pixel_values[jdx].to(device, non_blocking=True) for jdx in range(len(crop_shapes))],
+                [None if images_crop[jdx] is None else images_crop[jdx].to(device, non_blocking=True)
+                 for jdx in range(len(crop_shapes))],
+                crop_shapes,
+                dtype=self.dtype,
+                cache=self.cache,
+                image_keys=image_keys,
+            )
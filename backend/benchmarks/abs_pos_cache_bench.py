@@ -0,0 +1,70 @@
+"""
+绝对位置编码缓存基准
+
+对比 SAM / CLIP 编码器在每次前向都重新插值位置编码（清空缓存）与命中缓存时的耗时，
+并检查输出一致、权重原地重载后缓存失效。
+用法（在 backend 目录下）：python -m benchmarks.abs_pos_cache_bench --size 640 --repeat 3
+"""
+import argparse
+import time
+
+import torch
+
+from app.vllm_models.deepencoder.clip_sdpa import build_clip_l, get_abs_pos as clip_get_abs_pos
+from app.vllm_models.deepencoder.pos_cache import clear_position_caches
+from app.vllm_models.deepencoder.sam_vary_sdpa import build_sam_vit_b, get_abs_pos as sam_get_abs_pos
+
+
+def timed(func, repeat):
+    func()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return result, (time.perf_counter() - start) * 1000 / repeat
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=640, help="视图边长（640 切块 / 1024 全局视图）")
+    parser.add_argument("--batch", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    sam, clip = build_sam_vit_b().eval(), build_clip_l().eval()
+    models = torch.nn.ModuleList([sam, clip])
+    views = torch.randn(args.batch, 3, args.size, args.size)
+
+    def encode():
+        features_1 = sam(views)
+        return clip(views, features_1)
+
+    with torch.no_grad():
+        # 单独的插值开销
+        sam_tokens = args.size // 16
+        clip_tokens = (args.size // 64) ** 2 + 1
+        _, sam_interp_ms = timed(lambda: sam_get_abs_pos(sam.pos_embed, sam_tokens), args.repeat * 10)
+        clip_pos = clip.embeddings.position_embedding(clip.embeddings.position_ids)
+        _, clip_interp_ms = timed(lambda: clip_get_abs_pos(clip_pos, clip_tokens), args.repeat * 10)
+
+        def uncached():
+            clear_position_caches(models)
+            return encode()
+
+        expected, uncached_ms = timed(uncached, args.repeat)
+        actual, cached_ms = timed(encode, args.repeat)
+        assert torch.equal(expected, actual), "缓存前后输出不一致"
+
+        # 模拟 load_weights：原地写入权重后清空缓存，输出应反映新权重
+        sam.pos_embed.data.copy_(torch.randn_like(sam.pos_embed))
+        clear_position_caches(models)
+        reloaded = encode()
+        clear_position_caches(models)
+        assert torch.equal(reloaded, encode()) and not torch.equal(reloaded, actual), "重载后缓存未失效"
+
+    print(f"size={args.size} batch={args.batch}  interp sam {sam_interp_ms:.2f} ms  clip {clip_interp_ms:.2f} ms")
+    print(f"encoder forward  uncached {uncached_ms:.1f} ms  cached {cached_ms:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+超大图像解码基准
+
+对比原始解码路径（完整解码 + exif_transpose + convert）与 ImageUtils.decode_reduced 的耗时、
+像素内存峰值，并检查切图网格一致、模型输入张量与原路径的差异。
+--raw-image 模拟 v1 引擎直接提交 RGB 图像：引擎内处理器按 DEFAULT_MODE 重新预处理，解码降采样须以该模式为准，
+同时打印按请求模式降采样（旧行为）时处理器得到的网格与差异。
+用法（在 backend 目录下）：python -m benchmarks.image_decode_bench --repeat 3
+                          python -m benchmarks.image_decode_bench --raw-image --mode tiny
+"""
+import argparse
+import io
+import time
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from app.utils.image_utils import ImageUtils
+from app.vllm_models.config import DEFAULT_MODE, OCR_MODES
+from app.vllm_models.process.image_process import (ImageTransform, build_image_views, decode_factor_for_mode,
+                                                   decode_mode_for_request)
+
+# 名称 -> (尺寸, 格式, EXIF 方向, 像素模式)；P / 1 / I;16 覆盖 Image.reduce 不支持的模式
+SOURCES = {
+    "phone-48mp-jpeg": ((8000, 6000), "JPEG", 6, "RGB"),
+    "scan-600dpi-jpeg": ((4960, 7016), "JPEG", 1, "RGB"),
+    "scan-600dpi-png": ((4960, 7016), "PNG", 1, "RGB"),
+    "scan-palette-png": ((4960, 7016), "PNG", 1, "P"),
+    "scan-16bit-png": ((4960, 7016), "PNG", 1, "I;16"),
+    "scan-1bit-tiff": ((4960, 7016), "TIFF", 8, "1"),
+    "a4-150dpi-jpeg": ((1240, 1754), "JPEG", 1, "RGB"),
+}
+
+
+def make_source(size, fmt, orientation, mode) -> bytes:
+    rng = np.random.default_rng(0)
+    # 低频内容 + 噪声，接近真实照片 / 扫描件的压缩特性
+    small = rng.integers(0, 256, (size[1] // 64, size[0] // 64, 3), dtype=np.uint8)
+    image = Image.fromarray(small).resize(size, Image.Resampling.BILINEAR)
+    if mode == "P":
+        image = image.quantize(64)
+    elif mode == "I;16":
+        image = Image.fromarray(np.asarray(image.convert("L"), dtype=np.uint16) * 257)
+    elif mode != "RGB":
+        image = image.convert(mode)
+    exif = Image.Exif()
+    if orientation != 1:
+        exif[0x0112] = orientation
+    buffer = io.BytesIO()
+    image.save(buffer, fmt, exif=exif.tobytes(), **({"quality": 90} if fmt == "JPEG" else {}))
+    return buffer.getvalue()
+
+
+def reference_decode(data: bytes):
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    decoded = ImageUtils.pixel_nbytes(image)
+    transposed = ImageOps.exif_transpose(image)
+    rgb = transposed.convert("RGB")
+    # 原路径中三份整图像素同时可达（原图、旋转副本、RGB 副本）
+    peak = decoded + ImageUtils.pixel_nbytes(transposed) + ImageUtils.pixel_nbytes(rgb)
+    return rgb, peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--mode", default="gundam", choices=sorted(OCR_MODES))
+    parser.add_argument("--raw-image", action="store_true", help="v1 引擎 raw-image 路径（处理器按 DEFAULT_MODE 预处理）")
+    parser.add_argument("--official-model", action="store_true", help="raw-image 路径使用 vLLM 内置模型（不降采样）")
+    args = parser.parse_args()
+
+    mode = OCR_MODES[args.mode]
+    # raw-image 时请求模式只影响解码，实际预处理按处理器的固定模式
+    processor_mode = DEFAULT_MODE if args.raw_image else mode
+    decode_mode = decode_mode_for_request(mode, args.raw_image, args.official_model)
+    print(f"request mode {mode}  processor mode {processor_mode}  decode mode {decode_mode}")
+    transform = ImageTransform()
+    for name, (size, fmt, orientation, pixel_mode) in SOURCES.items():
+        data = make_source(size, fmt, orientation, pixel_mode)
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            reference, reference_peak = reference_decode(data)
+        reference_ms = (time.perf_counter() - start) * 1000 / args.repeat
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            reduced, reduced_peak = ImageUtils.decode_reduced(io.BytesIO(data), decode_factor_for_mode(decode_mode))
+        reduced_ms = (time.perf_counter() - start) * 1000 / args.repeat
+
+        def views(image):
+            return build_image_views([image], processor_mode.crop_mode, processor_mode.base_size,
+                                     processor_mode.image_size, transform)
+
+        ref_views = views(reference)
+        new_views = views(reduced)
+        assert ref_views[2] == new_views[2], f"{name}: 切图网格不一致 {ref_views[2]} != {new_views[2]}"
+        global_diff = (ref_views[0] - new_views[0]).abs().mean().item()
+        crop_diff = (ref_views[1] - new_views[1]).abs().mean().item()
+
+        print(
+            f"{name:18s} {reference.size} -> {reduced.size}  "
+            f"decode {reference_ms:7.1f} -> {reduced_ms:7.1f} ms  "
+            f"peak {reference_peak / 2**20:6.1f} -> {reduced_peak / 2**20:6.1f} MiB  "
+            f"grid {new_views[2][0]}  mean|Δ| global {global_diff:.4f} crops {crop_diff:.4f}"
+        )
+        if args.raw_image and decode_mode != mode:
+            legacy, _ = ImageUtils.decode_reduced(io.BytesIO(data), decode_factor_for_mode(mode))
+            legacy_views = views(legacy)
+            legacy_diff = (ref_views[0] - legacy_views[0]).abs().mean().item()
+            print(
+                f"{'':18s} request-mode decode {legacy.size}  grid {legacy_views[2][0]}"
+                f"{'' if legacy_views[2] == ref_views[2] else ' (grid changed)'}  mean|Δ| global {legacy_diff:.4f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+image token 布局一致性检查
+
+对比原始 view / permute / torch.cat 拼接实现与 view_encoder.layout_image_features（缓存布局 + 预分配输出上的跨步视图写入）
+在各种切图网格、全局 / 切块尺寸与 dtype 下的输出（要求逐位一致）和耗时。
+用法（在 backend 目录下）：python -m benchmarks.image_layout_check --repeat 200
+"""
+import argparse
+import time
+
+import torch
+
+from app.vllm_models.deepencoder.view_encoder import layout_image_features
+
+
+def reference_layout(global_features, local_features, crop_shape, image_newline, view_seperator):
+    """原始实现"""
+    _, hw, n_dim = global_features.shape
+    h = w = int(hw ** 0.5)
+    global_features = global_features.view(h, w, n_dim)
+    global_features = torch.cat(
+        [global_features, image_newline[None, None, :].expand(h, 1, n_dim)], dim=1
+    )
+    global_features = global_features.view(-1, n_dim)
+
+    if local_features is None:
+        return torch.cat([global_features, view_seperator[None, :]], dim=0)
+
+    _, hw2, n_dim2 = local_features.shape
+    h2 = w2 = int(hw2 ** 0.5)
+    width_crop_num, height_crop_num = crop_shape
+    local_features = local_features.view(height_crop_num, width_crop_num, h2, w2, n_dim2).permute(0, 2, 1, 3, 4).reshape(height_crop_num*h2, width_crop_num*w2, n_dim2)
+    local_features = torch.cat(
+        [local_features, image_newline[None, None, :].expand(height_crop_num * h2, 1, n_dim2)], dim=1
+    )
+    local_features = local_features.view(-1, n_dim2)
+    return torch.cat([local_features, global_features, view_seperator[None, :]], dim=0)
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) * 1000 / repeat
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    n_dim = 1280
+    # (全局视图 token 边长, 切块 token 边长, 切图网格)：512/640/1024/1280 全局视图，640 切块
+    cases = [(8, 0, (1, 1)), (10, 0, (1, 1)), (16, 0, (1, 1)), (20, 0, (1, 1))]
+    cases += [(16, 10, grid) for grid in [(2, 1), (1, 2), (2, 2), (3, 2), (2, 3), (3, 3), (4, 2), (1, 9)]]
+    for dtype in (torch.float32, torch.bfloat16):
+        image_newline = torch.randn(n_dim, dtype=dtype)
+        view_seperator = torch.randn(n_dim, dtype=dtype)
+        for side, side2, grid in cases:
+            global_features = torch.randn(1, side * side, n_dim, dtype=dtype)
+            local_features = None
+            if side2:
+                local_features = torch.randn(grid[0] * grid[1], side2 * side2, n_dim, dtype=dtype)
+            layout_args = (global_features, local_features, grid, image_newline, view_seperator)
+            expected = reference_layout(*layout_args)
+            actual = layout_image_features(*layout_args)
+            assert actual.dtype == expected.dtype and torch.equal(actual, expected), \
+                f"布局不一致: side={side} side2={side2} grid={grid} dtype={dtype}"
+            if dtype == torch.bfloat16 and (side2 == 0 or grid == (3, 3)):
+                reference_ms = timed(lambda: reference_layout(*layout_args), args.repeat)
+                layout_ms = timed(lambda: layout_image_features(*layout_args), args.repeat)
+                print(f"side={side:2d} side2={side2:2d} grid={grid}  tokens={expected.size(0):4d}  "
+                      f"cat {reference_ms:.3f} ms  preallocated {layout_ms:.3f} ms")
+    print(f"layout identical for {2 * len(cases)} cases")
+
+
+if __name__ == "__main__":
+    main()
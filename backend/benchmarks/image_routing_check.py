@@ -0,0 +1,62 @@
+"""
+多模态前向分支一致性检查（CPU）
+
+原实现用 torch.sum(pixel_values).item() 判断占位输入、torch.sum(patches).item() 判断是否有局部切块，
+每次都触发设备同步；现在只读 images_spatial_crop 元数据。本脚本对各种图像尺寸与模式的处理器输出
+逐图对比两种判断结果（浮点与 uint8 像素传输都检查）。
+用法（在 backend 目录下）：python -m benchmarks.image_routing_check
+"""
+import torch
+from PIL import Image
+
+from app.vllm_models.config import OCR_MODES
+from app.vllm_models.deepencoder.view_encoder import read_crop_shapes
+from app.vllm_models.process.image_process import ImageTransform, build_image_views
+
+SIZES = [(300, 400), (640, 640), (641, 200), (1240, 1754), (4000, 3000), (800, 6000), (5000, 700)]
+
+
+def processor_outputs(images, mode, uint8_pixels):
+    """与 tokenize_with_images 相同的 (pixel_values, images_crop, images_spatial_crop)"""
+    pixel_values, images_crop, crop_ratios = build_image_views(
+        images, mode.crop_mode, mode.base_size, mode.image_size, ImageTransform(), uint8_pixels=uint8_pixels)
+    if not images:
+        images_spatial_crop = torch.zeros((1, 1), dtype=torch.long)
+    else:
+        images_spatial_crop = torch.tensor([list(ratio) for ratio in crop_ratios], dtype=torch.long)
+    # 与 vLLM 批级字段一致：每张图多一维 batch_size = 1
+    return pixel_values.unsqueeze(1), images_crop, images_spatial_crop.unsqueeze(1)
+
+
+def legacy_routing(pixel_values, images_crop):
+    """原实现：对浮点像素求和（每次 .item() 都是一次同步）；与 API 一致，每个请求一张图像"""
+    if torch.sum(pixel_values).item() == 0:
+        return None
+    return [torch.sum(images_crop[0]).item() != 0]
+
+
+def metadata_routing(images_spatial_crop):
+    crop_shapes = read_crop_shapes(images_spatial_crop)
+    if not crop_shapes:
+        return None
+    return [width > 1 or height > 1 for width, height in crop_shapes]
+
+
+def main() -> None:
+    checked = 0
+    for mode_name, mode in OCR_MODES.items():
+        cases = [[]] + [[Image.new("RGB", size, (37, 91, 180))] for size in SIZES]
+        for images in cases:
+            pixel_values, images_crop, spatial_crop = processor_outputs(images, mode, uint8_pixels=False)
+            expected = legacy_routing(pixel_values, images_crop)
+            for uint8_pixels in (False, True):
+                _, _, spatial_crop = processor_outputs(images, mode, uint8_pixels)
+                actual = metadata_routing(spatial_crop)
+                assert actual == expected, (
+                    f"{mode_name} {[image.size for image in images]} uint8={uint8_pixels}: {actual} != {expected}")
+                checked += 1
+    print(f"routing identical for {checked} processor outputs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+图像视图构建基准
+
+对比原始逐块 crop + ToTensor + Normalize + stack 的实现与 build_image_views 的输出（要求逐位一致）和耗时。
+两条路径交替执行、各取中位数，避免先后顺序与 CPU 频率漂移造成的偏差；convert 列单独对比全局视图的
+张量转换（ToTensor + Normalize 与 ImageTransform.fill），不含两条路径共用的 PIL 缩放 / 填充。
+不切图的模式（base / small）耗时主要是共用的 PIL 缩放，整体加速比接近 1x；convert 变慢才算回退（退出码 1）。
+用法（在 backend 目录下）：python -m benchmarks.image_views_bench --repeat 5
+"""
+import argparse
+import time
+
+import numpy as np
+import torch
+from PIL import Image, ImageOps
+
+from app.vllm_models.config import OCR_MODES
+from app.vllm_models.process.image_process import ImageTransform, build_image_views, dynamic_preprocess
+
+PAGE_SIZES = {
+    "a4-150dpi": (1240, 1754),
+    "letter-200dpi": (1700, 2200),
+    "a4-300dpi": (2480, 3508),
+    "photo-12mp": (4000, 3000),
+    "small": (600, 800),
+}
+
+
+def reference_views(images, cropping, base_size, image_size, image_transform):
+    """原始实现（tokenize_with_images 中的图像部分）"""
+    images_list, images_crop_list, crop_ratios = [], [], []
+    for image in images:
+        if image.size[0] <= 640 and image.size[1] <= 640:
+            crop_ratio = [1, 1]
+        elif cropping:
+            images_crop_raw, crop_ratio = dynamic_preprocess(image, image_size=image_size)
+        else:
+            crop_ratio = [1, 1]
+        if image_size <= 640 and not cropping:
+            image = image.resize((image_size, image_size))
+        global_view = ImageOps.pad(image, (base_size, base_size),
+                                   color=tuple(int(x * 255) for x in image_transform.mean))
+        images_list.append(image_transform(global_view))
+        if crop_ratio[0] > 1 or crop_ratio[1] > 1:
+            for crop in images_crop_raw:
+                images_crop_list.append(image_transform(crop))
+        crop_ratios.append(tuple(crop_ratio))
+    pixel_values = torch.stack(images_list, dim=0)
+    if images_crop_list:
+        images_crop = torch.stack(images_crop_list, dim=0).unsqueeze(0)
+    else:
+        images_crop = torch.zeros((1, 3, image_size, image_size)).unsqueeze(0)
+    return pixel_values, images_crop, crop_ratios
+
+
+def synthetic_page(width, height, seed):
+    rng = np.random.default_rng(seed)
+    # 低频底色 + 噪声，避免纯色图让缩放退化
+    base = rng.integers(0, 256, size=(height // 16 + 1, width // 16 + 1, 3), dtype=np.uint8)
+    image = Image.fromarray(base).resize((width, height), Image.BILINEAR)
+    noise = rng.integers(0, 32, size=(height, width, 3), dtype=np.uint8)
+    return Image.fromarray(np.asarray(image) // 2 + noise)
+
+
+def timed_pair(fn_a, fn_b, repeat):
+    """交替执行两个函数，返回 (结果 a, 结果 b, 中位耗时 a ms, 中位耗时 b ms)"""
+    times = ([], [])
+    results = [None, None]
+    for _ in range(repeat):
+        for index, fn in enumerate((fn_a, fn_b)):
+            start = time.perf_counter()
+            results[index] = fn()
+            times[index].append(time.perf_counter() - start)
+    return results[0], results[1], float(np.median(times[0])) * 1000, float(np.median(times[1])) * 1000
+
+
+def convert_pair(image, mode, transform):
+    """全局视图的张量转换：原 ToTensor + Normalize 与 ImageTransform.fill"""
+    if mode.image_size <= 640 and not mode.crop_mode:
+        image = image.resize((mode.image_size, mode.image_size))
+    global_view = ImageOps.pad(image, (mode.base_size, mode.base_size),
+                               color=tuple(int(x * 255) for x in transform.mean))
+    out = torch.empty((3, mode.base_size, mode.base_size))
+    return lambda: transform(global_view), lambda: transform.fill(out, np.array(global_view))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--modes", nargs="+", default=["gundam", "base", "small"])
+    args = parser.parse_args()
+
+    torch.set_num_threads(1)
+    transform = ImageTransform()
+    failed = False
+    for mode_name in args.modes:
+        mode = OCR_MODES[mode_name]
+        for page_name, (width, height) in PAGE_SIZES.items():
+            images = [synthetic_page(width, height, seed=width + height)]
+            view_args = (images, mode.crop_mode, mode.base_size, mode.image_size, transform)
+            expected, actual, reference_ms, vectorized_ms = timed_pair(
+                lambda: reference_views(*view_args), lambda: build_image_views(*view_args), args.repeat
+            )
+            _, _, to_tensor_ms, fill_ms = timed_pair(*convert_pair(images[0], mode, transform), args.repeat)
+            identical = (
+                torch.equal(expected[0], actual[0])
+                and torch.equal(expected[1], actual[1])
+                and list(expected[2]) == [tuple(r) for r in actual[2]]
+            )
+            failed |= not identical or fill_ms > to_tensor_ms
+            print(f"{mode_name:7s} {page_name:14s} tiles={tuple(actual[2][0])} "
+                  f"reference={reference_ms:8.2f} ms  vectorized={vectorized_ms:8.2f} ms  "
+                  f"speedup={reference_ms / vectorized_ms:5.2f}x  "
+                  f"convert {to_tensor_ms:6.2f} -> {fill_ms:6.2f} ms  identical={identical}")
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+NoRepeatNGramLogitsProcessor 微基准
+
+对比原始逐窗口重建实现与增量 n-gram 索引的每 token 耗时，并校验两者屏蔽结果一致。
+用法（在 backend 目录下）：python -m benchmarks.ngram_norepeat_bench --tokens 8192
+"""
+import argparse
+import random
+import time
+from typing import List, Set
+
+from app.vllm_models.process.ngram_norepeat import NoRepeatNGramLogitsProcessor
+
+
+def reference_banned_tokens(
+    input_ids: List[int], ngram_size: int, window_size: int, whitelist: Set[int]
+) -> Set[int]:
+    """原始实现：每步重建窗口内全部 n-gram"""
+    if len(input_ids) < ngram_size:
+        return set()
+    current_prefix = tuple(input_ids[-(ngram_size - 1):])
+    search_start = max(0, len(input_ids) - window_size)
+    search_end = len(input_ids) - ngram_size + 1
+    banned_tokens = set()
+    for i in range(search_start, search_end):
+        ngram = tuple(input_ids[i:i + ngram_size])
+        if ngram[:-1] == current_prefix:
+            banned_tokens.add(ngram[-1])
+    return banned_tokens - whitelist
+
+
+def generate_tokens(count: int, vocab: int, loop_every: int, seed: int) -> List[int]:
+    """生成带周期性重复片段的 token 序列，模拟表格等易重复的输出"""
+    rng = random.Random(seed)
+    tokens: List[int] = []
+    while len(tokens) < count:
+        if tokens and rng.random() < 1 / loop_every:
+            span = rng.randint(8, 64)
+            tokens.extend(tokens[-span:])
+        else:
+            tokens.append(rng.randrange(vocab))
+    return tokens[:count]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tokens", type=int, default=8192)
+    parser.add_argument("--ngram-size", type=int, default=30)
+    parser.add_argument("--window-size", type=int, default=90)
+    parser.add_argument("--vocab", type=int, default=512)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    whitelist = {128821, 128822}
+    tokens = generate_tokens(args.tokens, args.vocab, loop_every=50, seed=args.seed)
+
+    start = time.perf_counter()
+    expected = [
+        reference_banned_tokens(tokens[:step], args.ngram_size, args.window_size, whitelist)
+        for step in range(1, len(tokens) + 1)
+    ]
+    reference_s = time.perf_counter() - start
+
+    processor = NoRepeatNGramLogitsProcessor(
+        ngram_size=args.ngram_size, window_size=args.window_size, whitelist_token_ids=whitelist
+    )
+    # 模拟解码：每步传入持续增长的同一个列表
+    prefix: List[int] = []
+    actual = []
+    start = time.perf_counter()
+    for token in tokens:
+        prefix.append(token)
+        actual.append(processor.banned_tokens(prefix))
+    incremental_s = time.perf_counter() - start
+
+    mismatches = sum(1 for a, b in zip(actual, expected) if a != b)
+    banned_steps = sum(1 for banned in expected if banned)
+    print(f"tokens={len(tokens)} ngram={args.ngram_size} window={args.window_size} banned_steps={banned_steps}")
+    print(f"reference:   {reference_s * 1e6 / len(tokens):8.2f} us/token")
+    print(f"incremental: {incremental_s * 1e6 / len(tokens):8.2f} us/token")
+    print(f"speedup:     {reference_s / incremental_s:8.2f}x  mismatches={mismatches}")
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+SAM 相对位置表缓存基准（CPU）
+
+对比 ImageEncoderViT.forward 每次都重新构建相对位置下标 / 插值相对位置表（清空缓存）与命中缓存时
+处理一页（gundam：1 个全局视图 + 若干 640 切块）的耗时，并检查输出逐位一致。
+用法（在 backend 目录下）：python -m benchmarks.sam_rel_pos_bench --tiles 6 --repeat 2
+"""
+import argparse
+import time
+
+import torch
+
+from app.vllm_models.deepencoder.pos_cache import clear_position_caches
+from app.vllm_models.deepencoder.sam_vary_sdpa import build_sam_vit_b, get_rel_pos, rel_pos_index
+
+
+def clear_caches(model):
+    clear_position_caches(model)
+    rel_pos_index.cache_clear()
+
+
+def timed(func, repeat):
+    func()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return result, (time.perf_counter() - start) * 1000 / repeat
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-size", type=int, default=1024)
+    parser.add_argument("--image-size", type=int, default=640)
+    parser.add_argument("--tiles", type=int, default=6)
+    parser.add_argument("--repeat", type=int, default=2)
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    sam = build_sam_vit_b().eval()
+    # 随机化相对位置参数，保证插值与查表确实参与计算
+    for name, param in sam.named_parameters():
+        if "rel_pos" in name:
+            param.data.normal_()
+    global_view = torch.randn(1, 3, args.base_size, args.base_size)
+    tiles = torch.randn(args.tiles, 3, args.image_size, args.image_size)
+
+    def page():
+        outputs = [sam(global_view)]
+        if args.tiles:
+            outputs.append(sam(tiles))
+        return outputs
+
+    def uncached_page():
+        clear_caches(sam)
+        return page()
+
+    with torch.no_grad():
+        # 每次前向中相对位置表的构建开销（窗口块 14x14，全局块为整个网格，640 切块需插值 64 -> 40）
+        def table_work(size):
+            grid = size // 16
+            for block in sam.blocks:
+                side = block.window_size or grid
+                rel_pos_index.cache_clear()
+                get_rel_pos(side, side, block.attn.rel_pos_h)
+                get_rel_pos(side, side, block.attn.rel_pos_w)
+
+        _, global_table_ms = timed(lambda: table_work(args.base_size), 20)
+        _, tile_table_ms = timed(lambda: table_work(args.image_size), 20)
+
+        expected, uncached_ms = timed(uncached_page, args.repeat)
+        actual, cached_ms = timed(page, args.repeat)
+    for a, b in zip(expected, actual):
+        assert torch.equal(a, b), "缓存前后输出不一致"
+
+    print(f"rel-pos tables per forward (uncached)  global {global_table_ms:.2f} ms  tiles {tile_table_ms:.2f} ms  "
+          f"-> {global_table_ms + tile_table_ms:.2f} ms per page saved by the cache")
+    # CPU 上整页前向耗时波动远大于查表开销，端到端差值仅供参考
+    print(f"page (1x{args.base_size} + {args.tiles}x{args.image_size})  uncached {uncached_ms:.1f} ms  "
+          f"cached {cached_ms:.1f} ms  saving {uncached_ms - cached_ms:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
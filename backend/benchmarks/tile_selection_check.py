@@ -0,0 +1,70 @@
+"""
+切图网格选择一致性校验
+
+逐一遍历宽高组合，确认预计算比例表 + 记忆化的 select_tile_ratio 与原始逐次构建的实现选择完全一致，
+并给出两者的单次耗时。
+用法（在 backend 目录下）：python -m benchmarks.tile_selection_check --max-side 4096 --step 7
+"""
+import argparse
+import time
+
+from app.vllm_models.config import MAX_CROPS, MIN_CROPS
+from app.vllm_models.process.image_process import find_closest_aspect_ratio, select_tile_ratio
+
+
+def reference_tile_ratio(orig_width, orig_height, min_num=MIN_CROPS, max_num=MAX_CROPS, image_size=640):
+    """原始实现：每次调用重新构建并排序候选比例"""
+    aspect_ratio = orig_width / orig_height
+    target_ratios = set(
+        (i, j) for n in range(min_num, max_num + 1) for i in range(1, n + 1) for j in range(1, n + 1) if
+        i * j <= max_num and i * j >= min_num)
+    target_ratios = sorted(target_ratios, key=lambda x: x[0] * x[1])
+    return find_closest_aspect_ratio(aspect_ratio, target_ratios, orig_width, orig_height, image_size)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--min-side", type=int, default=1)
+    parser.add_argument("--max-side", type=int, default=4096)
+    parser.add_argument("--step", type=int, default=7)
+    parser.add_argument("--image-sizes", type=int, nargs="+", default=[512, 640, 1024])
+    args = parser.parse_args()
+
+    sides = list(range(args.min_side, args.max_side + 1, args.step))
+    # 覆盖切图阈值与常见页面尺寸附近的边界
+    sides += [639, 640, 641, 1024, 1240, 1654, 1700, 2200, 2480, 3508, 4000, 6000, 8000]
+    checked = mismatches = 0
+    for image_size in args.image_sizes:
+        for min_num, max_num in ((MIN_CROPS, MAX_CROPS), (1, 6), (2, 6)):
+            for width in sides:
+                for height in sides:
+                    expected = reference_tile_ratio(width, height, min_num, max_num, image_size)
+                    actual = select_tile_ratio(width, height, image_size, min_num, max_num)
+                    checked += 1
+                    if tuple(expected) != tuple(actual):
+                        mismatches += 1
+                        if mismatches <= 10:
+                            print(f"mismatch: {width}x{height} image_size={image_size} "
+                                  f"crops=({min_num},{max_num}) expected={expected} actual={actual}")
+
+    pages = [(1240, 1754), (2480, 3508), (1700, 2200), (4000, 3000)]
+    iterations = 20000
+    start = time.perf_counter()
+    for i in range(iterations):
+        width, height = pages[i % len(pages)]
+        reference_tile_ratio(width, height)
+    reference_us = (time.perf_counter() - start) * 1e6 / iterations
+    start = time.perf_counter()
+    for i in range(iterations):
+        width, height = pages[i % len(pages)]
+        select_tile_ratio(width, height)
+    cached_us = (time.perf_counter() - start) * 1e6 / iterations
+
+    print(f"checked={checked} mismatches={mismatches}")
+    print(f"reference: {reference_us:.2f} us/call  cached: {cached_us:.2f} us/call")
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+视觉编码批量前向一致性检查
+
+用随机初始化的 SAM / CLIP / projector 在 CPU 上对比逐图编码（原 _pixel_values_to_embedding，
+特征布局沿用原实现的 view + cat 拼接，不依赖 layout_image_features）与 view_encoder.pixel_values_to_embedding
+的输出与耗时。
+用法（在 backend 目录下）：python -m benchmarks.vision_batch_check --images 4 --base-size 512 --image-size 256
+"""
+import argparse
+import time
+
+import torch
+from addict import Dict
+
+from app.vllm_models.deepencoder.build_linear import MlpProjector
+from app.vllm_models.deepencoder.clip_sdpa import build_clip_l
+from app.vllm_models.deepencoder.sam_vary_sdpa import build_sam_vit_b
+from app.vllm_models.deepencoder.view_encoder import (VisionEncoderRunner, pixel_values_to_embedding,
+                                                     read_crop_shapes)
+
+
+def encode(model, view):
+    features_1 = model.sam_model(view)
+    features_2 = model.vision_model(view, features_1)
+    return model.projector(torch.cat((features_2[:, 1:], features_1.flatten(2).permute(0, 2, 1)), dim=-1))
+
+
+def reference_layout(global_features, local_features, crop_shape, image_newline, view_seperator):
+    """原实现的布局：全局 / 局部特征各自拼接换行符后按 [局部, 全局, 分隔符] 拼接"""
+    _, hw, n_dim = global_features.shape
+    h = w = int(hw ** 0.5)
+    global_features = global_features.view(h, w, n_dim)
+    global_features = torch.cat([global_features, image_newline[None, None, :].expand(h, 1, n_dim)], dim=1)
+    global_features = global_features.view(-1, n_dim)
+    if local_features is None:
+        return torch.cat([global_features, view_seperator[None, :]], dim=0)
+
+    _, hw2, n_dim2 = local_features.shape
+    h2 = w2 = int(hw2 ** 0.5)
+    width_crop_num, height_crop_num = crop_shape[0], crop_shape[1]
+    local_features = local_features.view(height_crop_num, width_crop_num, h2, w2, n_dim2).permute(
+        0, 2, 1, 3, 4).reshape(height_crop_num * h2, width_crop_num * w2, n_dim2)
+    local_features = torch.cat(
+        [local_features, image_newline[None, None, :].expand(height_crop_num * h2, 1, n_dim2)], dim=1
+    )
+    local_features = local_features.view(-1, n_dim2)
+    return torch.cat([local_features, global_features, view_seperator[None, :]], dim=0)
+
+
+def reference_embedding(model, pixel_values, images_crop, images_spatial_crop):
+    """原始实现：每张图像分别编码全局视图与局部切块"""
+    outputs = []
+    with torch.no_grad():
+        for jdx in range(images_spatial_crop.size(0)):
+            crop_shape = images_spatial_crop[jdx][0].tolist()
+            local_features = None
+            if crop_shape[0] > 1 or crop_shape[1] > 1:
+                local_features = encode(model, images_crop[jdx][0].to(torch.float32))
+            global_features = encode(model, pixel_values[jdx])
+            outputs.append(reference_layout(
+                global_features, local_features, crop_shape, model.image_newline, model.view_seperator))
+    return outputs
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=4)
+    parser.add_argument("--base-size", type=int, default=512)
+    parser.add_argument("--image-size", type=int, default=256)
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    model = Dict(
+        sam_model=build_sam_vit_b().eval(),
+        vision_model=build_clip_l().eval(),
+        projector=MlpProjector(Dict(projector_type="linear", input_dim=2048, n_embed=1280)).eval(),
+        image_newline=torch.randn(1280),
+        view_seperator=torch.randn(1280),
+    )
+
+    # 交替使用有 / 无切块的图像，切块网格各不相同
+    grids = [(2, 3), (1, 1), (3, 2), (2, 2), (1, 1), (3, 3)]
+    spatial_crop = torch.tensor([[grids[i % len(grids)]] for i in range(args.images)], dtype=torch.long)
+    pixel_values = torch.randn(args.images, 1, 3, args.base_size, args.base_size)
+    images_crop = [
+        torch.randint(0, 256, (1, max(w * h, 1), 3, args.image_size, args.image_size), dtype=torch.uint8)
+        for w, h in spatial_crop[:, 0].tolist()
+    ]
+    reference_crop = [
+        (crop.to(torch.float32) / 255 - 0.5) / 0.5 for crop in images_crop
+    ]
+
+    start = time.perf_counter()
+    expected = reference_embedding(model, pixel_values, reference_crop, spatial_crop)
+    reference_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = pixel_values_to_embedding(
+        VisionEncoderRunner(model.sam_model, model.vision_model, model.projector),
+        model.image_newline, model.view_seperator,
+        pixel_values, images_crop, read_crop_shapes(spatial_crop), dtype=torch.float32,
+    )
+    batched_s = time.perf_counter() - start
+
+    max_diff = 0.0
+    for index, (a, b) in enumerate(zip(expected, actual)):
+        assert a.shape == b.shape, f"图像 {index}: 形状不一致 {tuple(a.shape)} != {tuple(b.shape)}"
+        max_diff = max(max_diff, (a - b).abs().max().item())
+    print(f"images={args.images}  per-image {reference_s:.2f}s  batched {batched_s:.2f}s  max|Δ|={max_diff:.2e}")
+    assert max_diff < 1e-3, "批量编码与逐图编码结果不一致"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+视觉编码器 torch.compile 检查（CPU + inductor）
+
+用随机权重对比 VisionEncoderRunner 在 eager 与编译模式下的输出与耗时（含预热耗时、不同 batch 与视图尺寸），
+并验证编译失败时回退到 eager。
+网格检查：两张切图图像（1024 全局视图 + 640 切块，切块总数超过 max_batch）经 pixel_values_to_embedding
+编码，先后多次调用编译后的前向再拼接布局；reduce-overhead 在 CUDA 上若返回 CUDA graph 缓冲区，
+先前的输出会被后续调用覆盖，与 eager 结果不一致（CPU 上不录制 CUDA graph，只验证数值）。
+CPU 上 inductor 编译 1024 / 640 视图需要数十分钟，网格检查默认改用直通后端（--grid-backend passthrough），
+仍走 reduce-overhead 的补齐 / 切片 / 复制路径；CUDA 上默认 inductor。
+用法（在 backend 目录下）：python -m benchmarks.vision_compile_check --mode reduce-overhead --device cuda
+"""
+import argparse
+import time
+
+import numpy as np
+import torch
+from addict import Dict
+from PIL import Image
+
+from app.vllm_models.deepencoder.build_linear import MlpProjector
+from app.vllm_models.deepencoder.clip_sdpa import build_clip_l
+from app.vllm_models.deepencoder.sam_vary_sdpa import build_sam_vit_b
+from app.vllm_models.deepencoder.view_encoder import (VISION_ENCODER_MAX_BATCH, VisionEncoderRunner,
+                                                     pixel_values_to_embedding, read_crop_shapes)
+from app.vllm_models.process.image_process import ImageTransform, build_image_views
+
+
+def failing_backend(gm, example_inputs):
+    raise RuntimeError("simulated compiler failure")
+
+
+def passthrough_backend(gm, example_inputs, **kwargs):
+    """不编译，直接执行 dynamo 捕获的图（接受 torch.compile 转发的 mode 参数）"""
+    return gm.forward
+
+
+def timed(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return result, (time.perf_counter() - start) * 1000 / repeat
+
+
+def check_grid(modules, mode: str, device: torch.device, max_batch: int, backend="inductor") -> None:
+    """多次编译前向的输出在拼接布局之前都须保持有效（切块分块数 > 1，全局视图先于切块编码）"""
+    rng = np.random.default_rng(0)
+    images = [Image.fromarray(rng.integers(0, 256, size, dtype=np.uint8)) for size in ((1400, 1000, 3), (1000, 1500, 3))]
+    pixel_values, images_crop, crop_ratios = build_image_views(images, True, 1024, 640, ImageTransform())
+    crop_shapes = read_crop_shapes(torch.tensor([list(ratio) for ratio in crop_ratios]))
+    offsets = np.cumsum([0] + [width * height for width, height in crop_shapes])
+    crops = [images_crop[0][offsets[j]:offsets[j + 1]].unsqueeze(0).to(device) for j in range(len(crop_shapes))]
+    globals_ = [pixel_values[j:j + 1].to(device) for j in range(len(crop_shapes))]
+    assert offsets[-1] > max_batch, "切块数须超过 max_batch 才能覆盖分块执行"
+
+    image_newline = torch.randn(1280, device=device)
+    view_seperator = torch.randn(1280, device=device)
+    eager = VisionEncoderRunner(**modules, max_batch=max_batch)
+    compiled = VisionEncoderRunner(**modules, compile_mode=mode, max_batch=max_batch, backend=backend)
+    # 只预热切块尺寸：全局视图只有 2 张（batch 2），1024 的大 batch 预热在 CPU 上内存不足，首次调用时再编译
+    compiled.warmup((640,), device=device, dtype=torch.float32)
+
+    def embed(runner):
+        return pixel_values_to_embedding(runner, image_newline, view_seperator, globals_, crops, crop_shapes,
+                                         dtype=torch.float32)
+
+    expected = embed(eager)
+    for attempt in range(2):
+        actual = embed(compiled)
+        assert compiled.compiled, "网格检查时回退到了 eager"
+        max_diff = max((a - b).abs().max().item() for a, b in zip(expected, actual))
+        print(f"grid {crop_shapes} tiles={offsets[-1]} max_batch={max_batch} run {attempt}  max|Δ|={max_diff:.2e}")
+        assert max_diff < 1e-2, "编译路径的图像特征与 eager 不一致（CUDA graph 输出被覆盖？）"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", default="default", choices=["default", "reduce-overhead"])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[256, 512])
+    parser.add_argument("--batches", type=int, nargs="+", default=[1, 3, 5])
+    parser.add_argument("--repeat", type=int, default=2)
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--max-batch", type=int, default=VISION_ENCODER_MAX_BATCH,
+                        help="分块上限（reduce-overhead 预热到该档位）")
+    # 12 个切块按 7 + 5 分块，5 补齐到档位 7，同时覆盖分块与补齐
+    parser.add_argument("--grid-max-batch", type=int, default=7)
+    parser.add_argument("--grid-backend", choices=["inductor", "passthrough"], default=None,
+                        help="网格检查的编译后端（默认 CUDA 上 inductor、CPU 上 passthrough）")
+    parser.add_argument("--skip-grid", action="store_true", help="跳过 1024 + 640 网格检查（CPU 上较慢）")
+    args = parser.parse_args()
+    device = torch.device(args.device)
+
+    torch.manual_seed(0)
+    modules = Dict(
+        sam_model=build_sam_vit_b().eval(),
+        vision_model=build_clip_l().eval(),
+        projector=MlpProjector(Dict(projector_type="linear", input_dim=2048, n_embed=1280)).eval(),
+    )
+    for module in modules.values():
+        module.to(device)
+    eager = VisionEncoderRunner(**modules)
+    compiled = VisionEncoderRunner(**modules, compile_mode=args.mode, max_batch=args.max_batch)
+
+    start = time.perf_counter()
+    compiled.warmup(args.sizes, device=device, dtype=torch.float32)
+    warmup_s = time.perf_counter() - start
+    assert compiled.compiled, "预热时编译失败"
+    print(f"mode={args.mode}  warmup {warmup_s:.1f}s")
+
+    with torch.no_grad():
+        for size in args.sizes:
+            for batch in args.batches:
+                views = torch.randn(batch, 3, size, size, device=device)
+                expected, eager_ms = timed(lambda: eager(views), args.repeat)
+                actual, compiled_ms = timed(lambda: compiled(views), args.repeat)
+                assert compiled.compiled, f"{size}px x{batch}: 执行时回退到了 eager"
+                max_diff = (expected - actual).abs().max().item()
+                print(f"{size}px x{batch}  eager {eager_ms:8.1f} ms  compiled {compiled_ms:8.1f} ms  max|Δ|={max_diff:.2e}")
+                assert max_diff < 1e-2, "编译前后输出不一致"
+
+        broken = VisionEncoderRunner(**modules, compile_mode=args.mode, backend=failing_backend)
+        views = torch.randn(1, 3, args.sizes[0], args.sizes[0], device=device)
+        fallback = broken(views)
+        assert not broken.compiled and torch.equal(fallback, eager(views)), "编译失败时未回退到 eager"
+        print("fallback to eager on compiler failure: ok")
+
+    if not args.skip_grid:
+        grid_backend = args.grid_backend or ("inductor" if device.type == "cuda" else "passthrough")
+        check_grid(modules, args.mode, device, args.grid_max_batch,
+                   backend=passthrough_backend if grid_backend == "passthrough" else grid_backend)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+视觉特征缓存检查
+
+用随机初始化的 SAM / CLIP / projector 在 CPU 上模拟"同一页换提示词多次识别"：
+1. 处理器摘要：同图同模式一致，换模式 / 换图像不同；
+2. 同一页第二次起命中缓存、跳过编码器，输出与不带缓存的编码逐位一致；
+3. 超出字节上限时按 LRU 淘汰；各缓存实例的 vision_cache.<name>.* 指标互不覆盖。
+用法（在 backend 目录下）：python -m benchmarks.vision_embed_cache_check --prompts 3
+"""
+import argparse
+import time
+
+import numpy as np
+import torch
+from addict import Dict
+from PIL import Image
+
+from app.services.metrics import metrics
+from app.vllm_models.deepencoder.build_linear import MlpProjector
+from app.vllm_models.deepencoder.clip_sdpa import build_clip_l
+from app.vllm_models.deepencoder.embedding_cache import VisionEmbeddingCache, read_image_keys
+from app.vllm_models.deepencoder.sam_vary_sdpa import build_sam_vit_b
+from app.vllm_models.deepencoder.view_encoder import (VisionEncoderRunner, pixel_values_to_embedding,
+                                                     read_crop_shapes)
+from app.vllm_models.process.image_process import ImageTransform, build_image_views
+
+
+def preprocess(image, base_size, image_size, cropping):
+    """与 tokenize_with_images 相同的像素输出 + 摘要（uint8 传输）"""
+    digests = []
+    pixel_values, images_crop, crop_ratios = build_image_views(
+        [image], cropping, base_size, image_size, ImageTransform(), uint8_pixels=True, digests=digests)
+    image_digests = torch.from_numpy(np.frombuffer(b"".join(digests), dtype=np.int64).reshape(-1, 2).copy())
+    spatial_crop = torch.tensor([list(ratio) for ratio in crop_ratios], dtype=torch.long)
+    return pixel_values.unsqueeze(1), images_crop, spatial_crop, image_digests
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--prompts", type=int, default=3, help="同一页的识别次数（不同提示词）")
+    parser.add_argument("--base-size", type=int, default=512)
+    parser.add_argument("--image-size", type=int, default=256)
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    rng = np.random.default_rng(0)
+    page = Image.fromarray(rng.integers(0, 256, (1400, 1000, 3), dtype=np.uint8))
+    other = Image.fromarray(rng.integers(0, 256, (1400, 1000, 3), dtype=np.uint8))
+
+    base = preprocess(page, args.base_size, args.image_size, True)
+    same = preprocess(page.copy(), args.base_size, args.image_size, True)
+    no_crop = preprocess(page, args.base_size, args.image_size, False)
+    other_page = preprocess(other, args.base_size, args.image_size, True)
+    assert torch.equal(base[3], same[3]), "同图同模式摘要不一致"
+    assert not torch.equal(base[3], no_crop[3]), "不同模式摘要相同"
+    assert not torch.equal(base[3], other_page[3]), "不同图像摘要相同"
+    print(f"digest ok  grid={tuple(base[2][0].tolist())}")
+
+    model = Dict(
+        sam_model=build_sam_vit_b().eval(),
+        vision_model=build_clip_l().eval(),
+        projector=MlpProjector(Dict(projector_type="linear", input_dim=2048, n_embed=1280)).eval(),
+        image_newline=torch.randn(1280),
+        view_seperator=torch.randn(1280),
+    )
+    encode = VisionEncoderRunner(model.sam_model, model.vision_model, model.projector)
+
+    def embed(inputs, cache):
+        pixel_values, images_crop, spatial_crop, image_digests = inputs
+        crop_shapes = read_crop_shapes(spatial_crop)
+        start = time.perf_counter()
+        features = pixel_values_to_embedding(
+            encode, model.image_newline, model.view_seperator, pixel_values, [images_crop], crop_shapes,
+            dtype=torch.float32, cache=cache, image_keys=read_image_keys(image_digests, len(crop_shapes)),
+        )
+        return features[0], (time.perf_counter() - start) * 1000
+
+    expected, uncached_ms = embed(base, None)
+    entry_bytes = expected.numel() * expected.element_size()
+
+    metrics.reset()
+    cache = VisionEmbeddingCache(max_bytes=64 * entry_bytes, name="vision_cache.model")
+    timings = []
+    for _ in range(args.prompts):
+        features, elapsed_ms = embed(base, cache)
+        assert torch.equal(features, expected), "缓存结果与直接编码不一致"
+        timings.append(elapsed_ms)
+    print(f"uncached {uncached_ms:.0f} ms  per prompt " + "  ".join(f"{ms:.1f}" for ms in timings) + " ms")
+    assert (cache.hits, cache.misses) == (args.prompts - 1, 1)
+
+    # 容量只够一条：换一页后旧条目被淘汰，再回到第一页重新编码
+    small = VisionEmbeddingCache(max_bytes=entry_bytes + entry_bytes // 2, name="vision_cache.stage")
+    for inputs in (base, other_page, base):
+        embed(inputs, small)
+    assert (small.hits, small.misses, small.evictions, len(small)) == (0, 3, 2, 1)
+    assert small.nbytes <= small.max_bytes
+    print(f"eviction ok  entry={entry_bytes / 2**20:.2f} MiB")
+    gauges = metrics.snapshot()["gauges"]
+    assert gauges["vision_cache.model.hit_rate"] == cache.hits / (cache.hits + cache.misses)
+    assert gauges["vision_cache.stage.hit_rate"] == 0
+    assert gauges["vision_cache.stage.entries"] == 1
+    print({name: value for name, value in metrics.snapshot()["counters"].items() if name.startswith("vision_cache")})
+    print({name: value for name, value in metrics.snapshot()["gauges"].items() if name.startswith("vision_cache")})
+
+
+if __name__ == "__main__":
+    main()
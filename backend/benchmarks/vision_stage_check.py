@@ -0,0 +1,128 @@
+"""
+编码 / 解码分离一致性检查
+
+在 CPU 上用随机权重验证：
+1. DeepseekOCRVisionEncoder 从检查点只读取视觉权重（语言模型权重被跳过）；
+2. 并发请求经 VisionEncoderStage 合批编码得到的 image token 特征，与模型内像素路径
+   （pixel_values_to_embedding，对应 DeepseekOCRForCausalLM._process_image_input）的输出一致；
+3. 把两条路径的特征分别合并进同一个随机初始化的小语言模型，贪心解码的 token 完全相同。
+用法（在 backend 目录下）：python -m benchmarks.vision_stage_check --requests 4
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+
+import numpy as np
+import torch
+import torch.nn as nn
+from PIL import Image
+from safetensors.torch import save_file
+
+from app.services.metrics import metrics
+from app.services.vision_stage import VisionEncoderStage
+from app.vllm_models.deepencoder.view_encoder import pixel_values_to_embedding, read_crop_shapes
+from app.vllm_models.process.image_process import ImageTransform, build_image_views
+from app.vllm_models.vision_encoder import DeepseekOCRVisionEncoder
+
+IMAGE_TOKEN_ID = 1
+
+
+class TinyLanguageModel(nn.Module):
+    """随机初始化的小解码器：image token 位置替换为视觉特征（同 merge_multimodal_embeddings）后贪心解码"""
+
+    def __init__(self, vocab_size: int = 64, hidden: int = 1280) -> None:
+        super().__init__()
+        self.embed = nn.Embedding(vocab_size, hidden)
+        self.layer = nn.TransformerEncoderLayer(hidden, nhead=8, dim_feedforward=512, batch_first=True)
+        self.head = nn.Linear(hidden, vocab_size)
+
+    @torch.no_grad()
+    def generate(self, input_ids: torch.Tensor, image_features: torch.Tensor, steps: int = 8) -> list:
+        tokens = input_ids.tolist()
+        for _ in range(steps):
+            ids = torch.tensor(tokens)
+            embeds = self.embed(ids)
+            embeds[ids == IMAGE_TOKEN_ID] = image_features.to(embeds.dtype)
+            hidden = self.layer(embeds[None], is_causal=True,
+                                src_mask=nn.Transformer.generate_square_subsequent_mask(len(tokens)))
+            tokens.append(int(self.head(hidden[0, -1]).argmax()))
+        return tokens[input_ids.numel():]
+
+
+def processor_payload(image, base_size, image_size, cropping):
+    """与 tokenize_with_images 输出中视觉相关的字段相同（uint8 传输）"""
+    digests = []
+    pixel_values, images_crop, crop_ratios = build_image_views(
+        [image], cropping, base_size, image_size, ImageTransform(), uint8_pixels=True, digests=digests)
+    spatial_crop = torch.tensor([list(ratio) for ratio in crop_ratios], dtype=torch.long)
+    image_digests = torch.from_numpy(np.frombuffer(b"".join(digests), dtype=np.int64).reshape(-1, 2).copy())
+    return [[None, pixel_values, images_crop, None, spatial_crop, None, None, None, image_digests]]
+
+
+def pixel_path(encoder, payloads):
+    """模型内像素路径：引擎把同一调度批次的多模态字段按图像堆叠后交给 _process_image_input"""
+    pixel_values = [payload[0][1][:1] for payload in payloads]
+    images_crop = [payload[0][2] for payload in payloads]
+    spatial_crop = torch.cat([payload[0][4] for payload in payloads])
+    return pixel_values_to_embedding(
+        encoder.runner, encoder.image_newline, encoder.view_seperator,
+        pixel_values, images_crop, read_crop_shapes(spatial_crop), dtype=encoder.dtype,
+    )
+
+
+async def stage_path(stage, payloads):
+    results = await asyncio.gather(*(stage.encode(payload) for payload in payloads))
+    return [features[0] for features in results]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=4)
+    parser.add_argument("--base-size", type=int, default=512)
+    parser.add_argument("--image-size", type=int, default=256)
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    source = DeepseekOCRVisionEncoder()
+    with tempfile.TemporaryDirectory() as directory:
+        state = {f"model.{name}": tensor.contiguous() for name, tensor in source.state_dict().items()}
+        state["model.layers.0.mlp.gate_proj.weight"] = torch.randn(8, 8)
+        save_file(state, os.path.join(directory, "model-00001-of-00001.safetensors"))
+        encoder = DeepseekOCRVisionEncoder.from_pretrained(directory, device="cpu", dtype=torch.float32)
+    for name, tensor in source.state_dict().items():
+        assert torch.equal(tensor, encoder.state_dict()[name]), f"权重不一致: {name}"
+    print(f"weights ok  {len(state) - 1} vision tensors loaded, language weights skipped")
+
+    rng = np.random.default_rng(0)
+    sizes = [(1400, 1000), (600, 500), (1000, 1600), (800, 800)]
+    payloads = []
+    for index in range(args.requests):
+        height, width = sizes[index % len(sizes)]
+        image = Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8))
+        payloads.append(processor_payload(image, args.base_size, args.image_size, cropping=index % 3 != 2))
+
+    expected = pixel_path(encoder, payloads)
+
+    metrics.reset()
+    stage = VisionEncoderStage(encoder, max_batch_images=8, max_wait_ms=20)
+    actual = asyncio.run(stage_path(stage, payloads))
+    stage.shutdown()
+    batches = metrics.snapshot()["counters"]["vision_stage.batches"]
+
+    language_model = TinyLanguageModel().eval()
+    max_diff = 0.0
+    for index, (a, b) in enumerate(zip(expected, actual)):
+        assert a.shape == b.shape, f"请求 {index}: 形状不一致 {tuple(a.shape)} != {tuple(b.shape)}"
+        max_diff = max(max_diff, (a - b).abs().max().item())
+        input_ids = torch.tensor([0, 5] + [IMAGE_TOKEN_ID] * a.size(0) + [7, 9])
+        pixel_tokens = language_model.generate(input_ids, a)
+        embed_tokens = language_model.generate(input_ids, b)
+        assert pixel_tokens == embed_tokens, f"请求 {index}: 解码结果不一致 {pixel_tokens} != {embed_tokens}"
+        print(f"request {index}: grid={tuple(payloads[index][0][4][0].tolist())} tokens={a.size(0)} decoded={pixel_tokens}")
+    print(f"requests={args.requests}  stage batches={batches}  max|Δ|={max_diff:.2e}")
+    assert max_diff < 1e-4, "视觉编码阶段输出与像素路径不一致"
+
+
+if __name__ == "__main__":
+    main()
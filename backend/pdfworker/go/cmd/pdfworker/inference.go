@@ -8,11 +8,52 @@ import (
 	"io"
 	"net/http"
 	"os"
+	"strconv"
 	"strings"
 	"sync"
 	"time"
 )
 
+const (
+	maxOverloadRetries   = 30
+	defaultOverloadDelay = 2 * time.Second
+	maxOverloadDelay     = 30 * time.Second
+)
+
+// overloadError 表示推理服务因过载拒绝请求（429/503），可在 retryAfter 后重试
+type overloadError struct {
+	status     int
+	retryAfter time.Duration
+	body       string
+}
+
+func (e *overloadError) Error() string {
+	return fmt.Sprintf("inference overloaded: status %d: %s", e.status, e.body)
+}
+
+func parseRetryAfter(value string) time.Duration {
+	seconds, err := strconv.Atoi(strings.TrimSpace(value))
+	if err != nil || seconds <= 0 {
+		return defaultOverloadDelay
+	}
+	delay := time.Duration(seconds) * time.Second
+	if delay > maxOverloadDelay {
+		return maxOverloadDelay
+	}
+	return delay
+}
+
+func sleepContext(ctx context.Context, d time.Duration) error {
+	timer := time.NewTimer(d)
+	defer timer.Stop()
+	select {
+	case <-ctx.Done():
+		return ctx.Err()
+	case <-timer.C:
+		return nil
+	}
+}
+
 var (
 	httpClientMu          sync.Mutex
 	sharedHTTPClient      *http.Client
@@ -44,8 +85,18 @@ func getHTTPClient(maxConns int) *http.Client {
 
 func runInference(ctx context.Context, cfg Config, imageB64 string) (string, error) {
 	const maxAttempts = 3
+	overloadRetries := 0
 	for attempt := 1; attempt <= maxAttempts; attempt++ {
 		text, err := invokeInference(ctx, cfg, imageB64)
+		if overloaded, ok := err.(*overloadError); ok && overloadRetries < maxOverloadRetries {
+			// 服务端准入控制拒绝：按 Retry-After 退避后重试，不计入空结果重试次数
+			overloadRetries++
+			attempt--
+			if sleepErr := sleepContext(ctx, overloaded.retryAfter); sleepErr != nil {
+				return "", sleepErr
+			}
+			continue
+		}
 		if err != nil {
 			return "", err
 		}
@@ -94,6 +145,14 @@ func invokeInference(ctx context.Context, cfg Config, imageB64 string) (string,
 		return "", err
 	}
 	defer resp.Body.Close()
+	if resp.StatusCode == http.StatusTooManyRequests || resp.StatusCode == http.StatusServiceUnavailable {
+		data, _ := io.ReadAll(io.LimitReader(resp.Body, 1024))
+		return "", &overloadError{
+			status:     resp.StatusCode,
+			retryAfter: parseRetryAfter(resp.Header.Get("Retry-After")),
+			body:       string(data),
+		}
+	}
 	if resp.StatusCode != http.StatusOK {
 		data, _ := io.ReadAll(io.LimitReader(resp.Body, 1024))
 		return "", fmt.Errorf("inference failed: status %d: %s", resp.StatusCode, string(data))